@@ -0,0 +1,282 @@
+# Disk-backed (SQLite) cache of generative answers for the Gemini fallback path.
+# Keys are clean_text-normalized queries; entries expire after a TTL and the least recently
+# used ones are evicted once the entry or byte limits are exceeded. An optional near-duplicate
+# lookup reuses the TF-IDF vectorizer to serve cached answers for paraphrases; while a model reload
+# is in progress, requests pinned to either models version use their own vectorizer, each with its
+# own matrix of cached keys (the MAX_NEAR_MATRICES most recently used are kept).
+# Async code uses aget/aput, which run the SQLite work in a worker thread. Hits only touch the LRU
+# order in memory; the touches are written in one statement every TOUCH_BATCH hits or
+# TOUCH_INTERVAL seconds (and before any eviction, which needs them).
+
+import asyncio
+import logging
+from collections import OrderedDict
+import os
+import sqlite3
+import threading
+import time
+import scipy.sparse as sp
+from backend.app.utils import clean_text
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_answers_last_access ON answers (last_access);
+CREATE INDEX IF NOT EXISTS ix_answers_created_at ON answers (created_at);
+"""
+
+TOUCH_BATCH = 100
+TOUCH_INTERVAL = 5.0
+# expired entries are purged at most this often (lookups still never serve them)
+PURGE_INTERVAL = 60.0
+# eviction goes down to this share of the limits, so a full cache does not evict on every store
+EVICT_TO = 0.9
+MAX_NEAR_MATRICES = 2
+
+
+def normalize_query(text):
+    """Cache key for a query: clean_text with collapsed whitespace."""
+    return " ".join(clean_text(text).split())
+
+
+class AnswerCache:
+    """SQLite answer cache with TTL, LRU eviction, size limits and optional near-duplicate lookup."""
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_entries=10000, max_bytes=50 * 1024 * 1024,
+                 vectorize=None, near_duplicate_similarity=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # vectorize(texts) -> L2-normalized sparse rows; required for near-duplicate lookups
+        # (the default for lookups that do not pass their own)
+        self.vectorize = vectorize
+        self.near_duplicate_similarity = near_duplicate_similarity
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # vectorize -> [cached keys, their vectors], built lazily per vectorizer
+        self._near = OrderedDict()
+        # key -> (last access, hits since the last flush) not written yet
+        self._pending_touches = {}
+        self._last_touch_flush = time.monotonic()
+        self._last_purge = 0.0
+        self._entries, self._bytes = self._count()
+        self.hits = 0
+        self.near_duplicate_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def get(self, query, vectorize=None):
+        """Returns the cached answer for the query (or a close paraphrase), or None. Paraphrases are
+        matched with vectorize (default: the cache's vectorizer)."""
+        key = normalize_query(query)
+        if not key:
+            return None
+        with self._lock:
+            answer = self._get_exact(key)
+            if answer is not None:
+                self.hits += 1
+                return answer
+            answer = self._get_near_duplicate(key, vectorize or self.vectorize)
+            if answer is not None:
+                self.near_duplicate_hits += 1
+                return answer
+            self.misses += 1
+            return None
+
+    async def aget(self, query, vectorize=None):
+        """get() in a worker thread, for the event loop."""
+        return await asyncio.to_thread(self.get, query, vectorize)
+
+    async def aput(self, query, answer):
+        """put() in a worker thread, for the event loop."""
+        await asyncio.to_thread(self.put, query, answer)
+
+    def put(self, query, answer):
+        """Stores an answer and evicts expired and least recently used entries beyond the limits."""
+        key = normalize_query(query)
+        if not key or not answer:
+            return
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT LENGTH(answer) FROM answers WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, created_at, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+                (key, answer, now, now),
+            )
+            self._pending_touches.pop(key, None)
+            if previous is None:
+                self._entries += 1
+                self._bytes += len(answer)
+            else:
+                self._bytes += len(answer) - previous[0]
+            self.stores += 1
+            self._evict(now)
+            self._conn.commit()
+            if previous is None:
+                for vectorize, near in self._near.items():
+                    near[0].append(key)
+                    vector = vectorize([key])
+                    near[1] = sp.vstack([near[1], vector], format="csr") if near[1] is not None else vector
+
+    def set_vectorize(self, vectorize):
+        """Switches the default near-duplicate vectorizer; matrices built for others stay until unused."""
+        with self._lock:
+            self.vectorize = vectorize
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._pending_touches.clear()
+            self._entries, self._bytes = 0, 0
+            self._near.clear()
+
+    def stats(self):
+        """Returns hit/miss counters; every hit is a Gemini call saved."""
+        with self._lock:
+            entries, size = self._entries, self._bytes
+        lookups = self.hits + self.near_duplicate_hits + self.misses
+        saved = self.hits + self.near_duplicate_hits
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_duplicate_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "gemini_calls_saved": saved,
+            "hit_rate": saved / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(answer)), 0) FROM answers").fetchone()
+
+    def _get_exact(self, key):
+        row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        answer, created_at = row
+        now = time.time()
+        if now - created_at > self.ttl_seconds:
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._conn.commit()
+            self._pending_touches.pop(key, None)
+            self._entries -= 1
+            self._bytes -= len(answer)
+            self._forget_near({key})
+            return None
+        _, hits = self._pending_touches.get(key, (now, 0))
+        self._pending_touches[key] = (now, hits + 1)
+        if len(self._pending_touches) >= TOUCH_BATCH or time.monotonic() - self._last_touch_flush >= TOUCH_INTERVAL:
+            self._flush_touches()
+            self._conn.commit()
+        return answer
+
+    def _flush_touches(self):
+        """Writes the pending LRU touches (in the caller's transaction)."""
+        if self._pending_touches:
+            self._conn.executemany("UPDATE answers SET last_access = ?, hits = hits + ? WHERE key = ?",
+                                   [(last_access, hits, key) for key, (last_access, hits) in self._pending_touches.items()])
+            self._pending_touches.clear()
+        self._last_touch_flush = time.monotonic()
+
+    def _get_near_duplicate(self, key, vectorize):
+        if vectorize is None or not self.near_duplicate_similarity:
+            return None
+        near = self._near.get(vectorize)
+        if near is None:
+            keys = [row[0] for row in self._conn.execute("SELECT key FROM answers")]
+            near = self._near[vectorize] = [keys, vectorize(keys) if keys else None]
+            while len(self._near) > MAX_NEAR_MATRICES:
+                self._near.popitem(last=False)
+        self._near.move_to_end(vectorize)
+        near_keys, near_matrix = near
+        if not near_keys:
+            return None
+        similarities = (near_matrix @ vectorize([key]).T).toarray().ravel()
+        best = int(similarities.argmax())
+        if similarities[best] < self.near_duplicate_similarity:
+            return None
+        logging.debug(f"Answer cache near-duplicate hit: '{key}' ~ '{near_keys[best]}' ({similarities[best]:.2f})")
+        return self._get_exact(near_keys[best])
+
+    def _forget_near(self, keys):
+        """Drops keys from the near-duplicate matrices (no re-vectorizing of the others)."""
+        if not keys:
+            return
+        for near in self._near.values():
+            keep = [position for position, key in enumerate(near[0]) if key not in keys]
+            near[0] = [near[0][position] for position in keep]
+            near[1] = near[1][keep] if keep else None
+
+    def _evict(self, now):
+        evicted = set()
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self._last_purge = now
+            evicted.update(row[0] for row in self._conn.execute(
+                "SELECT key FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)))
+            if evicted:
+                self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._entries, self._bytes = self._count()
+        if self._entries > self.max_entries or self._bytes > self.max_bytes:
+            # the LRU order must include the hits not written yet
+            self._flush_touches()
+            max_entries, max_bytes = int(self.max_entries * EVICT_TO), int(self.max_bytes * EVICT_TO)
+            # walk from least recently used, dropping entries until both (lowered) limits hold
+            to_delete = []
+            for key, length in self._conn.execute("SELECT key, LENGTH(answer) FROM answers ORDER BY last_access"):
+                if self._entries <= max_entries and self._bytes <= max_bytes:
+                    break
+                to_delete.append(key)
+                self._entries -= 1
+                self._bytes -= length
+            self._conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in to_delete])
+            evicted.update(to_delete)
+        if evicted:
+            self.evictions += len(evicted)
+            self._forget_near(evicted)
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_answer_cache(vectorize=None):
+    """Returns the process-wide answer cache configured from the environment, or None when disabled."""
+    global _shared_cache
+    if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() not in ("true", "1", "yes"):
+        return None
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                similarity = os.getenv("ANSWER_CACHE_NEAR_DUPLICATE_SIMILARITY", "0.9")
+                _shared_cache = AnswerCache(
+                    os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3"),
+                    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+                    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000")),
+                    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+                    vectorize=vectorize,
+                    near_duplicate_similarity=float(similarity) if similarity else None,
+                )
+    return _shared_cache
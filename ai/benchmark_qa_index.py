@@ -0,0 +1,96 @@
+# Benchmarks recall@k against latency of the approximate Q&A indexes (IVF-Flat, HNSW) versus the exact flat index.
+# Usage: python -m backend.ai.benchmark_qa_index --sizes 10000 100000 --k 5
+#        python -m backend.ai.benchmark_qa_index --index sha_index.faiss   (the real dataset vectors)
+
+import argparse
+import logging
+import time
+import faiss
+import numpy as np
+from backend.ai.qa_index import build_index, normalize_rows, set_search_params
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def generate_vectors(num_vectors, dim, rng, num_clusters=None):
+    """Unit vectors scattered around random centres, like embeddings of questions on a few topics."""
+    num_clusters = num_clusters or max(1, num_vectors // 100)
+    centres = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, num_clusters, size=num_vectors)]
+    vectors += 0.5 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def generate_queries(vectors, num_queries, rng, noise=0.3):
+    """Paraphrase-like queries: dataset vectors plus noise."""
+    picked = vectors[rng.integers(0, len(vectors), size=num_queries)]
+    return normalize_rows(picked + noise * rng.standard_normal(picked.shape).astype(np.float32) / np.sqrt(vectors.shape[1]))
+
+
+def time_search(index, queries, k):
+    """Searches one query at a time (as the API does); returns per-query latencies (ms) and result ids."""
+    latencies = np.empty(len(queries))
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids[i] = index.search(queries[i:i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+    return latencies, ids
+
+
+def recall_at_k(expected, actual):
+    """Fraction of the exact top-k neighbours found by the approximate search."""
+    k = expected.shape[1]
+    return float(np.mean([len(set(e) & set(a)) / k for e, a in zip(expected, actual)]))
+
+
+def report(name, latencies, recall):
+    print(f"{name:>22}: recall {recall:.3f}  mean {latencies.mean():.3f}ms  p50 {np.percentile(latencies, 50):.3f}ms  "
+          f"p99 {np.percentile(latencies, 99):.3f}ms")
+
+
+def run_benchmark(vectors, queries, k, nprobes, ef_searches, hnsw_m):
+    print(f"\n== {len(vectors)} vectors, {vectors.shape[1]} dims, {len(queries)} queries, recall@{k} ==")
+    flat = build_index(vectors, "flat")
+    flat_ms, expected = time_search(flat, queries, k)
+    report("flat (exact)", flat_ms, 1.0)
+
+    start = time.perf_counter()
+    ivf = build_index(vectors, "ivf")
+    print(f"IVF-Flat: {ivf.nlist} lists, built in {time.perf_counter() - start:.2f}s")
+    for nprobe in nprobes:
+        set_search_params(ivf, nprobe=nprobe)
+        latencies, ids = time_search(ivf, queries, k)
+        report(f"ivf nprobe={nprobe}", latencies, recall_at_k(expected, ids))
+
+    start = time.perf_counter()
+    hnsw = build_index(vectors, "hnsw", hnsw_m=hnsw_m)
+    print(f"HNSW: M={hnsw_m}, built in {time.perf_counter() - start:.2f}s")
+    for ef_search in ef_searches:
+        set_search_params(hnsw, ef_search=ef_search)
+        latencies, ids = time_search(hnsw, queries, k)
+        report(f"hnsw efSearch={ef_search}", latencies, recall_at_k(expected, ids))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k versus latency of the FAISS Q&A index kinds.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--index", default=None, help="benchmark on the vectors of an existing index instead")
+    parser.add_argument("--dim", type=int, default=768, help="dimensions of synthetic vectors (embedding-001: 768)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.index:
+        existing = faiss.read_index(args.index)
+        datasets = [normalize_rows(existing.reconstruct_n(0, existing.ntotal))]
+    else:
+        datasets = (generate_vectors(size, args.dim, rng) for size in args.sizes)
+    for vectors in datasets:
+        run_benchmark(vectors, generate_queries(vectors, args.queries, rng), args.k, args.nprobe, args.ef_search, args.hnsw_m)
@@ -0,0 +1,147 @@
+# Benchmarks the exhaustive corpus-matrix scorer against the inverted-index scorer on synthetic corpora.
+# Usage: python -m backend.ai.benchmark_retrieval --sizes 10000 100000 1000000
+# Dense reranking: python -m backend.ai.benchmark_retrieval --sizes 100000 --rerank 20
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from backend.ai.corpus_index import CorpusIndex
+from backend.ai.inverted_index import InvertedIndex
+from backend.ai.sentence_embeddings import build_sentence_embeddings, open_sentence_embeddings
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def generate_corpus(num_sentences, vocabulary_size, rng, min_len=5, max_len=20):
+    """Generates sentences with Zipf-distributed word frequencies, like natural text."""
+    ranks = np.arange(1, vocabulary_size + 1)
+    probabilities = (1.0 / ranks) / np.sum(1.0 / ranks)
+    lengths = rng.integers(min_len, max_len + 1, size=num_sentences)
+    words = rng.choice(vocabulary_size, size=int(lengths.sum()), p=probabilities)
+    sentences = []
+    offset = 0
+    for length in lengths:
+        sentences.append(" ".join(f"term{w}" for w in words[offset:offset + length]))
+        offset += length
+    return sentences
+
+
+def generate_queries(sentences, num_queries, rng):
+    """Builds queries from a few words of random corpus sentences."""
+    queries = []
+    for idx in rng.integers(0, len(sentences), size=num_queries):
+        words = sentences[idx].split()
+        size = int(rng.integers(2, min(6, len(words)) + 1))
+        queries.append(" ".join(rng.choice(words, size=size, replace=False)))
+    return queries
+
+
+def time_queries(scorer, queries, k):
+    """Runs every query through the scorer and returns per-query latencies (ms) and results."""
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(scorer(query, k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), results
+
+
+def same_answer(expected, actual, tolerance=1e-9):
+    """Two top-k results agree when their scores match (ties may be ordered differently)."""
+    expected_scores = expected[1][expected[1] > 0]
+    actual_scores = actual[1][:expected_scores.size]
+    return expected_scores.size == actual_scores.size and np.allclose(expected_scores, actual_scores, atol=tolerance)
+
+
+def run_benchmark(size, vocabulary_size, num_queries, k, min_idf, seed):
+    rng = np.random.default_rng(seed)
+    sentences = generate_corpus(size, vocabulary_size, rng)
+    queries = generate_queries(sentences, num_queries, rng)
+
+    vectorizer = TfidfVectorizer().fit(sentences)
+    corpus_index = CorpusIndex(sentences, vectorizer)
+    inverted_index = InvertedIndex(corpus_index, min_idf=min_idf)
+
+    exhaustive_ms, exhaustive_results = time_queries(corpus_index.top_k, queries, k)
+    inverted_ms, inverted_results = time_queries(inverted_index.top_k, queries, k)
+    agreement = np.mean([same_answer(e, a) for e, a in zip(exhaustive_results, inverted_results)])
+    touched = inverted_index.stats()["avg_postings_touched"]
+
+    print(f"\n== {size} sentences, {len(vectorizer.vocabulary_)} terms, {num_queries} queries, k={k} ==")
+    print(f"build: corpus matrix {corpus_index.build_time:.2f}s, inverted index {inverted_index.build_time:.2f}s")
+    for name, latencies in (("exhaustive", exhaustive_ms), ("inverted", inverted_ms)):
+        print(f"{name:>10}: mean {latencies.mean():.3f}ms  p50 {np.percentile(latencies, 50):.3f}ms  p99 {np.percentile(latencies, 99):.3f}ms")
+    print(f"speedup (mean): {exhaustive_ms.mean() / inverted_ms.mean():.1f}x")
+    print(f"postings touched per query: {touched:.0f} of {size} sentences")
+    print(f"same answers: {agreement * 100:.2f}%")
+
+
+def run_rerank_benchmark(size, vocabulary_size, num_queries, top_n, seed):
+    """TF-IDF top-1 against TF-IDF top-N reranked with memory-mapped sentence embeddings
+    (and, for scale, scoring every sentence densely)."""
+    from gensim.models import Word2Vec
+
+    rng = np.random.default_rng(seed)
+    sentences = generate_corpus(size, vocabulary_size, rng)
+    queries = generate_queries(sentences, num_queries, rng)
+    corpus_index = CorpusIndex(sentences, TfidfVectorizer().fit(sentences))
+
+    start = time.perf_counter()
+    word2vec = Word2Vec([sentence.split() for sentence in sentences], vector_size=100, min_count=1,
+                        workers=os.cpu_count() or 1, epochs=3, seed=seed).wv
+    train_time = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "sentence_embeddings.npy")
+        start = time.perf_counter()
+        build_sentence_embeddings(sentences, word2vec, file_path)
+        build_time = time.perf_counter() - start
+        reranker = open_sentence_embeddings(file_path, word2vec)
+
+        def tfidf_only(query, k):
+            return corpus_index.top_k(query, k)
+
+        def reranked(query, k):
+            candidates, scores = corpus_index.top_k(query, top_n)
+            return reranker.rerank(query, candidates, scores)
+
+        def dense_full_scan(query, k):
+            similarities = reranker.matrix @ reranker.embedder.embed([query])[0]
+            return int(similarities.argmax())
+
+        tfidf_ms, tfidf_results = time_queries(tfidf_only, queries, 1)
+        rerank_ms, rerank_results = time_queries(reranked, queries, 1)
+        dense_ms, _ = time_queries(dense_full_scan, queries, 1)
+        changed = np.mean([t[0][:1].tolist() != r[0][:1].tolist() for t, r in zip(tfidf_results, rerank_results)])
+        del reranker
+
+    print(f"\n== rerank: {size} sentences, top-{top_n} candidates, {num_queries} queries ==")
+    print(f"build: word2vec {train_time:.2f}s, sentence embeddings {build_time:.2f}s")
+    for name, latencies in (("tfidf", tfidf_ms), ("reranked", rerank_ms), ("dense scan", dense_ms)):
+        print(f"{name:>10}: mean {latencies.mean():.3f}ms  p50 {np.percentile(latencies, 50):.3f}ms  p99 {np.percentile(latencies, 99):.3f}ms")
+    print(f"rerank overhead (mean): {rerank_ms.mean() - tfidf_ms.mean():.3f}ms")
+    print(f"top answer changed by reranking: {changed * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare exhaustive and inverted-index TF-IDF retrieval.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--min-idf", type=float, default=None, help="drop query terms below this IDF (approximate)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rerank", type=int, default=None, metavar="N",
+                        help="instead, benchmark reranking TF-IDF's top N with Word2Vec sentence embeddings")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        if args.rerank:
+            run_rerank_benchmark(size, args.vocabulary, args.queries, args.rerank, args.seed)
+        else:
+            run_benchmark(size, args.vocabulary, args.queries, args.k, args.min_idf, args.seed)
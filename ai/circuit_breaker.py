@@ -0,0 +1,85 @@
+# Circuit breaker for an upstream dependency (Gemini). After failure_threshold consecutive failed
+# calls it opens and rejects calls immediately, so requests fail fast to a degraded answer instead
+# of waiting on a struggling upstream. After reset_timeout seconds one probe call is let through
+# (half-open): its success closes the breaker, its failure opens it again.
+
+import logging
+import threading
+import time
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    def __init__(self, name="gemini", failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.transitions = {OPEN: 0, HALF_OPEN: 0, CLOSED: 0}
+        self.last_transition = None
+
+    def allow(self):
+        """Whether a call may go upstream now; counts it as rejected otherwise."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def release(self):
+        """A call let through ended without an outcome (e.g. cancelled): lets another probe through."""
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state):
+        log = logging.warning if state == OPEN else logging.info
+        log(f"Circuit breaker '{self.name}' {self.state} -> {state} "
+            f"(consecutive failures: {self.consecutive_failures})")
+        self.state = state
+        self.transitions[state] += 1
+        self.last_transition = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "rejected": self.rejected,
+                "transitions": dict(self.transitions),
+                "last_transition": self.last_transition,
+            }
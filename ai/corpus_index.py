@@ -0,0 +1,195 @@
+# Shared corpus index: the L2-normalized TF-IDF matrix of all sentence tokens, built once and reused by every query.
+
+import pickle
+import logging
+import configparser
+import os
+import threading
+import time
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+from backend.ai.mmap_index import open_retrieval_index, retrieval_index_path
+from backend.ai.model_registry import get_model_registry
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+sentence_tokens_path = os.path.join(models_dir, "sentence_tokens.pkl")
+vectorizer_path = os.path.join(models_dir, "tfidf_vectorizer.pkl")
+corpus_matrix_path = config.get('paths', 'corpus_matrix_file', fallback=os.path.join(models_dir, "corpus_tfidf.npz"))
+
+
+class CorpusIndex:
+    """Precomputed corpus TF-IDF matrix; a query costs one sparse mat-vec plus a top-k selection."""
+
+    def __init__(self, sentence_tokens, vectorizer, matrix=None, normalized=False):
+        self.sentence_tokens = sentence_tokens
+        self.vectorizer = vectorizer
+        self.build_time = 0.0
+        if matrix is None:
+            start = time.perf_counter()
+            matrix = vectorizer.transform(sentence_tokens)
+            self.build_time = time.perf_counter() - start
+            logging.info(f"Corpus TF-IDF matrix built for {len(sentence_tokens)} sentences in {self.build_time:.3f}s")
+        # rows are L2-normalized so a dot product with a normalized query is the cosine similarity;
+        # an already normalized matrix (e.g. read-only memory-mapped) is used as is
+        self.matrix = matrix if normalized else normalize(sp.csr_matrix(matrix), norm="l2", copy=False)
+        self._stats_lock = threading.Lock()
+        self.query_count = 0
+        self.total_query_time = 0.0
+        self.last_query_time = 0.0
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def transform_query(self, texts):
+        """Vectorizes query texts into L2-normalized TF-IDF rows."""
+        return normalize(self.vectorizer.transform(texts), norm="l2", copy=False)
+
+    def scores(self, text):
+        """Returns the cosine similarity of the text against every corpus sentence."""
+        start = time.perf_counter()
+        query = self.transform_query([text])
+        similarities = (self.matrix @ query.T).toarray().ravel()
+        self._record_query(time.perf_counter() - start)
+        return similarities
+
+    def top_k(self, text, k=1):
+        """Returns the indices and scores of the k most similar sentences, best first."""
+        similarities = self.scores(text)
+        return select_top_k(similarities, k)
+
+    def best_match(self, text):
+        """Returns (index, score) of the most similar sentence, or (None, 0.0) for an empty corpus."""
+        if not len(self):
+            return None, 0.0
+        similarities = self.scores(text)
+        best_idx = int(similarities.argmax())
+        return best_idx, float(similarities[best_idx])
+
+    def best_matches(self, texts):
+        """Scores a batch of texts with one query-matrix x corpus-matrix product; returns (indices, scores) per text."""
+        if not len(self) or not texts:
+            return np.full(len(texts), -1, dtype=np.int64), np.zeros(len(texts))
+        start = time.perf_counter()
+        queries = self.transform_query(texts)
+        similarities = (queries @ self.matrix.T).tocsr()
+        similarities.sort_indices()
+        best_indices = np.asarray(similarities.argmax(axis=1)).ravel()
+        best_scores = similarities.max(axis=1).toarray().ravel()
+        self._record_query(time.perf_counter() - start, batch_size=len(texts))
+        return best_indices, best_scores
+
+    def stats(self):
+        """Returns build time and per-query scoring time."""
+        with self._stats_lock:
+            avg = self.total_query_time / self.query_count if self.query_count else 0.0
+            return {
+                "sentences": len(self),
+                "vocabulary_size": self.matrix.shape[1],
+                "build_time_s": self.build_time,
+                "queries": self.query_count,
+                "avg_query_ms": avg * 1000,
+                "last_query_ms": self.last_query_time * 1000,
+            }
+
+    def save(self, file_path):
+        """Saves the corpus matrix to a compressed .npz file."""
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            sp.save_npz(file_path, self.matrix)
+            logging.info(f"Corpus TF-IDF matrix saved successfully to: {file_path}")
+        except IOError as e:
+            logging.error(f"Error saving corpus TF-IDF matrix: {e}")
+
+    @classmethod
+    def load(cls, sentence_tokens, vectorizer, file_path):
+        """Loads a saved corpus matrix, rebuilding it when missing or stale."""
+        matrix = None
+        if os.path.exists(file_path):
+            try:
+                start = time.perf_counter()
+                matrix = sp.load_npz(file_path)
+                expected_shape = (len(sentence_tokens), len(vectorizer.vocabulary_))
+                if matrix.shape != expected_shape:
+                    logging.warning(f"Corpus matrix at {file_path} has shape {matrix.shape}, expected {expected_shape}; rebuilding.")
+                    matrix = None
+                else:
+                    logging.info(f"Corpus TF-IDF matrix loaded from: {file_path} in {time.perf_counter() - start:.3f}s")
+            except (IOError, ValueError) as e:
+                logging.error(f"Error loading corpus TF-IDF matrix: {e}")
+                matrix = None
+        index = cls(sentence_tokens, vectorizer, matrix=matrix)
+        if matrix is None:
+            index.save(file_path)
+        return index
+
+    def _record_query(self, elapsed, batch_size=1):
+        with self._stats_lock:
+            self.query_count += batch_size
+            self.total_query_time += elapsed
+            self.last_query_time = elapsed / batch_size
+        logging.debug(f"Corpus index scored {batch_size} query(ies) in {elapsed * 1000:.2f}ms")
+
+
+def select_top_k(similarities, k):
+    """Returns the indices and scores of the k largest similarities, best first."""
+    k = min(k, similarities.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=similarities.dtype)
+    kth_score = -np.partition(-similarities, k - 1)[k - 1]
+    above = np.flatnonzero(similarities > kth_score)
+    # among sentences tied at the cut-off, keep the lowest indices (matches argmax)
+    ties = np.flatnonzero(similarities == kth_score)[:k - above.size]
+    candidates = np.concatenate([above, ties])
+    # best score first, lowest sentence index first among equal scores
+    order = np.lexsort((candidates, -similarities[candidates]))
+    top = candidates[order]
+    return top, similarities[top]
+
+
+def _load_pickle(file_path, description):
+    try:
+        with open(file_path, "rb") as f:
+            obj = pickle.load(f)
+        logging.info(f"{description} loaded from: {file_path}")
+        return obj
+    except FileNotFoundError:
+        logging.error(f"Error: {description} file not found at {file_path}")
+    except Exception as e:
+        logging.error(f"Error loading {description}: {e}")
+    return None
+
+
+def load_corpus_index():
+    """Maps the retrieval index file when present, else loads the pickled sentence tokens and vectorizer
+    and the saved corpus matrix. None if the models are missing."""
+    mapped = get_model_registry().get("retrieval_index_file")
+    if mapped is not None:
+        return CorpusIndex(mapped.sentences, mapped.vectorizer, mapped.matrix, normalized=True)
+    registry = get_model_registry()
+    sentence_tokens = _load_pickle(registry.artifact_path(sentence_tokens_path), "Sentence tokens")
+    vectorizer = _load_pickle(registry.artifact_path(vectorizer_path), "TF-IDF vectorizer")
+    if not sentence_tokens or vectorizer is None:
+        return None
+    return CorpusIndex.load(sentence_tokens, vectorizer, registry.artifact_path(corpus_matrix_path))
+
+
+def load_retrieval_index_file():
+    """Maps the retrieval index file of the active models version. None if it does not exist."""
+    return open_retrieval_index(get_model_registry().artifact_path(retrieval_index_path))
+
+
+# optional: without it the pickled models are loaded instead
+get_model_registry().register("retrieval_index_file", load_retrieval_index_file, required=False)
+get_model_registry().register("corpus_index", load_corpus_index)
+
+
+def get_corpus_index():
+    """Returns the process-wide corpus index, loading it on first use. None if the models are missing."""
+    return get_model_registry().get("corpus_index")
@@ -0,0 +1,313 @@
+# Embedding job for the Q&A dataset: reads the CSV in chunks, embeds the questions in batches with
+# bounded concurrency and retries, and builds the FAISS index served by ai/qa_index.
+# Every embedding goes through an on-disk cache keyed by a hash of the embedding model and the text,
+# so unchanged questions are never re-embedded. Progress is checkpointed after every chunk; a
+# crashed or interrupted run picks up at the last completed chunk.
+# Run: python -m backend.ai.embedding_job --csv sha_dataset.csv --kind hnsw
+# Offline: python -m backend.ai.embedding_job --csv sha_dataset.csv --embedder fake --fake-latency 0.05
+
+import argparse
+import configparser
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from backend.ai.qa_index import (HashingEmbedder, GoogleEmbedder, build_index, qa_index_path, qa_mapping_path,
+                                 save_qa_index, INDEX_KINDS)
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+embedding_cache_path = config.get('paths', 'embedding_cache_file', fallback=os.path.join(models_dir, "embedding_cache.sqlite3"))
+embedding_job_dir = config.get('paths', 'embedding_job_dir', fallback=os.path.join(models_dir, "embedding_job"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL
+);
+"""
+
+
+class EmbeddingError(Exception):
+    """A batch could not be embedded, even after retries."""
+
+
+class FakeEmbedder:
+    """Offline stand-in for the embedding API: the local hashing embedder plus configurable
+    latency and failure rate, to exercise batching, concurrency and retries."""
+
+    def __init__(self, dim=256, latency=0.0, failure_rate=0.0):
+        self._embedder = HashingEmbedder(dim)
+        self.dim = dim
+        self.name = f"fake-{dim}"
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise EmbeddingError("Fake embedding failure")
+        return self._embedder.embed(texts)
+
+
+def embedding_key(model, text):
+    """Cache key: SHA-256 of the embedding model name and the text."""
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 embeddings keyed by embedding_key."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get_many(self, keys, dim):
+        """Returns {key: vector} for the cached keys of the expected dimension."""
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # stay below SQLite's bound-parameter limit
+            for offset in range(0, len(keys), 500):
+                batch = keys[offset:offset + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+                for key, row_dim, vector in rows:
+                    if row_dim == dim:
+                        found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)",
+                [(key, int(vector.size), np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingJob:
+    """Embeds the questions of a Q&A CSV into <work_dir>/vectors.f32 and records.jsonl, resumably."""
+
+    def __init__(self, csv_path, embedder, cache, work_dir, chunk_size=1000, batch_size=100, max_concurrency=4,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0):
+        self.csv_path = csv_path
+        self.embedder = embedder
+        self.cache = cache
+        self.work_dir = work_dir
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.vectors_path = os.path.join(work_dir, "vectors.f32")
+        self.records_path = os.path.join(work_dir, "records.jsonl")
+        self.checkpoint_path = os.path.join(work_dir, "checkpoint.json")
+        self._stats_lock = threading.Lock()
+        self.rows = 0
+        self.cache_hits = 0
+        self.embedded = 0
+        self.batches = 0
+        self.retries = 0
+
+    def run(self):
+        """Processes the CSV from the last checkpoint on; returns the job stats."""
+        start = time.perf_counter()
+        os.makedirs(self.work_dir, exist_ok=True)
+        checkpoint = self._resume()
+        self.rows = checkpoint["rows"]
+        if self.rows:
+            logging.info(f"Resuming embedding job at row {self.rows} of {self.csv_path}")
+        reader = pd.read_csv(self.csv_path, usecols=["ID", "Question", "Answer"], chunksize=self.chunk_size,
+                             skiprows=range(1, self.rows + 1))
+        with open(self.vectors_path, "ab") as vectors_file, open(self.records_path, "ab") as records_file:
+            for chunk in reader:
+                if chunk.empty:
+                    continue
+                vectors = self.embed_texts(chunk["Question"].astype(str).tolist())
+                vectors_file.write(vectors.tobytes())
+                records_file.write((chunk.to_json(orient="records", lines=True).rstrip("\n") + "\n").encode("utf-8"))
+                vectors_file.flush()
+                records_file.flush()
+                os.fsync(vectors_file.fileno())
+                os.fsync(records_file.fileno())
+                self.rows += len(chunk)
+                self._write_checkpoint(records_file.tell())
+                logging.info(f"Embedded {self.rows} rows ({self.cache_hits} cached, {self.embedded} new)")
+        stats = self.stats()
+        stats["elapsed_s"] = time.perf_counter() - start
+        return stats
+
+    def embed_texts(self, texts):
+        """Embeddings of the texts in order: cached ones from disk, the others in batches."""
+        keys = [embedding_key(self.embedder.name, text) for text in texts]
+        found = self.cache.get_many(set(keys), self.embedder.dim)
+        self.cache_hits += sum(key in found for key in keys)
+        # each distinct missing text is embedded once, even when repeated within the chunk
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        missing_keys = list(missing)
+        batches = [missing_keys[i:i + self.batch_size] for i in range(0, len(missing_keys), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append((batch, executor.submit(self._embed_batch, [missing[key] for key in batch])))
+                # bounded in flight: never more batches queued than workers
+                if len(pending) >= self.max_concurrency:
+                    self._store(found, *self._result(pending.popleft()))
+            while pending:
+                self._store(found, *self._result(pending.popleft()))
+        return np.vstack([found[key] for key in keys]).astype(np.float32) if keys else np.empty((0, self.embedder.dim), np.float32)
+
+    def stats(self):
+        return {
+            "rows": self.rows,
+            "cache_hits": self.cache_hits,
+            "embedded": self.embedded,
+            "batches": self.batches,
+            "retries": self.retries,
+        }
+
+    def load_output(self):
+        """The embedded vectors (memory-mapped) and the records, in CSV order."""
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.embedder.dim)
+        with open(self.records_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        return vectors, records
+
+    @staticmethod
+    def _result(item):
+        batch, future = item
+        return batch, future.result()
+
+    def _store(self, found, batch, vectors):
+        self.cache.put_many(zip(batch, vectors))
+        found.update(zip(batch, vectors))
+        self.embedded += len(batch)
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = np.asarray(self.embedder.embed(texts), dtype=np.float32)
+                if vectors.shape != (len(texts), self.embedder.dim):
+                    raise EmbeddingError(f"Expected {len(texts)} x {self.embedder.dim} embeddings, got {vectors.shape}")
+                with self._stats_lock:
+                    self.batches += 1
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise EmbeddingError(f"Embedding batch failed after {attempt + 1} attempts: {e}") from e
+                with self._stats_lock:
+                    self.retries += 1
+                # full jitter, as for the Gemini client
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                logging.warning(f"Embedding batch failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _source_signature(self):
+        stat = os.stat(self.csv_path)
+        return {"csv": os.path.abspath(self.csv_path), "size": stat.st_size, "mtime": stat.st_mtime,
+                "model": self.embedder.name, "dim": self.embedder.dim}
+
+    def _resume(self):
+        """Loads the checkpoint and truncates the outputs to it; starts over when the CSV or the model changed."""
+        checkpoint = None
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("source") != self._source_signature():
+                logging.info("CSV or embedding model changed since the last run; starting over (the cache still applies).")
+                checkpoint = None
+        if checkpoint is None:
+            checkpoint = {"rows": 0, "records_bytes": 0}
+        # drop whatever a crashed run wrote after its last checkpoint
+        for path, size in ((self.vectors_path, checkpoint["rows"] * self.embedder.dim * 4),
+                           (self.records_path, checkpoint["records_bytes"])):
+            with open(path, "ab") as f:
+                f.truncate(size)
+        return checkpoint
+
+    def _write_checkpoint(self, records_bytes):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"source": self._source_signature(), "rows": self.rows, "records_bytes": records_bytes}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+def create_job_embedder(kind, dim=256, fake_latency=0.0, fake_failure_rate=0.0):
+    if kind == "fake":
+        return FakeEmbedder(dim, latency=fake_latency, failure_rate=fake_failure_rate)
+    if kind == "local":
+        return HashingEmbedder(dim)
+    return GoogleEmbedder(model=os.getenv("QA_EMBEDDING_MODEL", "models/embedding-001"),
+                          api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
+
+
+def run_embedding_job(csv_path, embedder, kind="hnsw", index_path=qa_index_path, mapping_path=qa_mapping_path,
+                      cache_path=embedding_cache_path, work_dir=embedding_job_dir, **job_options):
+    """Embeds the dataset (resuming a previous run) and writes the FAISS index and mapping."""
+    cache = EmbeddingCache(cache_path)
+    try:
+        job = EmbeddingJob(csv_path, embedder, cache, work_dir, **job_options)
+        stats = job.run()
+        vectors, records = job.load_output()
+        if not records:
+            logging.warning(f"No rows found in {csv_path}; no index written.")
+            return stats
+        save_qa_index(build_index(vectors, kind=kind), records, index_path, mapping_path)
+    finally:
+        cache.close()
+    logging.info(f"Embedding job done: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed the Q&A dataset and build the FAISS index (resumable).")
+    parser.add_argument("--csv", default="sha_dataset.csv", help="dataset with ID, Question and Answer columns")
+    parser.add_argument("--kind", choices=INDEX_KINDS, default="hnsw")
+    parser.add_argument("--embedder", choices=("google", "local", "fake"), default="google")
+    parser.add_argument("--dim", type=int, default=256, help="dimensions of the local and fake embedders")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="CSV rows read (and checkpointed) at a time")
+    parser.add_argument("--batch-size", type=int, default=100, help="texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    parser.add_argument("--fake-latency", type=float, default=0.0)
+    parser.add_argument("--fake-failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    embedder = create_job_embedder(args.embedder, args.dim, args.fake_latency, args.fake_failure_rate)
+    run_embedding_job(args.csv, embedder, kind=args.kind, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                      max_concurrency=args.concurrency)
@@ -1,37 +1,16 @@
-import google.generativeai as genai
-import pandas as pd
-import numpy as np
-import faiss
-import json
+# Builds the SHA Q&A index (sha_index.faiss + sha_mapping.json) from sha_dataset.csv with the Google
+# embedding API. The embedding job batches the requests, caches every embedding on disk and resumes
+# an interrupted run (see ai/embedding_job.py).
+import os
+from dotenv import load_dotenv
+from backend.ai.embedding_job import create_job_embedder, run_embedding_job
 
 # Load Google API key
-genai.configure(api_key="GOOGLE_GEMINI_API_KEY")
+load_dotenv()
 
-# Load dataset
-df = pd.read_csv("sha_dataset.csv")
-
-# Create Embeddings for Each Question
-def generate_embedding(text):
-    response = genai.embed_content(model="models/embedding-001", content=text)
-    return np.array(response["embedding"])
-
-# Generate Vectors for Dataset
-df["vector"] = df["Question"].apply(generate_embedding)
-
-# Convert Vectors to FAISS Format
-dimension = len(df["vector"].iloc[0])
-index = faiss.IndexFlatL2(dimension)
-vectors = np.vstack(df["vector"].values).astype("float32")
-index.add(vectors)
-
-# Save Index
-faiss.write_index(index, "sha_index.faiss")
-
-# Save Data Mapping
-df[["ID", "Question", "Answer"]].to_json("sha_mapping.json", orient="records")
-
-print("Fine-tuning completed. SHA model is ready!")
+if __name__ == "__main__":
+    run_embedding_job("sha_dataset.csv", create_job_embedder("google"), kind=os.getenv("QA_INDEX_KIND", "flat"))
+    print("Fine-tuning completed. SHA model is ready!")
 
 
 # Fine-Tune Gemini AI Using Vertex AI
-
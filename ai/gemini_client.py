@@ -0,0 +1,491 @@
+# Async Gemini client: one pooled HTTP connection set per process, bounded concurrency,
+# per-call timeouts and retries with jitter within a deadline, hedged attempts against tail
+# latency, a circuit breaker, plus token streaming. A stub backend with
+# configurable latency allows throughput and streaming tests without network access.
+# Load test (offline): python -m backend.ai.gemini_client --requests 500 --concurrency 32 --stub-latency 0.2
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import json
+from collections import deque
+import httpx
+from dotenv import load_dotenv
+from backend.ai.circuit_breaker import CircuitBreaker
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load environment variables
+load_dotenv()
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# problems with the request itself (malformed or oversized prompt), not with Gemini
+REQUEST_ERROR_STATUS_CODES = {400, 413, 422}
+# finish reasons of a candidate withheld because of what was asked
+BLOCKED_FINISH_REASONS = {"SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII"}
+
+
+class GeminiError(Exception):
+    """Gemini could not produce a response."""
+
+
+class TransientGeminiError(GeminiError):
+    """A Gemini failure that is worth retrying (timeouts, rate limits, 5xx)."""
+
+
+class RequestRejectedError(GeminiError):
+    """Gemini refused this particular request (HTTP 400, a blocked prompt, no candidates). Not retried,
+    and no verdict on Gemini's health: the next prompt may well succeed."""
+
+
+class CircuitOpenError(GeminiError):
+    """The circuit breaker rejected the call without trying Gemini."""
+
+
+class DeadlineExceededError(GeminiError):
+    """The caller's deadline ran out: before any attempt (attempts == 0), during an attempt cut short
+    by it, or with no time left to retry. Only the upstream_failures before it say anything about
+    Gemini's health."""
+
+    def __init__(self, message, attempts=0, upstream_failures=0):
+        super().__init__(message)
+        self.attempts = attempts
+        self.upstream_failures = upstream_failures
+
+
+class HttpGeminiBackend:
+    """Calls the Gemini REST API through a shared, pooled httpx.AsyncClient."""
+
+    def __init__(self, api_key, model="gemini-2.0-flash", max_connections=20):
+        self.api_key = api_key
+        self.model = model
+        self.max_connections = max_connections
+        self._client = None
+
+    def _get_client(self):
+        # created lazily so it binds to the running event loop
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._client = httpx.AsyncClient(limits=limits, timeout=None)
+        return self._client
+
+    async def generate(self, prompt):
+        if not self.api_key:
+            raise GeminiError("Gemini API key not configured.")
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        try:
+            response = await self._get_client().post(
+                GEMINI_API_URL.format(model=self.model),
+                params={"key": self.api_key},
+                json=payload,
+            )
+        except httpx.TransportError as e:
+            raise TransientGeminiError(f"Transport error: {e}") from e
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise TransientGeminiError(f"Gemini returned HTTP {response.status_code}")
+        if response.status_code in REQUEST_ERROR_STATUS_CODES:
+            raise RequestRejectedError(f"Gemini rejected the request (HTTP {response.status_code}): {response.text[:200]}")
+        if response.status_code >= 400:
+            raise GeminiError(f"Gemini returned HTTP {response.status_code}: {response.text[:200]}")
+        return self._extract_text(response.json())
+
+    async def stream_generate(self, prompt):
+        """Yields text chunks as Gemini produces them (server-sent events mode)."""
+        if not self.api_key:
+            raise GeminiError("Gemini API key not configured.")
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        try:
+            async with self._get_client().stream(
+                "POST",
+                GEMINI_STREAM_URL.format(model=self.model),
+                params={"key": self.api_key, "alt": "sse"},
+                json=payload,
+            ) as response:
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    raise TransientGeminiError(f"Gemini returned HTTP {response.status_code}")
+                if response.status_code >= 400:
+                    body = await response.aread()
+                    if response.status_code in REQUEST_ERROR_STATUS_CODES:
+                        raise RequestRejectedError(f"Gemini rejected the request (HTTP {response.status_code}): {body[:200]!r}")
+                    raise GeminiError(f"Gemini returned HTTP {response.status_code}: {body[:200]!r}")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    text = self._extract_text(json.loads(line[len("data:"):]))
+                    if text:
+                        yield text
+        except httpx.TransportError as e:
+            raise TransientGeminiError(f"Transport error: {e}") from e
+
+    @staticmethod
+    def _extract_text(body):
+        if isinstance(body, dict):
+            # a blocked prompt comes back as a 200 without candidates (or with an empty safety-stopped one)
+            candidates = body.get("candidates")
+            block_reason = (body.get("promptFeedback") or {}).get("blockReason")
+            if not candidates:
+                raise RequestRejectedError(f"Gemini returned no candidates (block reason: {block_reason or 'none given'})")
+            finish_reason = candidates[0].get("finishReason") if isinstance(candidates[0], dict) else None
+            if finish_reason in BLOCKED_FINISH_REASONS and "content" not in candidates[0]:
+                raise RequestRejectedError(f"Gemini blocked the answer (finish reason: {finish_reason})")
+        try:
+            parts = body["candidates"][0]["content"]["parts"]
+            return "".join(part.get("text", "") for part in parts)
+        except (KeyError, IndexError, TypeError) as e:
+            raise GeminiError(f"Unexpected Gemini response format: {e}") from e
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class StubGeminiBackend:
+    """Offline stand-in for Gemini with configurable latency and failure rate."""
+
+    def __init__(self, latency=0.5, jitter=0.0, failure_rate=0.0, template="Stub answer to: {prompt}", chunk_latency=0.05):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.template = template
+        self.chunk_latency = chunk_latency
+
+    async def generate(self, prompt):
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise TransientGeminiError("Stub failure")
+        return self.template.format(prompt=prompt)
+
+    async def stream_generate(self, prompt):
+        """Yields the stub answer word by word; latency is time to first chunk, chunk_latency between chunks."""
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise TransientGeminiError("Stub failure")
+        words = self.template.format(prompt=prompt).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.chunk_latency)
+            yield word if i == len(words) - 1 else word + " "
+
+    async def aclose(self):
+        pass
+
+
+class AsyncGeminiClient:
+    """Bounded-concurrency Gemini client with per-call timeouts, retry-with-jitter within an optional
+    deadline, hedged attempts after a latency percentile and an optional circuit breaker."""
+
+    def __init__(self, backend, max_concurrency=16, timeout=15.0, max_retries=2, backoff_base=0.25, backoff_max=4.0,
+                 breaker=None, hedge_percentile=None, hedge_min_delay=0.05, hedge_min_samples=20, latency_window=500):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._latencies = deque(maxlen=latency_window)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.deadline_exceeded = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def generate(self, prompt, deadline=None):
+        """Returns Gemini's answer to the prompt; raises GeminiError once retries are exhausted,
+        the deadline (a time.monotonic() instant) leaves no time for another attempt, or the
+        circuit breaker is open (CircuitOpenError, without calling Gemini)."""
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError("Gemini circuit breaker is open.")
+        self.calls += 1
+        try:
+            response = await self._generate_with_retries(prompt, deadline)
+        except GeminiError as e:
+            self.failures += 1
+            self._record_failure(e)
+            raise
+        except BaseException:
+            # cancelled: no outcome to report
+            if self.breaker is not None:
+                self.breaker.release()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return response
+
+    def _record_failure(self, error):
+        if self.breaker is None:
+            return
+        if isinstance(error, DeadlineExceededError) and not error.upstream_failures:
+            # the caller's budget ran out (e.g. slow preprocessing), Gemini did not fail: no verdict
+            self.breaker.release()
+        elif isinstance(error, RequestRejectedError):
+            # a bad or blocked prompt is that user's problem; it must not send everyone to degraded answers
+            self.breaker.release()
+        else:
+            self.breaker.record_failure()
+
+    def _attempt_timeout(self, deadline):
+        """Timeout of the next attempt (or stream chunk), and whether the deadline rather than the
+        client timeout sets it."""
+        if deadline is None:
+            return self.timeout, False
+        remaining = deadline - time.monotonic()
+        return (remaining, True) if remaining < self.timeout else (self.timeout, False)
+
+    def _backoff(self, attempt, deadline, error, upstream_failures):
+        """Full-jitter delay before the next attempt; raises when the deadline leaves no time for it."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            self.deadline_exceeded += 1
+            raise DeadlineExceededError(f"Gemini failed after {attempt + 1} attempts with no time left to retry: "
+                                        f"{str(error) or 'timeout'}", attempt + 1, upstream_failures) from error
+        self.retries += 1
+        return delay
+
+    async def _generate_with_retries(self, prompt, deadline):
+        upstream_failures = 0
+        for attempt in range(self.max_retries + 1):
+            timeout, by_deadline = self._attempt_timeout(deadline)
+            if timeout <= 0:
+                self.deadline_exceeded += 1
+                raise DeadlineExceededError(f"Gemini deadline exceeded after {attempt} attempts", attempt, upstream_failures)
+            try:
+                return await self._hedged_attempt(prompt, timeout)
+            except asyncio.TimeoutError as e:
+                if by_deadline:
+                    # cut short by the caller's budget, not by Gemini's own timeout
+                    self.deadline_exceeded += 1
+                    raise DeadlineExceededError(f"Gemini deadline exceeded during attempt {attempt + 1}",
+                                                attempt + 1, upstream_failures) from e
+                error = e
+            except TransientGeminiError as e:
+                error = e
+            upstream_failures += 1
+            if attempt == self.max_retries:
+                raise GeminiError(f"Gemini failed after {attempt + 1} attempts: {str(error) or 'timeout'}") from error
+            delay = self._backoff(attempt, deadline, error, upstream_failures)
+            logging.warning(f"Transient Gemini error ({str(error) or 'timeout'}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, prompt):
+        # the semaphore is held per attempt, never while backing off
+        async with self._semaphore:
+            self.in_flight += 1
+            start = time.monotonic()
+            try:
+                response = await self.backend.generate(prompt)
+            finally:
+                self.in_flight -= 1
+        self._latencies.append(time.monotonic() - start)
+        return response
+
+    def hedge_delay(self):
+        """Delay after which a second, hedged attempt is sent: the hedge percentile of recent
+        successful latencies. None while hedging is off, under-sampled or the client is saturated."""
+        if not self.hedge_percentile or len(self._latencies) < self.hedge_min_samples or self._semaphore.locked():
+            return None
+        ordered = sorted(self._latencies)
+        return max(self.hedge_min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))])
+
+    async def _hedged_attempt(self, prompt, timeout):
+        """One attempt within the timeout; if it is slower than the hedge delay a second one races it
+        and the first success wins (the other is cancelled)."""
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return await asyncio.wait_for(self._attempt(prompt), timeout=timeout)
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        primary = asyncio.ensure_future(self._attempt(prompt))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.append(asyncio.ensure_future(self._attempt(prompt)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=end - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                            logging.debug(f"Hedged Gemini attempt won (hedge delay {delay * 1000:.0f}ms)")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def stream(self, prompt, deadline=None):
+        """Yields answer chunks as they arrive. Retries only happen before the first chunk;
+        the timeout applies to the first chunk and to each gap between chunks. Not hedged.
+        The whole stream must end by the deadline (DeadlineExceededError otherwise)."""
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError("Gemini circuit breaker is open.")
+        self.calls += 1
+        try:
+            async for chunk in self._stream_with_retries(prompt, deadline):
+                yield chunk
+        except GeminiError as e:
+            self._record_failure(e)
+            raise
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.release()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    async def _stream_with_retries(self, prompt, deadline):
+        upstream_failures = 0
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    chunks = self.backend.stream_generate(prompt)
+                    try:
+                        while True:
+                            timeout, by_deadline = self._attempt_timeout(deadline)
+                            try:
+                                if timeout <= 0:
+                                    raise asyncio.TimeoutError()
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                            except StopAsyncIteration:
+                                return
+                            except asyncio.TimeoutError as e:
+                                if by_deadline:
+                                    self.deadline_exceeded += 1
+                                    raise DeadlineExceededError(f"Gemini stream deadline exceeded during attempt {attempt + 1}",
+                                                                attempt + 1, upstream_failures) from e
+                                raise
+                            started = True
+                            yield chunk
+                    finally:
+                        self.in_flight -= 1
+                        await chunks.aclose()
+            except (TransientGeminiError, asyncio.TimeoutError) as e:
+                upstream_failures += 1
+                if started or attempt == self.max_retries:
+                    self.failures += 1
+                    raise GeminiError(f"Gemini stream failed after {attempt + 1} attempts: {str(e) or 'timeout'}") from e
+                try:
+                    delay = self._backoff(attempt, deadline, e, upstream_failures)
+                except GeminiError:
+                    self.failures += 1
+                    raise
+                logging.warning(f"Transient Gemini error ({str(e) or 'timeout'}), retrying stream in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except GeminiError:
+                self.failures += 1
+                raise
+
+    def stats(self):
+        """Returns call, retry, failure, deadline and hedging counters and the breaker state."""
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "deadline_exceeded": self.deadline_exceeded,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": (self.hedge_delay() or 0.0) * 1000,
+            "breaker": self.breaker.stats() if self.breaker is not None else None,
+        }
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+
+def create_gemini_client():
+    """Builds a client from environment variables (GEMINI_BACKEND=http|stub, GEMINI_MAX_CONCURRENCY, ...)."""
+    if os.getenv("GEMINI_BACKEND", "http").lower() == "stub":
+        backend = StubGeminiBackend(
+            latency=float(os.getenv("GEMINI_STUB_LATENCY_SECONDS", "0.5")),
+            jitter=float(os.getenv("GEMINI_STUB_JITTER_SECONDS", "0")),
+            failure_rate=float(os.getenv("GEMINI_STUB_FAILURE_RATE", "0")),
+            chunk_latency=float(os.getenv("GEMINI_STUB_CHUNK_LATENCY_SECONDS", "0.05")),
+        )
+    else:
+        backend = HttpGeminiBackend(
+            api_key=os.getenv("GOOGLE_GEMINI_API_KEY"),
+            model=os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
+            max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", "20")),
+        )
+    failure_threshold = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+    return AsyncGeminiClient(
+        backend,
+        max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+        timeout=float(os.getenv("GEMINI_TIMEOUT_SECONDS", "15")),
+        max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "2")),
+        # GEMINI_BREAKER_FAILURES=0 disables the breaker, GEMINI_HEDGE_PERCENTILE=0 hedging
+        breaker=CircuitBreaker(
+            "gemini",
+            failure_threshold=failure_threshold,
+            reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30")),
+        ) if failure_threshold > 0 else None,
+        hedge_percentile=float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95")),
+        hedge_min_delay=float(os.getenv("GEMINI_HEDGE_MIN_DELAY_SECONDS", "0.05")),
+    )
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """Returns the process-wide Gemini client."""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                _shared_client = create_gemini_client()
+    return _shared_client
+
+
+async def run_load_test(client, num_requests):
+    """Fires num_requests concurrent prompts and reports throughput."""
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(client.generate(f"question {i}") for i in range(num_requests)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(f"{num_requests} requests in {elapsed:.2f}s -> {num_requests / elapsed:.1f} req/s ({failed} failed)")
+    print(f"client stats: {client.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput test of the async Gemini client.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stub-latency", type=float, default=0.5)
+    parser.add_argument("--stub-jitter", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--hedge-percentile", type=float, default=None, help="hedge attempts slower than this latency percentile")
+    args = parser.parse_args()
+
+    stub = StubGeminiBackend(latency=args.stub_latency, jitter=args.stub_jitter, failure_rate=args.failure_rate)
+    client = AsyncGeminiClient(stub, max_concurrency=args.concurrency, hedge_percentile=args.hedge_percentile)
+    asyncio.run(run_load_test(client, args.requests))
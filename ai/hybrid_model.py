@@ -1,27 +1,58 @@
 import string
 import google.generativeai as genai
-from sklearn.metrics.pairwise import cosine_similarity
+import asyncio
+import logging
 import os
-import pickle
+import time
 from dotenv import load_dotenv
+from backend.ai.corpus_index import get_corpus_index
+from backend.ai.inverted_index import get_inverted_index
+from backend.ai.model_registry import get_model_registry
+from backend.ai.gemini_client import CircuitOpenError, DeadlineExceededError, GeminiError, RequestRejectedError, get_gemini_client
+from backend.ai.answer_cache import get_answer_cache, normalize_query
+from backend.ai.qa_index import get_qa_index
+from backend.ai.routing_threshold import get_routing_threshold
+from backend.ai.single_flight import SingleFlight
+from backend.ai.stage_timings import mark_path, timed
 
 # Load environment variables
 load_dotenv(dotenv_path='D:/RETRIEVAL-SHA-CHATBOT/backend/.env')
 
-# Load pre-trained models (TF-IDF and Word2Vec)
-with open("D:/RETRIEVAL-SHA-CHATBOT/models/sentence_tokens.pkl", "rb") as f:
-    sentence_tokens = pickle.load(f)
-
-with open("D:/RETRIEVAL-SHA-CHATBOT/models/tfidf_vectorizer.pkl", "rb") as f:
-    tfidf_vectorizer = pickle.load(f)
-
 # Configure Google Gemini API
 GENAI_API_KEY = os.getenv("GOOGLE_GEMINI_API_KEY")
 genai.configure(api_key=GENAI_API_KEY)
 
-# gemini model instance and model object
+# gemini model instance and model object (synchronous SDK, used by the command line chat)
 gemini_model = genai.GenerativeModel("gemini-2.0-flash")
 
+# async client used by the API so Gemini calls never block the event loop
+gemini_client = get_gemini_client()
+
+# identical questions asked at the same time (a trending topic) share one Gemini call;
+# GEMINI_WAIT_TIMEOUT_SECONDS bounds how long each request waits for it (0: the client's own timeouts)
+gemini_flights = SingleFlight("gemini")
+GEMINI_WAIT_TIMEOUT = float(os.getenv("GEMINI_WAIT_TIMEOUT_SECONDS", "0")) or None
+
+# end-to-end budget of a chat request; a Gemini answer that cannot make it in time is replaced
+# by the best retrieval answer, even below the routing threshold
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE_SECONDS", "10"))
+degraded_answers = {"retrieval": 0, "apology": 0}
+
+def chat_deadline(budget=None):
+    """time.monotonic() instant by which a request started now must be answered."""
+    return time.monotonic() + (CHAT_DEADLINE if budget is None else budget)
+
+def get_cache():
+    """Cache of generative answers; paraphrases are matched with the retrieval TF-IDF vectorizer."""
+    return get_answer_cache(vectorize=cache_vectorizer())
+
+def cache_vectorizer():
+    """Near-duplicate vectorizer of the models version the request pinned: a hot-reloaded vocabulary
+    changes the vector space, so each version is matched in its own (the cache keeps one matrix per
+    vectorizer instead of switching a shared one back and forth)."""
+    corpus_index = get_corpus_index()
+    return corpus_index.transform_query if corpus_index is not None else None
+
 def preprocess_text(text):
     """Preprocess the text (remove punctuation, lowercase, etc.)"""
     text = text.lower().translate(str.maketrans('', '', string.punctuation))
@@ -36,23 +67,313 @@ def chat_with_gemini(user_input):
         
     
 
-def hybrid_get_response(user_input, threshold=0.6):
+def best_retrieval(user_input):
+    """Best retrieval answer for the input and its similarity, whatever the threshold."""
+    # shared inverted index over the corpus TF-IDF matrix, loaded once by the model registry
+    retrieval_index = get_inverted_index()
+    if retrieval_index is None:
+        return None, 0.0
+    response_idx, max_similarity = retrieval_index.best_match(preprocess_text(user_input))
+    if response_idx is None:
+        return None, 0.0
+    return retrieval_index.sentence_tokens[response_idx], max_similarity
+
+def route_retrieval(response, similarity, threshold=None):
+    """The retrieval answer when it clears the threshold, else None (counted as a fallback).
+    Without a threshold the published (tuned) routing threshold is used."""
+    routing = get_routing_threshold()
+    if threshold is None:
+        threshold = routing.current()
+    if response is not None and similarity >= threshold:
+        routing.record(fallbacks=0)
+        return response
+    routing.record(fallbacks=1)
+    return None
+
+def retrieve(user_input, threshold=None):
+    """Returns the best retrieval answer when it clears the threshold, else None."""
+    return route_retrieval(*best_retrieval(user_input), threshold)
+
+def degraded_fallback(response, similarity):
+    """The below-threshold retrieval answer to serve when Gemini fails, if retrieval found anything."""
+    return response if response is not None and similarity > 0 else None
+
+def lookup_qa(user_input):
+    """Returns the dataset Answer of the nearest Q&A question when it is close enough, else None."""
+    qa_index = get_qa_index()
+    if qa_index is None:
+        return None
+    try:
+        return qa_index.answer(user_input)
+    except Exception as e:
+        # the query embedding may be a network call; a failure just means the next fallback answers
+        logging.warning(f"Q&A index lookup failed: {e}")
+        return None
+
+async def async_lookup_qa(user_input, deadline=None):
+    """lookup_qa off the event loop (the query embedding may call the embedding API). A lookup still
+    running when the deadline passes counts as a miss, so the cache and Gemini fallbacks get their turn."""
+    if get_qa_index() is None:
+        return None
+    return await _qa_within_deadline(deadline, None, lookup_qa, user_input)
+
+async def _qa_within_deadline(deadline, missed, func, *args):
+    """func(*args) in a worker thread, or missed once the deadline passes (the thread itself finishes
+    in the background, bounded by the embedding API's request timeout)."""
+    if deadline is None:
+        return await asyncio.to_thread(func, *args)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return missed
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout=remaining)
+    except asyncio.TimeoutError:
+        logging.warning(f"Q&A index lookup abandoned at the deadline ({remaining:.2f}s budget left)")
+        return missed
+
+async def async_lookup_cache(user_input):
+    """The cached generative answer to the input (or a close paraphrase), or None."""
+    answer_cache = get_cache()
+    if answer_cache is None:
+        return None
+    return await answer_cache.aget(user_input, cache_vectorizer())
+
+async def async_chat_with_gemini(user_input, timeout=GEMINI_WAIT_TIMEOUT, deadline=None, fallback=None,
+                                 timings=None, position=0, check_cache=True):
+    """Gemini's answer (or the cached one, unless the caller already looked). When Gemini fails, its
+    circuit breaker is open or the deadline passes, the fallback answer is returned instead, or an
+    apology without one. The answering path is marked on timings (at position, for batches)."""
+    answer_cache = get_cache()
+    # serve repeated (or paraphrased) questions from the answer cache
+    if check_cache:
+        cached = await async_lookup_cache(user_input)
+        if cached is not None:
+            mark_path(timings, "cache", position)
+            return cached
+    key = normalize_query(user_input) or user_input
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    try:
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceededError("The deadline passed before Gemini was called")
+        # failures reach every request waiting on the shared call but are never cached
+        response = await gemini_flights.do(key, lambda: _generate_and_cache(user_input, answer_cache, deadline), timeout=timeout)
+    except (GeminiError, asyncio.TimeoutError) as e:
+        mark_path(timings, "degraded", position)
+        return _degraded_answer(e, fallback)
+    mark_path(timings, "gemini", position)
+    return response
+
+async def _generate_and_cache(user_input, answer_cache, deadline=None):
+    response = await gemini_client.generate(user_input, deadline=deadline)
+    if answer_cache is not None:
+        await answer_cache.aput(user_input, response)
+    return response
+
+def _degraded_answer(error, fallback):
+    if fallback is not None:
+        degraded_answers["retrieval"] += 1
+        logging.warning(f"Serving the best retrieval answer instead of Gemini's: {str(error) or 'deadline exceeded'}")
+        return fallback
+    degraded_answers["apology"] += 1
+    if isinstance(error, CircuitOpenError):
+        return "Sorry, I can't answer that right now. Please try again in a moment."
+    if isinstance(error, RequestRejectedError):
+        return "Sorry, I can't answer that question. Please try rephrasing it."
+    if isinstance(error, DeadlineExceededError) and not error.attempts:
+        # the budget went on the stages before Gemini, which was never asked
+        return "Sorry, I couldn't answer that in time. Please try again."
+    if isinstance(error, (asyncio.TimeoutError, DeadlineExceededError)):
+        return "Sorry, I couldn't get that. Gemini took too long to answer."
+    return f"Sorry, I couldn't get that. Error from Gemini: {error}"
+
+def hybrid_get_response(user_input, threshold=None):
     # processing input text using the retrieval-based model
-    user_input_processed = preprocess_text(user_input)
-    tfidf = tfidf_vectorizer.transform([user_input_processed])
-    similarities = cosine_similarity(tfidf, tfidf_vectorizer.transform(sentence_tokens)).flatten()
-    max_similarity = similarities.max()
+    response = retrieve(user_input, threshold)
     
-    # If similarity score exceeds the threshold, use retrieval-based response
-    if max_similarity >= threshold:
-        response_idx = similarities.argmax()
-        response = sentence_tokens[response_idx]
-    else:
-        # If similarity is low, use Google Gemini for generative response
+    # If similarity is low, try the Q&A dataset, then use Google Gemini for generative response
+    if response is None:
+        response = lookup_qa(user_input)
+    if response is None:
         response = chat_with_gemini(user_input)
     
     return response
 
+async def async_hybrid_get_response(user_input, threshold=None, deadline=None, timings=None):
+    """Same routing as hybrid_get_response, awaiting the Gemini fallback instead of blocking.
+    The answer is due by the deadline (CHAT_DEADLINE_SECONDS from now by default). The retrieval
+    (TF-IDF and Q&A lookups), answer cache and Gemini stages and the answering path are recorded
+    on timings."""
+    if deadline is None:
+        deadline = chat_deadline()
+    with timed(timings, "retrieval"):
+        candidate, similarity = best_retrieval(user_input)
+        response = route_retrieval(candidate, similarity, threshold)
+    if response is not None:
+        mark_path(timings, "retrieval")
+        return response
+    with timed(timings, "retrieval"):
+        response = await async_lookup_qa(user_input, deadline=deadline)
+    if response is not None:
+        mark_path(timings, "qa")
+        return response
+    with timed(timings, "cache"):
+        response = await async_lookup_cache(user_input)
+    if response is not None:
+        mark_path(timings, "cache")
+        return response
+    with timed(timings, "gemini"):
+        return await async_chat_with_gemini(user_input, deadline=deadline, timings=timings, check_cache=False,
+                                            fallback=degraded_fallback(candidate, similarity))
+
+
+async def async_hybrid_stream_response(user_input, threshold=None, deadline=None, timings=None):
+    """Yields (source, text) pairs: a single ("retrieval" | "qa" | "cache", answer) for ready answers,
+    otherwise ("gemini", chunk) for every chunk Gemini streams. The complete generated answer
+    is cached once the stream finishes. If Gemini fails before its first chunk (or its breaker is
+    open), the best retrieval answer is yielded instead when there is one. The Gemini stage on
+    timings lasts until the last chunk, time spent sending the chunks to the client included."""
+    with timed(timings, "retrieval"):
+        candidate, similarity = best_retrieval(user_input)
+        response = route_retrieval(candidate, similarity, threshold)
+    if response is not None:
+        mark_path(timings, "retrieval")
+        yield "retrieval", response
+        return
+    with timed(timings, "retrieval"):
+        response = await async_lookup_qa(user_input, deadline=deadline)
+    if response is not None:
+        mark_path(timings, "qa")
+        yield "qa", response
+        return
+    with timed(timings, "cache"):
+        cached = await async_lookup_cache(user_input)
+    if cached is not None:
+        mark_path(timings, "cache")
+        yield "cache", cached
+        return
+    answer_cache = get_cache()
+    fallback = degraded_fallback(candidate, similarity)
+    if gemini_flights.in_flight(normalize_query(user_input) or user_input):
+        # the same question is already being generated for another request: share that answer
+        with timed(timings, "gemini"):
+            response = await async_chat_with_gemini(user_input, deadline=deadline, fallback=fallback, timings=timings,
+                                                    check_cache=False)
+        yield "gemini", response
+        return
+    chunks = []
+    try:
+        with timed(timings, "gemini"):
+            async for chunk in gemini_client.stream(user_input, deadline=deadline):
+                chunks.append(chunk)
+                yield "gemini", chunk
+    except GeminiError as e:
+        if chunks or fallback is None:
+            raise
+        mark_path(timings, "degraded")
+        yield "retrieval", _degraded_answer(e, fallback)
+        return
+    mark_path(timings, "gemini")
+    if answer_cache is not None:
+        await answer_cache.aput(user_input, "".join(chunks))
+
+
+async def async_hybrid_get_batch_responses(user_inputs, threshold=None, deadline=None, timings=None):
+    """Answers a batch of inputs: one matrix product for retrieval, concurrent Gemini calls for the rest.
+
+    Responses are returned in input order, all due by the deadline (CHAT_DEADLINE_SECONDS from now by default).
+    The stages on timings are those of the whole batch; the answering path is marked per input.
+    """
+    if not user_inputs:
+        return []
+    if deadline is None:
+        deadline = chat_deadline()
+    routing = get_routing_threshold()
+    if threshold is None:
+        threshold = routing.current()
+    with timed(timings, "retrieval"):
+        retrieval_index = get_inverted_index()
+        if retrieval_index is None:
+            response_ids, similarities = [None] * len(user_inputs), [0.0] * len(user_inputs)
+        else:
+            # preprocessing and the batch matrix product are CPU-bound: keep them off the event loop
+            response_ids, similarities = await asyncio.to_thread(_score_batch, retrieval_index, user_inputs)
+
+    responses = [None] * len(user_inputs)
+    candidates = [None] * len(user_inputs)
+    fallback_positions = []
+    for position, (response_idx, similarity) in enumerate(zip(response_ids, similarities)):
+        if response_idx is not None and response_idx >= 0 and similarity >= threshold:
+            responses[position] = retrieval_index.sentence_tokens[response_idx]
+            mark_path(timings, "retrieval", position)
+        else:
+            fallback_positions.append(position)
+            if response_idx is not None and response_idx >= 0:
+                candidates[position] = degraded_fallback(retrieval_index.sentence_tokens[response_idx], similarity)
+    routing.record(fallbacks=len(fallback_positions), routed=len(user_inputs))
+
+    # then the Q&A dataset, with one embedding call for all of them
+    qa_index = get_qa_index()
+    if qa_index is not None and fallback_positions:
+        with timed(timings, "retrieval"):
+            answers = await _qa_within_deadline(deadline, [None] * len(fallback_positions), _lookup_qa_batch, qa_index,
+                                             [user_inputs[position] for position in fallback_positions])
+        for position, answer in zip(fallback_positions, answers):
+            responses[position] = answer
+            if answer is not None:
+                mark_path(timings, "qa", position)
+        fallback_positions = [position for position in fallback_positions if responses[position] is None]
+
+    # then the answer cache
+    if fallback_positions:
+        with timed(timings, "cache"):
+            cached = await asyncio.gather(*(async_lookup_cache(user_inputs[position]) for position in fallback_positions))
+        for position, answer in zip(fallback_positions, cached):
+            if answer is not None:
+                responses[position] = answer
+                mark_path(timings, "cache", position)
+        fallback_positions = [position for position in fallback_positions if responses[position] is None]
+
+    # only the inputs left unanswered go to Gemini, concurrently (bounded by the client's semaphore)
+    if fallback_positions:
+        # timed as a whole: the calls overlap
+        with timed(timings, "gemini"):
+            generated = await asyncio.gather(*(
+                async_chat_with_gemini(user_inputs[position], deadline=deadline, fallback=candidates[position],
+                                       timings=timings, position=position, check_cache=False)
+                for position in fallback_positions
+            ))
+    else:
+        generated = []
+    for position, response in zip(fallback_positions, generated):
+        responses[position] = response
+    return responses
+
+
+def _score_batch(retrieval_index, user_inputs):
+    return retrieval_index.corpus_index.best_matches([preprocess_text(user_input) for user_input in user_inputs])
+
+
+def _lookup_qa_batch(qa_index, user_inputs):
+    try:
+        return qa_index.answers(user_inputs)
+    except Exception as e:
+        logging.warning(f"Q&A index lookup failed: {e}")
+        return [None] * len(user_inputs)
+
+
+def _warm_retrieval():
+    # a retrieval query before the first request pays for vectorizer and scorer first-call costs
+    # (scored directly, so warmup does not count as a routing decision)
+    retrieval_index = get_inverted_index()
+    if retrieval_index is not None:
+        retrieval_index.best_match(preprocess_text("What is the Social Health Authority?"))
+    get_routing_threshold().current()
+    get_cache()
+
+
+get_model_registry().add_warmup("retrieval", _warm_retrieval)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+# Incremental corpus updates: appends new sentences to the TF-IDF model without refitting it.
+# Raw term counts and document frequencies are kept next to the models, so a delta only has to be
+# tokenized itself; IDF is updated exactly, but only columns whose weight moved by more than a tolerance
+# (plus the new terms) are re-weighted in the stored corpus matrix. A compaction re-applies the exact IDF
+# everywhere and puts the vocabulary back in refit order, so the result equals a full refit.
+# Add: python -m backend.ai.incremental_tfidf --add new_docs.txt --publish
+# Compact: python -m backend.ai.incremental_tfidf --compact --publish
+
+import argparse
+import configparser
+import logging
+import os
+import time
+from collections import Counter
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from backend.ai.corpus_index import CorpusIndex, _load_pickle, load_corpus_index, vectorizer_path
+from backend.ai.model_registry import get_model_registry
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+tfidf_counts_path = config.get('paths', 'tfidf_counts_file', fallback=os.path.join(models_dir, "tfidf_counts.npz"))
+
+FORMAT_VERSION = 1
+
+
+def _exact_idf(df, n_docs, smooth_idf):
+    """sklearn's IDF: ln((1 + n) / (1 + df)) + 1 when smoothed, else ln(n / df) + 1."""
+    if smooth_idf:
+        return np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+    return np.log(n_docs / df) + 1.0
+
+
+def _entry_positions(indptr, rows):
+    """Positions in data/indices of every stored entry of the given CSR rows, and the local row of each."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    local_rows = np.repeat(np.arange(rows.size), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, local_rows
+
+
+class IncrementalTfidf:
+    """TF-IDF corpus index that grows by appending documents.
+
+    counts holds the raw term counts with the same sparsity structure as the L2-normalized weights
+    matrix; idf is the IDF currently applied to the weights (and to queries through the vectorizer)."""
+
+    def __init__(self, sentence_tokens, vectorizer, counts, df, matrix=None, idf_tolerance=0.01):
+        if vectorizer.min_df != 1 or vectorizer.max_df != 1.0 or vectorizer.max_features is not None:
+            raise ValueError("Incremental updates need a vectorizer without min_df/max_df/max_features pruning.")
+        self.sentence_tokens = list(sentence_tokens)
+        self.vectorizer = vectorizer
+        self.counts = sp.csr_matrix(counts, dtype=np.float64)
+        self.counts.sort_indices()
+        self.df = np.asarray(df, dtype=np.int64)
+        self.idf_tolerance = idf_tolerance
+        self.vocabulary = dict(vectorizer.vocabulary_)
+        self.idf = np.array(vectorizer.idf_, dtype=np.float64) if vectorizer.use_idf else np.ones(len(self.df))
+        if self.counts.shape != (len(self.sentence_tokens), len(self.df)) or len(self.vocabulary) != len(self.df):
+            raise ValueError(f"Counts of shape {self.counts.shape} do not match {len(self.sentence_tokens)} sentences "
+                             f"and {len(self.vocabulary)} terms.")
+        if matrix is not None and not matrix.has_sorted_indices:
+            # entries are addressed by position, so they must be laid out like the counts
+            matrix = matrix.copy()
+            matrix.sort_indices()
+        self.matrix = matrix if matrix is not None else self._weights(self.counts)
+        self.updates = 0
+
+    @classmethod
+    def from_corpus(cls, sentence_tokens, vectorizer, matrix=None, idf_tolerance=0.01):
+        """Counts the corpus once with the vectorizer's own analyzer (one-off bootstrap, O(corpus))."""
+        params = {k: v for k, v in vectorizer.get_params().items() if k in CountVectorizer().get_params()}
+        params.update(vocabulary=vectorizer.vocabulary_, dtype=np.float64)
+        counts = CountVectorizer(**params).transform(sentence_tokens)
+        df = np.bincount(counts.indices, minlength=len(vectorizer.vocabulary_))
+        return cls(sentence_tokens, vectorizer, counts, df, matrix, idf_tolerance)
+
+    @property
+    def n_docs(self):
+        return len(self.sentence_tokens)
+
+    def exact_idf(self):
+        if not self.vectorizer.use_idf:
+            return np.ones(len(self.df))
+        return _exact_idf(self.df, self.n_docs, self.vectorizer.smooth_idf)
+
+    def drift(self):
+        """Largest relative difference between the applied and the exact IDF (0.0 right after a compaction)."""
+        if not len(self.df):
+            return 0.0
+        exact = self.exact_idf()
+        return float(np.max(np.abs(self.idf - exact) / exact))
+
+    def add_documents(self, sentences):
+        """Appends sentences; only the delta is tokenized and only affected rows are re-weighted."""
+        start = time.perf_counter()
+        sentences = [s for s in sentences if s]
+        if not sentences:
+            return {"new_documents": 0}
+        analyzer = self.vectorizer.build_analyzer()
+        old_terms = len(self.vocabulary)
+        indptr = [0]
+        indices = []
+        data = []
+        for sentence in sentences:
+            for term, count in Counter(analyzer(sentence)).items():
+                indices.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                data.append(count)
+            indptr.append(len(indices))
+        n_terms = len(self.vocabulary)
+        delta = sp.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr)),
+                              shape=(len(sentences), n_terms))
+        delta.sort_indices()
+
+        # document frequencies and IDF for the grown corpus
+        self.df = np.concatenate([self.df, np.zeros(n_terms - old_terms, dtype=np.int64)])
+        touched = np.unique(delta.indices)
+        self.df[touched] += np.bincount(delta.indices, minlength=n_terms)[touched]
+        self.sentence_tokens.extend(sentences)
+        exact = self.exact_idf()
+        self.idf = np.concatenate([self.idf, exact[old_terms:]])
+
+        # existing terms the delta used whose weight moved beyond the tolerance; untouched terms only
+        # drift through the document count, which compaction (or the drift check) takes care of
+        old_touched = touched[touched < old_terms]
+        moved = old_touched[np.abs(exact[old_touched] - self.idf[old_touched]) > self.idf_tolerance * exact[old_touched]]
+        self.idf[moved] = exact[moved]
+
+        # new terms only occur in new rows, so only old rows containing a moved term need new weights
+        matrix = sp.csr_matrix((self.matrix.data.copy(), self.matrix.indices, self.matrix.indptr),
+                               shape=(self.matrix.shape[0], n_terms))
+        rows = np.empty(0, dtype=np.int64)
+        if moved.size:
+            hits = np.flatnonzero(np.isin(self.counts.indices, moved))
+            rows = np.unique(np.searchsorted(self.counts.indptr, hits, side="right") - 1)
+            positions, local_rows = _entry_positions(self.counts.indptr, rows)
+            matrix.data[positions] = self._row_weights(self.counts.data[positions], self.counts.indices[positions],
+                                                       local_rows, rows.size)
+        self.counts = sp.vstack([sp.csr_matrix(self.counts, shape=(self.counts.shape[0], n_terms)), delta], format="csr")
+        self.matrix = sp.vstack([matrix, self._weights(delta)], format="csr")
+        self.vectorizer = self._build_vectorizer(self.vocabulary, self.idf)
+        self.updates += 1
+
+        stats = {
+            "new_documents": len(sentences),
+            "new_terms": n_terms - old_terms,
+            "reweighted_columns": int(moved.size + n_terms - old_terms),
+            "renormalized_rows": int(rows.size),
+            "idf_drift": self.drift(),
+            "elapsed_s": time.perf_counter() - start,
+        }
+        logging.info(f"Added {stats['new_documents']} sentences ({stats['new_terms']} new terms, "
+                     f"{stats['renormalized_rows']} rows re-weighted) in {stats['elapsed_s'] * 1000:.1f}ms; "
+                     f"IDF drift {stats['idf_drift']:.4f}")
+        return stats
+
+    def compact(self):
+        """Re-applies the exact IDF to every row and sorts the vocabulary, matching a full refit."""
+        start = time.perf_counter()
+        terms = sorted(self.vocabulary)
+        old_columns = np.array([self.vocabulary[term] for term in terms], dtype=np.int64)
+        remap = np.empty(len(terms), dtype=np.int32)
+        remap[old_columns] = np.arange(len(terms), dtype=np.int32)
+        counts = sp.csr_matrix((self.counts.data, remap[self.counts.indices], self.counts.indptr), shape=self.counts.shape)
+        counts.sort_indices()
+        self.counts = counts
+        self.df = self.df[old_columns]
+        self.vocabulary = {term: column for column, term in enumerate(terms)}
+        self.idf = self.exact_idf()
+        self.matrix = self._weights(self.counts)
+        self.vectorizer = self._build_vectorizer(self.vocabulary, self.idf)
+        logging.info(f"TF-IDF compacted: {self.n_docs} sentences, {len(terms)} terms in {time.perf_counter() - start:.2f}s")
+
+    def corpus_index(self):
+        return CorpusIndex(self.sentence_tokens, self.vectorizer, self.matrix, normalized=True)
+
+    def save(self, file_path):
+        """Saves counts and document frequencies to an .npz file next to the models."""
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            np.savez(
+                file_path,
+                version=np.array(FORMAT_VERSION),
+                data=self.counts.data.astype(np.int32),
+                indices=self.counts.indices,
+                indptr=self.counts.indptr,
+                shape=np.array(self.counts.shape),
+                df=self.df,
+            )
+            logging.info(f"TF-IDF counts saved successfully to: {file_path}")
+        except IOError as e:
+            logging.error(f"Error saving TF-IDF counts: {e}")
+
+    @classmethod
+    def load(cls, sentence_tokens, vectorizer, matrix, file_path, idf_tolerance=0.01):
+        """Loads saved counts for the given models; None when missing or saved for another corpus."""
+        try:
+            with np.load(file_path) as data:
+                if int(data["version"]) != FORMAT_VERSION:
+                    logging.warning(f"TF-IDF counts at {file_path} have an old format version; ignoring them.")
+                    return None
+                counts = sp.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+                df = data["df"]
+            if counts.shape != matrix.shape:
+                logging.warning(f"TF-IDF counts at {file_path} have shape {counts.shape}, expected {matrix.shape}; ignoring them.")
+                return None
+            logging.info(f"TF-IDF counts loaded from: {file_path}")
+            return cls(sentence_tokens, vectorizer, counts, df, matrix, idf_tolerance)
+        except FileNotFoundError:
+            logging.info(f"No TF-IDF counts found at {file_path}")
+        except (IOError, KeyError, ValueError) as e:
+            logging.error(f"Error loading TF-IDF counts: {e}")
+        return None
+
+    def _weights(self, counts):
+        """L2-normalized TF-IDF rows for a counts matrix, using the applied IDF."""
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        data = self._row_weights(counts.data, counts.indices, rows, counts.shape[0])
+        return sp.csr_matrix((data, counts.indices.copy(), counts.indptr.copy()), shape=counts.shape)
+
+    def _row_weights(self, counts, columns, rows, n_rows):
+        if self.vectorizer.binary:
+            tf = np.ones_like(counts)
+        elif self.vectorizer.sublinear_tf:
+            tf = np.log(counts) + 1.0
+        else:
+            tf = counts
+        weights = tf * self.idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_rows))
+        norms[norms == 0.0] = 1.0
+        return weights / norms[rows]
+
+    def _build_vectorizer(self, vocabulary, idf):
+        # a vectorizer with a fixed vocabulary needs no real fit; the IDF is set directly
+        params = self.vectorizer.get_params()
+        params["vocabulary"] = dict(vocabulary)
+        vectorizer = TfidfVectorizer(**params)
+        with np.errstate(divide="ignore"):
+            vectorizer.fit([""])
+        if vectorizer.use_idf:
+            vectorizer.idf_ = idf.copy()
+        return vectorizer
+
+
+def load_incremental_tfidf(idf_tolerance=0.01):
+    """Loads the active models with their saved counts, counting the corpus once when there are none."""
+    corpus_index = load_corpus_index()
+    if corpus_index is None:
+        return None
+    vectorizer = corpus_index.vectorizer
+    if not isinstance(vectorizer, TfidfVectorizer):
+        # the mapped index carries the analyzer settings only; the pickled vectorizer is needed here
+        vectorizer = _load_pickle(get_model_registry().artifact_path(vectorizer_path), "TF-IDF vectorizer")
+        if vectorizer is None:
+            return None
+    sentence_tokens = list(corpus_index.sentence_tokens)
+    matrix = sp.csr_matrix(corpus_index.matrix, copy=True)
+    model = IncrementalTfidf.load(sentence_tokens, vectorizer, matrix,
+                                  get_model_registry().artifact_path(tfidf_counts_path), idf_tolerance)
+    if model is None:
+        model = IncrementalTfidf.from_corpus(sentence_tokens, vectorizer, matrix, idf_tolerance)
+    return model
+
+
+if __name__ == "__main__":
+    from backend.ai.tfidf_model import publish_version
+    from backend.ai.train_model import load_data, tokenize_sentences
+
+    parser = argparse.ArgumentParser(description="Add sentences to the TF-IDF model without a full refit.")
+    parser.add_argument("--add", nargs="*", default=[], metavar="FILE", help="text files whose sentences are appended")
+    parser.add_argument("--compact", action="store_true", help="re-apply the exact IDF everywhere (equals a full refit)")
+    parser.add_argument("--max-drift", type=float, default=0.05,
+                        help="compact automatically once the applied IDF drifts this far from the exact IDF")
+    parser.add_argument("--idf-tolerance", type=float, default=0.01,
+                        help="re-weight a touched term's column once its IDF moved by more than this fraction")
+    parser.add_argument("--publish", action="store_true",
+                        help="write a new version under the models versions directory for the API to hot reload")
+    args = parser.parse_args()
+
+    model = load_incremental_tfidf(args.idf_tolerance)
+    if model is None:
+        logging.error("Incremental update failed: no trained TF-IDF models found.")
+        raise SystemExit(1)
+    for path in args.add:
+        model.add_documents(tokenize_sentences(load_data(path)))
+    if args.compact or model.drift() > args.max_drift:
+        model.compact()
+    if args.publish:
+        counts_name = os.path.basename(tfidf_counts_path)
+        publish_version(model.sentence_tokens, model.corpus_index(),
+                        extra_writers=[lambda version_dir: model.save(os.path.join(version_dir, counts_name))])
+    else:
+        logging.info("Not published; pass --publish to make the update visible to the API.")
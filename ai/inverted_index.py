@@ -0,0 +1,196 @@
+# Inverted-index top-k scorer over the corpus TF-IDF matrix with max-score pruning.
+# Only sentences that share a term with the query are ever touched.
+
+import logging
+import threading
+import time
+import numpy as np
+from backend.ai.corpus_index import get_corpus_index, select_top_k
+from backend.ai.model_registry import get_model_registry
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Slack for floating point differences between the bound arithmetic and the accumulated scores
+_BOUND_EPSILON = 1e-12
+
+
+class InvertedIndex:
+    """
+    Term -> postings index built from a CorpusIndex.
+
+    Every term keeps two views of its postings: ordered by weight (descending), used to admit
+    new candidate sentences and to stop early once the remaining weights can no longer reach
+    the current top-k, and ordered by sentence id, used to add the term's contribution to
+    sentences that are already candidates. Query terms are processed by decreasing upper
+    bound (query weight x max posting weight), so later terms can only update candidates
+    (max-score pruning).
+
+    With min_idf=None the result equals the exhaustive cosine scoring of CorpusIndex;
+    query terms with an IDF below min_idf are dropped, trading exactness for speed.
+    """
+
+    def __init__(self, corpus_index, min_idf=None, postings=None):
+        start = time.perf_counter()
+        self.corpus_index = corpus_index
+        self.min_idf = min_idf
+        # postings may come precomputed (memory-mapped from the retrieval index file)
+        if postings is None:
+            postings = build_postings(corpus_index.matrix)
+        self.indptr = postings["indptr"]
+        # id-ordered postings (CSC layout)
+        self.id_postings = postings["id_postings"]
+        self.id_weights = postings["id_weights"]
+        # weight-ordered postings: per term, by descending weight
+        self.weight_postings = postings["weight_postings"]
+        self.weight_weights = postings["weight_weights"]
+        self.max_weight = postings["max_weight"]
+        idf = getattr(corpus_index.vectorizer, "idf_", None)
+        self.idf = np.asarray(idf) if idf is not None else None
+        self.build_time = time.perf_counter() - start
+        self._stats_lock = threading.Lock()
+        self.query_count = 0
+        self.total_query_time = 0.0
+        self.total_postings_touched = 0
+        logging.info(f"Inverted index built over {self.indptr.size - 1} terms ({self.id_postings.size} postings) in {self.build_time:.3f}s")
+
+    @property
+    def sentence_tokens(self):
+        return self.corpus_index.sentence_tokens
+
+    def top_k(self, text, k=1):
+        """Returns the indices and scores of the k most similar sentences, best first."""
+        start = time.perf_counter()
+        query = self.corpus_index.transform_query([text])
+        ids, scores, touched = self._search(query.indices, query.data, k)
+        self._record_query(time.perf_counter() - start, touched)
+        return ids, scores
+
+    def best_match(self, text):
+        """Returns (index, score) of the most similar sentence, or (None, 0.0) when nothing matches."""
+        ids, scores = self.top_k(text, k=1)
+        if not ids.size:
+            return None, 0.0
+        return int(ids[0]), float(scores[0])
+
+    def stats(self):
+        """Returns build time, per-query scoring time and the average number of postings touched."""
+        with self._stats_lock:
+            queries = self.query_count
+            return {
+                "build_time_s": self.build_time,
+                "queries": queries,
+                "avg_query_ms": (self.total_query_time / queries * 1000) if queries else 0.0,
+                "avg_postings_touched": (self.total_postings_touched / queries) if queries else 0.0,
+            }
+
+    def _search(self, terms, query_weights, k):
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=self.id_weights.dtype), 0
+        if k <= 0 or not terms.size:
+            return empty
+        if self.min_idf is not None and self.idf is not None:
+            keep = self.idf[terms] >= self.min_idf
+            terms, query_weights = terms[keep], query_weights[keep]
+        upper_bounds = query_weights * self.max_weight[terms]
+        keep = upper_bounds > 0
+        terms, query_weights, upper_bounds = terms[keep], query_weights[keep], upper_bounds[keep]
+        if not terms.size:
+            return empty
+
+        order = np.argsort(-upper_bounds, kind="stable")
+        terms, query_weights, upper_bounds = terms[order], query_weights[order], upper_bounds[order]
+        # remaining[i] = best score still obtainable from terms i..end
+        remaining = np.append(np.cumsum(upper_bounds[::-1])[::-1], 0.0)
+
+        # the k-th best single-term score of the first term is a valid lower bound for the top-k
+        first_start, first_end = self.indptr[terms[0]], self.indptr[terms[0] + 1]
+        threshold = query_weights[0] * self.weight_weights[first_start + k - 1] if first_end - first_start >= k else 0.0
+
+        candidate_ids = np.empty(0, dtype=self.id_postings.dtype)
+        candidate_scores = np.empty(0, dtype=self.id_weights.dtype)
+        touched = 0
+        for i, (term, weight) in enumerate(zip(terms, query_weights)):
+            start, end = self.indptr[term], self.indptr[term + 1]
+
+            # add this term's contribution to the existing candidates
+            if candidate_ids.size:
+                postings = self.id_postings[start:end]
+                positions = np.searchsorted(postings, candidate_ids)
+                positions[positions == postings.size] = 0
+                hit = postings[positions] == candidate_ids
+                candidate_scores[hit] += weight * self.id_weights[start + positions[hit]]
+                touched += int(hit.sum())
+
+            # admit new candidates only while they can still reach the top-k
+            if remaining[i] + _BOUND_EPSILON >= threshold:
+                min_weight = (threshold - remaining[i + 1] - _BOUND_EPSILON) / weight
+                weights = self.weight_weights[start:end]
+                admitted = int(np.searchsorted(-weights, -min_weight, side="right")) if min_weight > 0 else weights.size
+                if admitted:
+                    new_ids = self.weight_postings[start:start + admitted]
+                    new_scores = weight * weights[:admitted]
+                    touched += admitted
+                    if candidate_ids.size:
+                        positions = np.searchsorted(candidate_ids, new_ids)
+                        positions[positions == candidate_ids.size] = 0
+                        fresh = candidate_ids[positions] != new_ids
+                        new_ids, new_scores = new_ids[fresh], new_scores[fresh]
+                    merged_ids = np.concatenate([candidate_ids, new_ids])
+                    merged_order = np.argsort(merged_ids, kind="stable")
+                    candidate_ids = merged_ids[merged_order]
+                    candidate_scores = np.concatenate([candidate_scores, new_scores])[merged_order]
+
+            if candidate_scores.size >= k:
+                threshold = max(threshold, -np.partition(-candidate_scores, k - 1)[k - 1])
+
+        if not candidate_ids.size:
+            return empty[0], empty[1], touched
+        top, _ = select_top_k(candidate_scores, k)
+        return candidate_ids[top].astype(np.int64), candidate_scores[top], touched
+
+    def _record_query(self, elapsed, touched):
+        with self._stats_lock:
+            self.query_count += 1
+            self.total_query_time += elapsed
+            self.total_postings_touched += touched
+        logging.debug(f"Inverted index scored query in {elapsed * 1000:.2f}ms ({touched} postings touched)")
+
+
+def build_postings(matrix):
+    """Id-ordered and weight-ordered postings of every term (column) of the corpus matrix."""
+    csc = matrix.tocsc()
+    csc.sort_indices()
+    # weight-ordered postings: stable sort by column, then by descending weight
+    columns = np.repeat(np.arange(csc.shape[1]), np.diff(csc.indptr))
+    order = np.lexsort((-csc.data, columns))
+    weight_weights = csc.data[order]
+    lengths = np.diff(csc.indptr)
+    max_weight = np.zeros(csc.shape[1], dtype=csc.data.dtype)
+    non_empty = lengths > 0
+    max_weight[non_empty] = weight_weights[csc.indptr[:-1][non_empty]]
+    return {
+        "indptr": csc.indptr,
+        "id_postings": csc.indices,
+        "id_weights": csc.data,
+        "weight_postings": csc.indices[order],
+        "weight_weights": weight_weights,
+        "max_weight": max_weight,
+    }
+
+
+def load_inverted_index(min_idf=None):
+    """Builds the inverted index over the shared corpus index. None if the models are missing."""
+    corpus_index = get_corpus_index()
+    if corpus_index is None:
+        return None
+    mapped = get_model_registry().get("retrieval_index_file")
+    postings = mapped.postings() if mapped is not None and corpus_index.matrix is mapped.matrix else None
+    return InvertedIndex(corpus_index, min_idf=min_idf, postings=postings)
+
+
+get_model_registry().register("inverted_index", load_inverted_index)
+
+
+def get_inverted_index():
+    """Returns the process-wide inverted index over the shared corpus index. None if the models are missing."""
+    return get_model_registry().get("inverted_index")
@@ -0,0 +1,378 @@
+# Memory-mappable retrieval index: the corpus TF-IDF matrix (CSR), the vocabulary as sorted arrays,
+# the IDF weights, the sentences as one UTF-8 blob with offsets and, optionally, the inverted-index
+# postings, all in one file. Workers np.memmap it read-only, so every uvicorn worker shares the same
+# pages through the OS page cache and starts without unpickling anything.
+# Written by ai/tfidf_model.py. Check a file: python -m backend.ai.mmap_index [path] --verify
+#
+# Layout: 8-byte magic, then version, header length and header CRC32 (uint32 each, little endian),
+# a JSON header describing the vectorizer and every section (offset, dtype, shape, CRC32), and the
+# sections themselves, each aligned to 64 bytes.
+
+import argparse
+import bisect
+import configparser
+import functools
+import json
+import logging
+import os
+import re
+import struct
+import time
+import zlib
+from collections import Counter
+from collections.abc import Mapping, Sequence
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import strip_accents_ascii, strip_accents_unicode
+from sklearn.preprocessing import normalize
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+retrieval_index_path = config.get('paths', 'retrieval_index_file', fallback=os.path.join(models_dir, "retrieval_index.bin"))
+
+MAGIC = b"SHAIDX\x00\x00"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sIII")
+_ALIGNMENT = 64
+_CHECKSUM_CHUNK = 16 * 1024 * 1024
+POSTINGS_SECTIONS = ("indptr", "id_postings", "id_weights", "weight_postings", "weight_weights", "max_weight")
+
+
+class IndexFormatError(ValueError):
+    """The index file is truncated, corrupted or written by another format version."""
+
+
+def _vectorizer_params(vectorizer):
+    """The analyzer settings needed to vectorize queries without the pickled vectorizer."""
+    if vectorizer.analyzer != "word" or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None:
+        raise ValueError("Only word analyzers without custom tokenizer/preprocessor can be stored in the index file.")
+    if vectorizer.strip_accents not in (None, "ascii", "unicode"):
+        raise ValueError("Custom strip_accents callables cannot be stored in the index file.")
+    stop_words = vectorizer.get_stop_words()
+    return {
+        "lowercase": bool(vectorizer.lowercase),
+        "strip_accents": vectorizer.strip_accents,
+        "token_pattern": vectorizer.token_pattern,
+        "ngram_range": list(vectorizer.ngram_range),
+        "stop_words": sorted(stop_words) if stop_words else [],
+        "binary": bool(vectorizer.binary),
+        "use_idf": bool(vectorizer.use_idf),
+        "sublinear_tf": bool(vectorizer.sublinear_tf),
+        "norm": vectorizer.norm,
+        "dtype": np.dtype(vectorizer.dtype).str,
+    }
+
+
+def _string_arrays(strings):
+    """One UTF-8 blob plus an offsets array (len + 1) for a list of strings."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def write_index(file_path, sentence_tokens, vectorizer, matrix, postings=None):
+    """Writes the index file; matrix must be the L2-normalized corpus matrix (CorpusIndex.matrix)."""
+    start = time.perf_counter()
+    matrix = sp.csr_matrix(matrix)
+    matrix.sort_indices()
+    if matrix.shape != (len(sentence_tokens), len(vectorizer.vocabulary_)):
+        raise ValueError(f"Corpus matrix shape {matrix.shape} does not match the sentences and vocabulary.")
+
+    # sorted by UTF-8 bytes (== code point order), with the matrix column of every term
+    terms = sorted(vectorizer.vocabulary_)
+    term_columns = np.array([vectorizer.vocabulary_[term] for term in terms], dtype=np.int64)
+    sentence_blob, sentence_offsets = _string_arrays(sentence_tokens)
+    term_blob, term_offsets = _string_arrays(terms)
+    sections = {
+        "data": matrix.data,
+        "indices": matrix.indices,
+        "indptr": matrix.indptr,
+        # all ones when the vectorizer was fitted without IDF weighting
+        "idf": np.asarray(vectorizer.idf_ if vectorizer.use_idf else np.ones(matrix.shape[1]), dtype=np.float64),
+        "term_blob": term_blob,
+        "term_offsets": term_offsets,
+        "term_columns": term_columns,
+        "sentence_blob": sentence_blob,
+        "sentence_offsets": sentence_offsets,
+    }
+    for name in POSTINGS_SECTIONS if postings is not None else ():
+        sections["postings_" + name] = postings[name]
+
+    sections = {name: np.ascontiguousarray(array) for name, array in sections.items()}
+    checksums = {name: zlib.crc32(array.data) for name, array in sections.items()}
+    created_at = time.time()
+    # section offsets depend on the header length, which depends on the offsets: lay out until stable
+    data_start = _align(_PREAMBLE.size)
+    while True:
+        table = {}
+        position = data_start
+        for name, array in sections.items():
+            table[name] = {"offset": position, "dtype": array.dtype.str, "shape": list(array.shape), "crc32": checksums[name]}
+            position = _align(position + array.nbytes)
+        header = {
+            "format_version": FORMAT_VERSION,
+            "created_at": created_at,
+            "sentences": matrix.shape[0],
+            "terms": matrix.shape[1],
+            "nnz": int(matrix.nnz),
+            "file_size": position,
+            "vectorizer": _vectorizer_params(vectorizer),
+            "sections": table,
+        }
+        header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+        if _align(_PREAMBLE.size + len(header_bytes)) == data_start:
+            break
+        data_start = _align(_PREAMBLE.size + len(header_bytes))
+    header_bytes = header_bytes.ljust(data_start - _PREAMBLE.size, b" ")
+
+    # write to a temporary file and rename, so readers never map a half-written index
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes), zlib.crc32(header_bytes)))
+        f.write(header_bytes)
+        for name, array in sections.items():
+            f.seek(table[name]["offset"])
+            f.write(array.data)
+        f.truncate(header["file_size"])
+    os.replace(tmp_path, file_path)
+    logging.info(f"Retrieval index written to: {file_path} ({header['file_size'] / 1024 ** 2:.1f} MiB) "
+                 f"in {time.perf_counter() - start:.2f}s")
+
+
+def _align(position):
+    return -(-position // _ALIGNMENT) * _ALIGNMENT
+
+
+def read_header(file_path):
+    """Reads and validates the header; raises IndexFormatError for foreign, stale or truncated files."""
+    with open(file_path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise IndexFormatError(f"{file_path} is too short to be a retrieval index")
+        magic, version, header_size, header_crc = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise IndexFormatError(f"{file_path} is not a retrieval index")
+        if version != FORMAT_VERSION:
+            raise IndexFormatError(f"{file_path} has format version {version}, expected {FORMAT_VERSION}")
+        header_bytes = f.read(header_size)
+    if len(header_bytes) != header_size or zlib.crc32(header_bytes) != header_crc:
+        raise IndexFormatError(f"{file_path} has a corrupted header")
+    header = json.loads(header_bytes)
+    actual_size = os.path.getsize(file_path)
+    if actual_size != header["file_size"]:
+        raise IndexFormatError(f"{file_path} is {actual_size} bytes, expected {header['file_size']}")
+    return header
+
+
+class MappedStrings(Sequence):
+    """Read-only sequence of strings decoded on access from a memory-mapped UTF-8 blob."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("string index out of range")
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def raw(self, idx):
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes()
+
+
+class MappedVocabulary(Mapping):
+    """term -> column mapping answered by binary search over the sorted, memory-mapped terms."""
+
+    def __init__(self, terms, term_columns, memo_size=100000):
+        self.terms = terms
+        self.term_columns = term_columns
+        self._raw_terms = _RawTerms(terms)
+        self.lookup = functools.lru_cache(maxsize=memo_size)(self._lookup)
+
+    def _lookup(self, term):
+        encoded = term.encode("utf-8")
+        position = bisect.bisect_left(self._raw_terms, encoded)
+        if position < len(self.terms) and self.terms.raw(position) == encoded:
+            return int(self.term_columns[position])
+        return None
+
+    def __getitem__(self, term):
+        column = self.lookup(term)
+        if column is None:
+            raise KeyError(term)
+        return column
+
+    def __contains__(self, term):
+        return self.lookup(term) is not None
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+
+class _RawTerms(Sequence):
+    # bytes view of MappedStrings for bisect
+    def __init__(self, terms):
+        self.terms = terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, idx):
+        return self.terms.raw(idx)
+
+
+class MappedVectorizer:
+    """Query-side stand-in for the fitted TfidfVectorizer: same analyzer, vocabulary and IDF, no pickle."""
+
+    def __init__(self, vocabulary, idf, params):
+        self.vocabulary_ = vocabulary
+        self.idf_ = idf
+        self.params = params
+        self.dtype = np.dtype(params["dtype"])
+        self._token_re = re.compile(params["token_pattern"])
+        self._stop_words = frozenset(params["stop_words"])
+        self._strip_accents = {"ascii": strip_accents_ascii, "unicode": strip_accents_unicode}.get(params["strip_accents"])
+
+    def build_analyzer(self):
+        return self.analyze
+
+    def analyze(self, text):
+        """Tokenizes like sklearn's word analyzer: preprocess, tokenize, drop stop words, word n-grams."""
+        if self.params["lowercase"]:
+            text = text.lower()
+        if self._strip_accents is not None:
+            text = self._strip_accents(text)
+        tokens = [token for token in self._token_re.findall(text) if token not in self._stop_words]
+        min_n, max_n = self.params["ngram_range"]
+        if max_n == 1:
+            return tokens
+        original = tokens
+        tokens = list(original) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(original)) + 1):
+            tokens.extend(" ".join(original[i:i + n]) for i in range(len(original) - n + 1))
+        return tokens
+
+    def transform(self, texts):
+        """Returns the TF-IDF rows for texts, identical to the fitted vectorizer's transform."""
+        indptr = [0]
+        indices = []
+        values = []
+        for text in texts:
+            counts = Counter()
+            for token in self.analyze(text):
+                column = self.vocabulary_.lookup(token)
+                if column is not None:
+                    counts[column] += 1
+            for column in sorted(counts):
+                indices.append(column)
+                values.append(counts[column])
+            indptr.append(len(indices))
+        tf = np.asarray(values, dtype=self.dtype)
+        columns = np.asarray(indices, dtype=np.int32)
+        if self.params["binary"]:
+            tf[:] = 1
+        elif self.params["sublinear_tf"]:
+            tf = np.log(tf) + 1
+        if self.params["use_idf"]:
+            tf = tf * self.idf_[columns].astype(self.dtype)
+        matrix = sp.csr_matrix((tf, columns, np.asarray(indptr, dtype=np.int32)), shape=(len(indptr) - 1, len(self.idf_)))
+        if self.params["norm"]:
+            matrix = normalize(matrix, norm=self.params["norm"], copy=False)
+        return matrix
+
+
+class MappedIndex:
+    """A retrieval index file mapped read-only; arrays are views into the shared page cache."""
+
+    def __init__(self, file_path, header, buffer):
+        self.file_path = file_path
+        self.header = header
+        self._buffer = buffer
+        idf = self.section("idf")
+        self.sentences = MappedStrings(self.section("sentence_blob"), self.section("sentence_offsets"))
+        terms = MappedStrings(self.section("term_blob"), self.section("term_offsets"))
+        self.vectorizer = MappedVectorizer(MappedVocabulary(terms, self.section("term_columns")), idf, header["vectorizer"])
+        self.matrix = sp.csr_matrix(
+            (self.section("data"), self.section("indices"), self.section("indptr")),
+            shape=(header["sentences"], header["terms"]),
+            copy=False,
+        )
+
+    @classmethod
+    def open(cls, file_path, verify=False):
+        """Maps the file; verify=True also checks every section checksum (reads the whole file)."""
+        start = time.perf_counter()
+        header = read_header(file_path)
+        buffer = np.memmap(file_path, dtype=np.uint8, mode="r")
+        index = cls(file_path, header, buffer)
+        if verify:
+            index.verify()
+        logging.info(f"Retrieval index mapped from: {file_path} ({header['sentences']} sentences, "
+                     f"{header['terms']} terms) in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return index
+
+    def section(self, name):
+        spec = self.header["sections"][name]
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        start = spec["offset"]
+        return self._buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+
+    def postings(self):
+        """The stored inverted-index postings, or None when the file was written without them."""
+        if "postings_indptr" not in self.header["sections"]:
+            return None
+        return {name: self.section("postings_" + name) for name in POSTINGS_SECTIONS}
+
+    def verify(self):
+        """Checks every section against its CRC32; raises IndexFormatError on mismatch."""
+        for name, spec in self.header["sections"].items():
+            raw = self.section(name).view(np.uint8).reshape(-1)
+            crc = 0
+            for start in range(0, raw.size, _CHECKSUM_CHUNK):
+                crc = zlib.crc32(raw[start:start + _CHECKSUM_CHUNK], crc)
+            if crc != spec["crc32"]:
+                raise IndexFormatError(f"{self.file_path}: section '{name}' fails its checksum")
+
+
+def open_retrieval_index(file_path=retrieval_index_path):
+    """Maps the configured index file; None when it does not exist (the pickled models are used instead).
+    RETRIEVAL_INDEX_VERIFY=true checks the section checksums at startup."""
+    if not os.path.exists(file_path):
+        logging.info(f"No retrieval index file at {file_path}")
+        return None
+    verify = os.getenv("RETRIEVAL_INDEX_VERIFY", "false").lower() in ("true", "1", "yes")
+    return MappedIndex.open(file_path, verify=verify)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and verify a memory-mappable retrieval index file.")
+    parser.add_argument("path", nargs="?", default=retrieval_index_path)
+    parser.add_argument("--verify", action="store_true", help="check every section checksum")
+    args = parser.parse_args()
+
+    index = MappedIndex.open(args.path, verify=args.verify)
+    header = index.header
+    print(f"format v{header['format_version']}, {header['sentences']} sentences, {header['terms']} terms, "
+          f"{header['nnz']} non-zeros, postings: {'yes' if index.postings() is not None else 'no'}")
+    for name, spec in header["sections"].items():
+        print(f"  {name:<24} {spec['dtype']:>5} {str(tuple(spec['shape'])):>14} @ {spec['offset']}")
+    if args.verify:
+        print("checksums OK")
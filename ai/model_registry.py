@@ -0,0 +1,449 @@
+# Process-wide registry of serving artifacts (corpus index, inverted index, spell corrector, Word2Vec).
+# Each artifact is loaded exactly once, on first use or during warmup, and its load time and memory
+# footprint are recorded (memory only with MODEL_REGISTRY_TRACE_MEMORY=true: tracemalloc slows loads
+# down). Warmup loads every registered artifact and runs the registered warmup queries; the API
+# reports not-ready until it has finished. Lookups from the event loop never wait for a load: an
+# artifact that is not loaded yet is loaded in a background thread and reported as absent meanwhile.
+#
+# Hot reload: trained artifacts can be published as versions under models/versions/<version>/
+# (a READY marker is written last). A watcher thread, or the admin endpoint, loads a new version in the
+# background and swaps the whole set of artifacts in with one reference assignment. Requests pin the
+# snapshot they started with, so in-flight requests finish on the old version; an artifact first
+# needed after the pin is loaded for the pinned version too.
+
+import asyncio
+import configparser
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+model_versions_dir = config.get('paths', 'model_versions_dir', fallback=os.path.join(models_dir, "versions"))
+
+PENDING = "pending"
+LOADED = "loaded"
+MISSING = "missing"
+FAILED = "failed"
+
+READY_MARKER = "READY"
+
+# snapshot pinned by the current request (or being staged by a reload)
+_pinned_snapshot = contextvars.ContextVar("model_snapshot", default=None)
+
+
+class ModelReloadError(Exception):
+    """A new models version could not be loaded; the active version stays in place."""
+
+
+class ModelSnapshot:
+    """One consistent set of loaded artifacts for one models version."""
+
+    def __init__(self, version, values=None, staging=False):
+        self.version = version
+        # filled in place by lazy loads, so every request pinning the snapshot sees them
+        self.values = values if values is not None else {}
+        self.info = {}
+        self.staging = staging
+        self.background_loads = set()
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def lock_for(self, name):
+        """The lock serializing loads of one artifact into this snapshot."""
+        with self._locks_lock:
+            return self._locks.setdefault(name, threading.RLock())
+
+
+class _Artifact:
+    def __init__(self, name, loader, required):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.info = {"status": PENDING, "load_time_s": None, "memory_bytes": None, "error": None}
+
+
+def _on_event_loop():
+    """Whether the caller runs on an asyncio event loop (a coroutine, not a worker thread)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def list_versions(versions_dir=model_versions_dir):
+    """Published versions (directories with a READY marker), oldest first."""
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_dir)
+        if os.path.isfile(os.path.join(versions_dir, name, READY_MARKER))
+    )
+
+
+def latest_version(versions_dir=model_versions_dir):
+    versions = list_versions(versions_dir)
+    return versions[-1] if versions else None
+
+
+def new_version_dir(versions_dir=model_versions_dir):
+    """Creates the directory for a new version; names sort by creation time."""
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    path = os.path.join(versions_dir, version)
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(versions_dir, f"{version}-{suffix}")
+        suffix += 1
+    os.makedirs(path)
+    return path
+
+
+def mark_version_ready(version_dir):
+    """Publishes a version once all its files are written; watchers ignore directories without the marker."""
+    with open(os.path.join(version_dir, READY_MARKER), "w") as f:
+        f.write(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    logging.info(f"Models version published: {version_dir}")
+
+
+class ModelRegistry:
+    """Loads named artifacts once and keeps them until a new models version is swapped in.
+
+    A loader returning None marks the artifact as missing; an exception marks it as failed.
+    Neither is retried, so a missing model file is reported once instead of on every request.
+    """
+
+    def __init__(self, trace_memory=False, versions_dir=model_versions_dir):
+        self.trace_memory = trace_memory
+        self.versions_dir = versions_dir
+        self._artifacts = {}
+        self._warmups = []
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._tracing_loads = 0
+        self._owns_tracing = False
+        self._local = threading.local()
+        self._warmup_thread = None
+        self._watcher_thread = None
+        self.deferred_lookups = 0
+        self._snapshot = ModelSnapshot(latest_version(versions_dir))
+        self.warmup_started = False
+        self.warmup_done = threading.Event()
+        self.warmup_time = None
+        self.warmup_errors = {}
+        self.reloads = 0
+        self.reload_in_progress = None
+        self.last_reload_error = None
+        self.last_reload_time = None
+        self._rejected_versions = set()
+
+    @property
+    def version(self):
+        """The active models version; None when serving the unversioned files of models_dir."""
+        return self._snapshot.version
+
+    def register(self, name, loader, required=True):
+        """Registers loader() for an artifact; registering an existing name keeps the first loader."""
+        with self._lock:
+            if name not in self._artifacts:
+                self._artifacts[name] = _Artifact(name, loader, required)
+
+    def add_warmup(self, name, query):
+        """Registers a query run once all artifacts are loaded, so the first request hits warm code paths."""
+        with self._lock:
+            self._warmups.append((name, query))
+
+    def get(self, name):
+        """Returns the artifact, loading it on first use; None when it is missing or failed to load.
+
+        The artifact comes from the snapshot pinned by the request (or being staged by a reload),
+        else from the active one; one first needed after the pin is loaded for the pinned version.
+        Called from the event loop, it never blocks: an artifact that is not loaded yet is loaded
+        in a background thread and None is returned meanwhile, so the caller degrades as it would
+        for a missing artifact (warmup loads everything before the API reports ready).
+        """
+        snapshot = _pinned_snapshot.get() or self._snapshot
+        if name in snapshot.values:
+            return snapshot.values[name]
+        if _on_event_loop():
+            self._load_in_background(snapshot, name)
+            return None
+        return self._load_into(snapshot, name)
+
+    def _load_into(self, snapshot, name):
+        artifact = self._artifacts[name]
+        with snapshot.lock_for(name):
+            if name in snapshot.values:
+                return snapshot.values[name]
+            # the loader resolves its files and dependencies against this snapshot's version
+            value, info = contextvars.copy_context().run(self._load_pinned, snapshot, artifact)
+            snapshot.values[name] = value
+            snapshot.info[name] = info
+            with self._lock:
+                if snapshot is self._snapshot:
+                    artifact.info = info
+        return value
+
+    def _load_pinned(self, snapshot, artifact):
+        _pinned_snapshot.set(snapshot)
+        return self._load(artifact, snapshot.version)
+
+    def _load_in_background(self, snapshot, name):
+        with self._lock:
+            self.deferred_lookups += 1
+            if name in snapshot.background_loads:
+                return
+            snapshot.background_loads.add(name)
+
+        def load():
+            try:
+                self._load_into(snapshot, name)
+            finally:
+                with self._lock:
+                    snapshot.background_loads.discard(name)
+
+        threading.Thread(target=load, name=f"model-load-{name}", daemon=True).start()
+
+    def pin(self):
+        """Pins the active snapshot for the calling request (context) and returns its version.
+
+        Every later get() in the same request returns the pinned artifacts, even if a reload
+        swaps in a new version meanwhile.
+        """
+        snapshot = self._snapshot
+        _pinned_snapshot.set(snapshot)
+        return snapshot.version
+
+    def artifact_path(self, default_path, fallback=False):
+        """Path of a model file for the version being loaded: the same file name inside the version
+        directory, or default_path when serving unversioned files. With fallback, default_path is
+        also used when the version does not ship that file (artifacts trained independently)."""
+        pinned = _pinned_snapshot.get()
+        version = pinned.version if pinned is not None else self._snapshot.version
+        if version is None:
+            return default_path
+        path = os.path.join(self.versions_dir, version, os.path.basename(default_path))
+        return default_path if fallback and not os.path.exists(path) else path
+
+    def is_loaded(self, name):
+        artifact = self._artifacts.get(name)
+        return artifact is not None and artifact.info["status"] == LOADED
+
+    def warmup(self):
+        """Loads every registered artifact in registration order, then runs the warmup queries."""
+        self.warmup_started = True
+        start = time.perf_counter()
+        for name in list(self._artifacts):
+            self.get(name)
+        self.warmup_errors = self._run_warmups()
+        self.warmup_time = time.perf_counter() - start
+        self.warmup_done.set()
+        logging.info(f"Model warmup finished in {self.warmup_time:.2f}s (version {self.version})")
+
+    def start_warmup(self):
+        """Runs warmup() in a background thread so the server can accept connections meanwhile."""
+        with self._lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self.warmup, name="model-warmup", daemon=True)
+                self._warmup_thread.start()
+        return self._warmup_thread
+
+    def reload(self, version=None):
+        """Builds every artifact of a version (default: the latest published one) in the calling
+        thread, warms it up and swaps it in. Raises ModelReloadError and keeps the active version
+        when a required artifact cannot be loaded or another reload is running."""
+        version = version if version is not None else latest_version(self.versions_dir)
+        if version is None or not os.path.isfile(os.path.join(self.versions_dir, version, READY_MARKER)):
+            raise ModelReloadError(f"Models version {version!r} is not published under {self.versions_dir}")
+        if not self._reload_lock.acquire(blocking=False):
+            raise ModelReloadError(f"A reload to version {self.reload_in_progress} is already running")
+        self.reload_in_progress = version
+        start = time.perf_counter()
+        try:
+            # a fresh context, so the caller's pinned snapshot (if any) is left untouched
+            staged = contextvars.Context().run(self._stage, version)
+            with self._lock:
+                self._snapshot = ModelSnapshot(version, dict(staged.values))
+                for name, info in staged.info.items():
+                    self._artifacts[name].info = info
+            self.reloads += 1
+            self.last_reload_error = None
+            self.last_reload_time = time.perf_counter() - start
+            logging.info(f"Models version {version} swapped in after {self.last_reload_time:.2f}s")
+        except ModelReloadError as e:
+            self._rejected_versions.add(version)
+            self.last_reload_error = str(e)
+            logging.error(f"Models reload failed, keeping version {self.version}: {e}")
+            raise
+        finally:
+            self.reload_in_progress = None
+            self._reload_lock.release()
+
+    def start_reload(self, version=None):
+        """Runs reload() in a background thread; returns the thread."""
+        def run():
+            try:
+                self.reload(version)
+            except ModelReloadError:
+                pass
+        thread = threading.Thread(target=run, name="model-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def start_watcher(self, poll_seconds):
+        """Polls the versions directory and reloads when a newer version is published.
+        Poll intervals are jittered so several workers do not all rebuild at the same moment."""
+        def watch():
+            while True:
+                time.sleep(poll_seconds * random.uniform(0.5, 1.5))
+                latest = latest_version(self.versions_dir)
+                if latest is None or latest == self.version or latest in self._rejected_versions:
+                    continue
+                if self.version is not None and latest < self.version:
+                    continue
+                try:
+                    self.reload(latest)
+                except ModelReloadError:
+                    pass
+
+        with self._lock:
+            if self._watcher_thread is None:
+                self._watcher_thread = threading.Thread(target=watch, name="model-watcher", daemon=True)
+                self._watcher_thread.start()
+        return self._watcher_thread
+
+    def is_ready(self):
+        """Ready once warmup has finished and every required artifact loaded."""
+        if not self.warmup_done.is_set():
+            return False
+        return all(a.info["status"] == LOADED for a in self._artifacts.values() if a.required)
+
+    def stats(self):
+        """Returns readiness, the active version plus status, load time and memory of every artifact."""
+        return {
+            "ready": self.is_ready(),
+            "version": self.version,
+            "warmup_started": self.warmup_started,
+            "warmup_done": self.warmup_done.is_set(),
+            "warmup_time_s": self.warmup_time,
+            "warmup_errors": dict(self.warmup_errors),
+            "reloads": self.reloads,
+            "reload_in_progress": self.reload_in_progress,
+            "last_reload_time_s": self.last_reload_time,
+            "last_reload_error": self.last_reload_error,
+            # lookups from the event loop answered without the artifact while it was loading
+            "deferred_lookups": self.deferred_lookups,
+            "artifacts": {
+                name: {"required": artifact.required, **artifact.info}
+                for name, artifact in list(self._artifacts.items())
+            },
+        }
+
+    def _stage(self, version):
+        staged = ModelSnapshot(version, staging=True)
+        _pinned_snapshot.set(staged)
+        for name in list(self._artifacts):
+            self.get(name)
+        failed = [name for name, artifact in self._artifacts.items()
+                  if artifact.required and staged.info[name]["status"] != LOADED]
+        if failed:
+            raise ModelReloadError(f"Version {version}: required artifacts not loaded: {', '.join(failed)}")
+        # warm the new version before any request can see it
+        errors = self._run_warmups()
+        if errors:
+            logging.warning(f"Warmup of models version {version} reported errors: {errors}")
+        return staged
+
+    def _run_warmups(self):
+        errors = {}
+        for name, query in list(self._warmups):
+            try:
+                query()
+            except Exception as e:
+                errors[name] = str(e)
+                logging.error(f"Warmup query '{name}' failed: {e}")
+        return errors
+
+    def _load(self, artifact, version):
+        # memory of artifacts loaded from inside this loader (dependencies) is attributed to them, not to us
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0)
+        self._start_tracing()
+        before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        start = time.perf_counter()
+        info = {"status": LOADED, "load_time_s": None, "memory_bytes": None, "error": None}
+        try:
+            value = artifact.loader()
+        except Exception as e:
+            value = None
+            info["error"] = str(e)
+            logging.exception(f"Failed to load model artifact '{artifact.name}'")
+        info["load_time_s"] = time.perf_counter() - start
+        after = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        self._stop_tracing()
+        nested = stack.pop()
+        if self.trace_memory:
+            total = max(after - before, 0)
+            info["memory_bytes"] = max(total - nested, 0)
+            if stack:
+                stack[-1] += total
+
+        label = artifact.name if version is None else f"{artifact.name}@{version}"
+        if info["error"] is not None:
+            info["status"] = FAILED
+        elif value is None:
+            info["status"] = MISSING
+            if artifact.required:
+                logging.error(f"Model artifact '{label}' is missing; dependent features are disabled.")
+            else:
+                logging.warning(f"Optional model artifact '{label}' is missing.")
+        else:
+            memory = f", {info['memory_bytes'] / 1024 ** 2:.1f} MiB" if info["memory_bytes"] is not None else ""
+            logging.info(f"Model artifact '{label}' loaded in {info['load_time_s']:.2f}s{memory}")
+        return value, info
+
+    def _start_tracing(self):
+        # tracing runs only while some artifact is loading; concurrent loads make the per-artifact figures approximate
+        if not self.trace_memory:
+            return
+        with self._lock:
+            if self._tracing_loads == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+            elif self._tracing_loads == 0:
+                self._owns_tracing = False
+            self._tracing_loads += 1
+
+    def _stop_tracing(self):
+        if not self.trace_memory:
+            return
+        with self._lock:
+            self._tracing_loads -= 1
+            if self._tracing_loads == 0 and self._owns_tracing:
+                tracemalloc.stop()
+
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+
+def get_model_registry():
+    """Returns the process-wide registry (MODEL_REGISTRY_TRACE_MEMORY=true adds memory accounting to loads)."""
+    global _shared_registry
+    if _shared_registry is None:
+        with _shared_lock:
+            if _shared_registry is None:
+                trace_memory = os.getenv("MODEL_REGISTRY_TRACE_MEMORY", "false").lower() in ("true", "1", "yes")
+                _shared_registry = ModelRegistry(trace_memory=trace_memory)
+    return _shared_registry
@@ -10,6 +10,10 @@ from nltk.stem import WordNetLemmatizer
 from spellchecker import SpellChecker
 import logging
 import configparser
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -40,67 +44,68 @@ lemmatizer = WordNetLemmatizer()
 stop_words = set(stopwords.words('english'))
 spell = SpellChecker()
 
+# Contraction -> expansion map (for duplicated keys the last entry wins)
+CONTRACTIONS = {
+    "i'm": "i am",
+    "you're": "you are",
+    "he's": "he is",
+    "she's": "she is",
+    "it's": "it is",
+    "we're": "we are",
+    "they're": "they are",
+    "i've": "i have",
+    "you've": "you have",
+    "he's": "he has",
+    "she's": "she has",
+    "we've": "we have",
+    "they've": "they have",
+    "isn't": "is not",
+    "aren't": "are not",
+    "wasn't": "was not",
+    "weren't": "were not",
+    "hasn't": "has not",
+    "haven't": "have not",
+    "don't": "do not",
+    "doesn't": "does not",
+    "didn't": "did not",
+    "can't": "cannot",
+    "couldn't": "could not",
+    "shouldn't": "should not",
+    "mightn't": "might not",
+    "mustn't": "must not",
+    "wouldn't": "would not",
+    "it's": "it is",
+    "let's": "let us",
+    "what's": "what is",
+    "who's": "who is",
+    "here's": "here is",
+    "there's": "there is",
+    "that's": "that is",
+    "how's": "how is",
+    "why's": "why is",
+    "i'll": "i will",
+    "you'll": "you will",
+    "he'll": "he will",
+    "she'll": "she will",
+    "we'll": "we will",
+    "they'll": "they will",
+    "i'd": "i would",
+    "you'd": "you would",
+    "he'd": "he would",
+    "she'd": "she would",
+    "we'd": "we would",
+    "they'd": "they would",
+    "i'm": "i am",
+    "you're": "you are",
+    "he's": "he is"
+    # Add more as needed
+}
+
 def expand_contractions(text):
     """Expands contractions in text."""
-    contractions_dict = {
-        "i'm": "i am",
-        "you're": "you are",
-        "he's": "he is",
-        "she's": "she is",
-        "it's": "it is",
-        "we're": "we are",
-        "they're": "they are",
-        "i've": "i have",
-        "you've": "you have",
-        "he's": "he has",
-        "she's": "she has",
-        "we've": "we have",
-        "they've": "they have",
-        "isn't": "is not",
-        "aren't": "are not",
-        "wasn't": "was not",
-        "weren't": "were not",
-        "hasn't": "has not",
-        "haven't": "have not",
-        "don't": "do not",
-        "doesn't": "does not",
-        "didn't": "did not",
-        "can't": "cannot",
-        "couldn't": "could not",
-        "shouldn't": "should not",
-        "mightn't": "might not",
-        "mustn't": "must not",
-        "wouldn't": "would not",
-        "it's": "it is",
-        "let's": "let us",
-        "what's": "what is",
-        "who's": "who is",
-        "here's": "here is",
-        "there's": "there is",
-        "that's": "that is",
-        "how's": "how is",
-        "why's": "why is",
-        "i'll": "i will",
-        "you'll": "you will",
-        "he'll": "he will",
-        "she'll": "she will",
-        "we'll": "we will",
-        "they'll": "they will",
-        "i'd": "i would",
-        "you'd": "you would",
-        "he'd": "he would",
-        "she'd": "she would",
-        "we'd": "we would",
-        "they'd": "they would",
-        "i'm": "i am",
-        "you're": "you are",
-        "he's": "he is"
-        # Add more as needed
-    }
-    
     # Loop through the dictionary and replace contractions with their expanded forms
     words = text.split()
-    expanded_text = " ".join([contractions_dict.get(word.lower(), word) for word in words])
+    expanded_text = " ".join([CONTRACTIONS.get(word.lower(), word) for word in words])
     return expanded_text
 
 def remove_special_characters(text):
@@ -166,6 +171,92 @@ def preprocess_text(text, expand=True, remove_special=True, correct=False, lemma
 
     return words
 
+# Batched / streaming preprocessing: same output as preprocess_text, with the per-call setup
+# (special-character regexes, stopword sets) done once and lemmas and spell corrections
+# memoized per distinct word. Contractions go through the module-level CONTRACTIONS map.
+
+_SPECIAL_CHARACTERS_RE = re.compile(r'[^\w\s]')
+_DIGITS_RE = re.compile(r'\d+')
+
+@functools.lru_cache(maxsize=200000)
+def _lemmatize_word(word):
+    return lemmatizer.lemmatize(word)
+
+@functools.lru_cache(maxsize=200000)
+def _correct_word(word):
+    return spell.correction(word)
+
+def _preprocess_one(text, expand, remove_special, correct, lemmatize, stopword_set):
+    if not isinstance(text, str):
+        logging.warning(f"Input is not a string: {text}. Returning empty list.")
+        return []
+    text = text.lower()
+    if expand:
+        text = expand_contractions(text)
+    if remove_special:
+        text = _DIGITS_RE.sub('', _SPECIAL_CHARACTERS_RE.sub('', text))
+    words = word_tokenize(text)
+    if correct:
+        words = [_correct_word(word) for word in words]
+    if lemmatize:
+        words = [_lemmatize_word(word) for word in words]
+    if stopword_set is not None:
+        words = [word for word in words if word not in stopword_set]
+    return words
+
+def _preprocess_chunk(texts, options):
+    """Process-pool worker: preprocesses one chunk of texts."""
+    return [_preprocess_one(text, **options) for text in texts]
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def preprocess_stream(texts, expand=True, remove_special=True, correct=False, lemmatize=True, remove_stops=True,
+                      custom_stopwords=None, workers=None, chunk_size=256):
+    """
+    Lazily preprocesses an iterable of texts, yielding one word list per text in input order.
+
+    Output is identical to calling preprocess_text on every text. With workers > 1 the texts
+    are fanned out in chunks over a process pool; at most 2 * workers chunks are in flight,
+    so arbitrarily large inputs are consumed lazily.
+
+    Args:
+        texts (iterable): The input texts.
+        workers (int, optional): Number of worker processes; None or 1 processes in-line.
+        chunk_size (int): Number of texts sent to a worker at a time.
+        Other arguments are as for preprocess_text.
+
+    Yields:
+        list: A list of preprocessed words per input text.
+    """
+    stopword_set = None
+    if remove_stops:
+        stopword_set = stop_words if custom_stopwords is None else stop_words.union(set(custom_stopwords))
+    options = dict(expand=expand, remove_special=remove_special, correct=correct, lemmatize=lemmatize, stopword_set=stopword_set)
+
+    if not workers or workers <= 1:
+        for text in texts:
+            yield _preprocess_one(text, **options)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in _chunks(texts, chunk_size):
+            pending.append(executor.submit(_preprocess_chunk, chunk, options))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def preprocess_batch(texts, **kwargs):
+    """Preprocesses a list of texts; same arguments as preprocess_stream. Returns a list of word lists."""
+    return list(preprocess_stream(texts, **kwargs))
+
 if __name__ == "__main__":
     # Example usage with different options
     sample_text = "This's a tset sentence with running words and 123 for preprocessing! How're you?"
@@ -0,0 +1,262 @@
+# Nearest-question lookup over the SHA Q&A dataset: a FAISS index of question embeddings
+# (sha_index.faiss) plus the ID/Question/Answer records in index order (sha_mapping.json).
+# Besides the exact flat index, IVF-Flat and HNSW builds keep search sub-millisecond as the
+# dataset grows. Query embeddings are pluggable: the Google embedding API in production, a local
+# hashing embedder for tests and offline runs (QA_EMBEDDER=google|local).
+# Build: python -m backend.ai.qa_index --csv sha_dataset.csv --kind hnsw
+# Convert the existing flat index: python -m backend.ai.qa_index --from-index sha_index.faiss --kind ivf
+
+import argparse
+import configparser
+import json
+import logging
+import math
+import os
+import threading
+import time
+import faiss
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from backend.ai.model_registry import get_model_registry
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+qa_index_path = config.get('paths', 'qa_index_file', fallback=os.path.join(models_dir, "sha_index.faiss"))
+qa_mapping_path = config.get('paths', 'qa_mapping_file', fallback=os.path.join(models_dir, "sha_mapping.json"))
+
+INDEX_KINDS = ("flat", "ivf", "hnsw")
+
+
+def normalize_rows(vectors):
+    """float32 copy of the vectors with unit-length rows, so L2 distance ranks like cosine similarity."""
+    vectors = np.array(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return vectors / norms
+
+
+class GoogleEmbedder:
+    """Embeds texts with the Google embedding API (the model the dataset index was built with)."""
+
+    def __init__(self, model="models/embedding-001", api_key=None, dim=768, timeout=None):
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model = model
+        self.dim = dim
+        self.name = model
+        # seconds per API request (None: the library default, no limit)
+        self.timeout = timeout
+
+    def embed(self, texts):
+        request_options = {"timeout": self.timeout} if self.timeout else None
+        response = self._genai.embed_content(model=self.model, content=list(texts), request_options=request_options)
+        return normalize_rows(response["embedding"])
+
+
+class HashingEmbedder:
+    """Local, deterministic stand-in: hashed character n-grams of the text, no network or training."""
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"local-hashing-{dim}"
+        self._vectorizer = HashingVectorizer(n_features=dim, analyzer="char_wb", ngram_range=(3, 4),
+                                             alternate_sign=False, norm="l2")
+
+    def embed(self, texts):
+        return self._vectorizer.transform(list(texts)).toarray().astype(np.float32)
+
+
+def create_embedder():
+    """Builds the query embedder from environment variables (QA_EMBEDDER=google|local, QA_EMBEDDING_MODEL, ...)."""
+    if os.getenv("QA_EMBEDDER", "google").lower() == "local":
+        return HashingEmbedder(dim=int(os.getenv("QA_LOCAL_EMBEDDING_DIM", "256")))
+    # query embeddings sit on the chat path: a stalled request must not hold a worker thread for long
+    return GoogleEmbedder(model=os.getenv("QA_EMBEDDING_MODEL", "models/embedding-001"),
+                          api_key=os.getenv("GOOGLE_GEMINI_API_KEY"),
+                          timeout=float(os.getenv("QA_EMBEDDING_TIMEOUT_SECONDS", "5")) or None)
+
+
+def default_nlist(num_vectors):
+    """IVF list count: about 4 * sqrt(n), with at least 39 training points per list (FAISS' minimum)."""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def build_index(vectors, kind="flat", nlist=None, hnsw_m=32, ef_construction=200):
+    """Builds a flat (exact), IVF-Flat or HNSW L2 index over the vectors, normalized to unit length."""
+    vectors = np.ascontiguousarray(normalize_rows(vectors))
+    dim = vectors.shape[1]
+    start = time.perf_counter()
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "ivf":
+        nlist = nlist or default_nlist(len(vectors))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(vectors)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index kind {kind!r}; expected one of {INDEX_KINDS}.")
+    index.add(vectors)
+    logging.info(f"FAISS {kind} index built over {len(vectors)} vectors in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Sets the speed/recall knobs of approximate indexes (ignored for the others)."""
+    parameters = faiss.ParameterSpace()
+    if nprobe and isinstance(index, faiss.IndexIVF):
+        parameters.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        parameters.set_index_parameter(index, "efSearch", ef_search)
+
+
+def ensure_unit_norm(index, sample=1000):
+    """Flat indexes written before embeddings were normalized (fine_tune_gemini stored the raw API
+    vectors) are rebuilt with unit-length rows, so distances convert to cosine similarity. IVF and
+    HNSW indexes only come from build_index, which normalizes."""
+    if not isinstance(index, faiss.IndexFlat) or index.ntotal == 0:
+        return index
+    norms = np.linalg.norm(index.reconstruct_n(0, min(sample, index.ntotal)), axis=1)
+    if np.allclose(norms[norms > 0], 1.0, atol=1e-3):
+        return index
+    logging.info(f"Normalizing the {index.ntotal} vectors of the flat Q&A index")
+    return build_index(index.reconstruct_n(0, index.ntotal), kind="flat")
+
+
+class QaIndex:
+    """Answers a query with the mapped Answer of its nearest dataset question."""
+
+    def __init__(self, index, records, embedder, min_similarity=0.85):
+        if index.ntotal != len(records):
+            raise ValueError(f"FAISS index holds {index.ntotal} vectors but the mapping {len(records)} records.")
+        if index.d != embedder.dim:
+            raise ValueError(f"FAISS index has {index.d} dimensions but the embedder {embedder.dim}.")
+        self.index = index
+        self.records = records
+        self.embedder = embedder
+        self.min_similarity = min_similarity
+        self._stats_lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.total_search_time = 0.0
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, texts, k=1):
+        """Returns, per text, the k nearest records with their cosine similarity, nearest first."""
+        queries = normalize_rows(self.embedder.embed(texts))
+        start = time.perf_counter()
+        distances, ids = self.index.search(queries, k)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.lookups += len(texts)
+            self.total_search_time += elapsed
+        # for unit vectors the squared L2 distance is 2 - 2 * cosine
+        return [[(self.records[i], 1.0 - float(d) / 2.0) for d, i in zip(row_distances, row_ids) if i >= 0]
+                for row_distances, row_ids in zip(distances, ids)]
+
+    def answers(self, texts):
+        """Per text, the Answer of the nearest question when it is similar enough, else None."""
+        results = []
+        for text, matches in zip(texts, self.search(texts, k=1)):
+            if not matches or matches[0][1] < self.min_similarity:
+                results.append(None)
+                continue
+            record, similarity = matches[0]
+            logging.debug(f"Q&A index hit: '{text}' ~ '{record.get('Question')}' ({similarity:.2f})")
+            results.append(record.get("Answer"))
+        with self._stats_lock:
+            self.hits += sum(result is not None for result in results)
+        return results
+
+    def answer(self, text):
+        """The Answer of the nearest question when it is similar enough, else None."""
+        return self.answers([text])[0]
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "records": len(self),
+                "index_type": type(self.index).__name__,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "avg_search_ms": self.total_search_time / self.lookups * 1000 if self.lookups else 0.0,
+            }
+
+
+def save_qa_index(index, records, index_path, mapping_path):
+    """Writes the FAISS index and the records in index order (the layout fine_tune_gemini writes)."""
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    faiss.write_index(index, index_path)
+    with open(mapping_path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    logging.info(f"Q&A index saved to: {index_path} (mapping: {mapping_path})")
+
+
+def load_qa_index():
+    """Loads the Q&A index and mapping with the configured embedder. None when missing or mismatched."""
+    registry = get_model_registry()
+    # the Q&A dataset is built separately from the retrieval models, like Word2Vec
+    index_path = registry.artifact_path(qa_index_path, fallback=True)
+    mapping_path = registry.artifact_path(qa_mapping_path, fallback=True)
+    if not os.path.exists(index_path) or not os.path.exists(mapping_path):
+        logging.info(f"No Q&A index found at {index_path}")
+        return None
+    try:
+        index = ensure_unit_norm(faiss.read_index(index_path))
+        with open(mapping_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        nprobe = os.getenv("QA_NPROBE")
+        ef_search = os.getenv("QA_EF_SEARCH")
+        set_search_params(index, nprobe=int(nprobe) if nprobe else None, ef_search=int(ef_search) if ef_search else None)
+        qa_index = QaIndex(index, records, create_embedder(), float(os.getenv("QA_MIN_SIMILARITY", "0.85")))
+    except (IOError, RuntimeError, ValueError) as e:
+        logging.error(f"Error loading Q&A index: {e}")
+        return None
+    logging.info(f"Q&A index loaded from: {index_path} ({type(index).__name__}, {len(records)} questions)")
+    return qa_index
+
+
+# optional: without it queries that retrieval cannot answer go straight to Gemini
+get_model_registry().register("qa_index", load_qa_index, required=False)
+
+
+def get_qa_index():
+    """Returns the process-wide Q&A index, loading it on first use. None if unavailable."""
+    return get_model_registry().get("qa_index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FAISS Q&A index served by the API.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="dataset with ID, Question and Answer columns; questions are embedded")
+    source.add_argument("--from-index", help="re-index the vectors of an existing index (e.g. the flat sha_index.faiss)")
+    parser.add_argument("--mapping", default=qa_mapping_path, help="mapping of the existing index (with --from-index)")
+    parser.add_argument("--kind", choices=INDEX_KINDS, default="hnsw")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: about 4 * sqrt(n))")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.csv:
+        from backend.ai.embedding_job import run_embedding_job
+
+        # batched, cached and resumable; see ai/embedding_job.py for more options
+        run_embedding_job(args.csv, create_embedder(), kind=args.kind, batch_size=args.batch_size)
+    else:
+        existing = faiss.read_index(args.from_index)
+        vectors = existing.reconstruct_n(0, existing.ntotal)
+        with open(args.mapping, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        index = build_index(vectors, kind=args.kind, nlist=args.nlist, hnsw_m=args.hnsw_m)
+        save_qa_index(index, records, qa_index_path, qa_mapping_path)
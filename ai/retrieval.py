@@ -1,12 +1,12 @@
 # Implements TF-IDF & Word2Vec for retrieving the most relevant responses from the dataset.
 
-import pickle
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from gensim.models import KeyedVectors
 import logging
 import configparser
 import os
+from backend.ai.corpus_index import get_corpus_index
+from backend.ai.model_registry import get_model_registry
+from backend.ai.sentence_embeddings import get_dense_reranker
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,56 +15,46 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 config = configparser.ConfigParser()
 config.read('config.ini')
 models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
-tfidf_vectorizer_path = os.path.join(models_dir, "tfidf_vectorizer.pkl")
-sentence_tokens_path = os.path.join(models_dir, "sentence_tokens.pkl")
-word2vec_model_path = os.path.join(models_dir, "word2vec_model.bin")
+rerank_top_n = config.getint('word_embedding', 'rerank_top_n', fallback=20)
+word2vec_model_path = config.get('paths', 'word2vec_model_file', fallback=os.path.join(models_dir, "word2vec_model.kv"))
 
-# Load pre-trained models
-try:
-    with open(tfidf_vectorizer_path, "rb") as f:
-        tfidf_vectorizer = pickle.load(f)
-    logging.info(f"TF-IDF vectorizer loaded from: {tfidf_vectorizer_path}")
-except FileNotFoundError:
-    logging.error(f"Error: TF-IDF vectorizer file not found at {tfidf_vectorizer_path}")
-    tfidf_vectorizer = None
-except Exception as e:
-    logging.error(f"Error loading TF-IDF vectorizer: {e}")
-    tfidf_vectorizer = None
+def load_word2vec():
+    """Memory-maps the Word2Vec vectors read-only, so worker processes share one copy. None if the model file is missing."""
+    # Word2Vec is trained separately, so a models version without its own copy uses the shared file
+    file_path = get_model_registry().artifact_path(word2vec_model_path, fallback=True)
+    try:
+        word2vec = KeyedVectors.load(file_path, mmap='r')
+        logging.info(f"Word2Vec model loaded from: {file_path}")
+        return word2vec
+    except FileNotFoundError:
+        logging.error(f"Error: Word2Vec model file not found at {file_path}")
+        return None
 
-try:
-    with open(sentence_tokens_path, "rb") as f:
-        sentence_tokens = pickle.load(f)
-    logging.info(f"Sentence tokens loaded from: {sentence_tokens_path}")
-except FileNotFoundError:
-    logging.error(f"Error: Sentence tokens file not found at {sentence_tokens_path}")
-    sentence_tokens = []
-except Exception as e:
-    logging.error(f"Error loading sentence tokens: {e}")
-    sentence_tokens = []
 
-try:
-    word2vec = KeyedVectors.load_word2vec_format(word2vec_model_path, binary=True)
-    logging.info(f"Word2Vec model loaded from: {word2vec_model_path}")
-except FileNotFoundError:
-    logging.error(f"Error: Word2Vec model file not found at {word2vec_model_path}")
-    word2vec = None
-except Exception as e:
-    logging.error(f"Error loading Word2Vec model: {e}")
-    word2vec = None
+# Word2Vec is only used by this module, so the API does not require it to be ready
+get_model_registry().register("word2vec", load_word2vec, required=False)
+
+
+def get_word2vec():
+    """Returns the process-wide Word2Vec vectors, loading them on first use. None if missing."""
+    return get_model_registry().get("word2vec")
+
 
 def get_response(user_query):
-    """Retrieves the most relevant response using TF-IDF and Word2Vec."""
-    if tfidf_vectorizer is None or not sentence_tokens or word2vec is None:
+    """Retrieves the most relevant response: TF-IDF's top candidates, reranked with the
+    Word2Vec sentence embeddings when they are available."""
+    corpus_index = get_corpus_index()
+    if corpus_index is None:
         return "Error: Chatbot models not loaded properly."
 
-    query_vector_tfidf = tfidf_vectorizer.transform([user_query])
-    tfidf_similarities = np.dot(query_vector_tfidf, tfidf_vectorizer.transform(sentence_tokens).T).toarray()[0]
-    
-    # get the most relevant response
-    response_idx = tfidf_similarities.argmax()
+    # get the most relevant responses
+    candidates, similarities = corpus_index.top_k(user_query, k=rerank_top_n)
     
     # check if the highest similarity is above a certain threshhold
-    if tfidf_similarities[response_idx] > 0.2:
-        return sentence_tokens[response_idx]
+    if candidates.size and similarities[0] > 0.2:
+        reranker = get_dense_reranker()
+        if reranker is not None:
+            candidates, _ = reranker.rerank(user_query, candidates, similarities)
+        return corpus_index.sentence_tokens[candidates[0]]
     else:
         return "I am sorry. Unable to understand you!"
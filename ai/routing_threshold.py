@@ -0,0 +1,128 @@
+# Similarity threshold routing queries between the retrieval answer and the Gemini fallback.
+# The offline tuner (ai/threshold_tuner.py) publishes it as a small JSON file; serving workers
+# re-read the file when it changes, so a new threshold applies without a restart. Every routing
+# decision is counted, so the live fallback rate can be compared with the tuner's target.
+
+import configparser
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+routing_threshold_path = config.get('paths', 'routing_threshold_file', fallback=os.path.join(models_dir, "routing_threshold.json"))
+
+DEFAULT_THRESHOLD = 0.6
+
+
+class RoutingThreshold:
+    """Published routing threshold (checked for changes at most every check_interval seconds)
+    plus lifetime and recent fallback-rate counters."""
+
+    def __init__(self, path, default=DEFAULT_THRESHOLD, check_interval=5.0, window=1000):
+        self.path = path
+        self.default = default
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._threshold = default
+        self._published = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._recent = deque(maxlen=window)
+        self.routed = 0
+        self.fallbacks = 0
+
+    def current(self):
+        """The threshold to route with: the published one, or the default when none is published."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._next_check = now + self.check_interval
+                    self._refresh()
+        return self._threshold
+
+    def record(self, fallbacks, routed=1):
+        """Counts routing decisions; fallbacks of them went past retrieval."""
+        with self._lock:
+            self.routed += routed
+            self.fallbacks += fallbacks
+            self._recent.extend([True] * fallbacks + [False] * (routed - fallbacks))
+
+    def stats(self):
+        with self._lock:
+            recent = sum(self._recent) / len(self._recent) if self._recent else 0.0
+            return {
+                "threshold": self._threshold,
+                "source": "published" if self._published is not None else "default",
+                "published": self._published,
+                "routed": self.routed,
+                "fallbacks": self.fallbacks,
+                "fallback_rate": self.fallbacks / self.routed if self.routed else 0.0,
+                "recent_fallback_rate": recent,
+                "recent_window": len(self._recent),
+            }
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self._published is not None:
+                logging.warning(f"Routing threshold file {self.path} removed; using the default {self.default}")
+            self._threshold, self._published, self._mtime = self.default, None, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                published = json.load(f)
+            threshold = float(published["threshold"])
+            if not 0.0 <= threshold <= 1.0:
+                raise ValueError(f"threshold {threshold} outside [0, 1]")
+        except (IOError, KeyError, TypeError, ValueError) as e:
+            # keep routing with the last good threshold
+            logging.error(f"Ignoring routing threshold file {self.path}: {e}")
+            self._mtime = mtime
+            return
+        if threshold != self._threshold:
+            logging.info(f"Routing threshold changed from {self._threshold} to {threshold} ({self.path})")
+        self._threshold, self._published, self._mtime = threshold, {k: v for k, v in published.items() if k != "distribution"}, mtime
+
+
+def publish_threshold(file_path, threshold, **details):
+    """Atomically writes the threshold file picked up by serving workers."""
+    payload = {"threshold": float(threshold), "published_at": datetime.now(timezone.utc).isoformat(), **details}
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, file_path)
+    logging.info(f"Routing threshold {threshold:.4f} published to: {file_path}")
+    return payload
+
+
+_shared_threshold = None
+_shared_lock = threading.Lock()
+
+
+def get_routing_threshold():
+    """Returns the process-wide routing threshold (ROUTING_THRESHOLD_DEFAULT, ROUTING_THRESHOLD_CHECK_SECONDS)."""
+    global _shared_threshold
+    if _shared_threshold is None:
+        with _shared_lock:
+            if _shared_threshold is None:
+                _shared_threshold = RoutingThreshold(
+                    routing_threshold_path,
+                    default=float(os.getenv("ROUTING_THRESHOLD_DEFAULT", str(DEFAULT_THRESHOLD))),
+                    check_interval=float(os.getenv("ROUTING_THRESHOLD_CHECK_SECONDS", "5")),
+                )
+    return _shared_threshold
@@ -0,0 +1,204 @@
+# Dense sentence embeddings for second-stage reranking: SIF-weighted averages of the Word2Vec
+# vectors of every sentence, with the common component removed (Arora et al., "A Simple but
+# Tough-to-Beat Baseline for Sentence Embeddings"). The float32 matrix is built at training time
+# and memory-mapped at serve time; a query is embedded the same way and only TF-IDF's top-N
+# candidates are scored densely, with one small matrix-vector product.
+# Build: python -m backend.ai.sentence_embeddings
+
+import configparser
+import logging
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+from backend.ai.corpus_index import get_corpus_index
+from backend.ai.model_registry import get_model_registry
+from backend.ai.word2vec_model import tokenize_sentence
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+sentence_embeddings_path = config.get('paths', 'sentence_embeddings_file', fallback=os.path.join(models_dir, "sentence_embeddings.npy"))
+
+FORMAT_VERSION = 1
+
+
+def sif_parameters_path(embeddings_path):
+    """The small file next to the embedding matrix holding the SIF weighting parameters."""
+    return os.path.splitext(embeddings_path)[0] + "_sif.npz"
+
+
+class SifEmbedder:
+    """Embeds texts as SIF-weighted averages of word vectors: each word weighs a / (a + p(word)),
+    and the projection on the corpus' first principal component is removed."""
+
+    def __init__(self, word2vec, a=1e-3, component=None):
+        self.word2vec = word2vec
+        self.a = a
+        self.dim = word2vec.vector_size
+        counts = word2vec.expandos.get("count") if hasattr(word2vec, "expandos") else None
+        if counts is None or not np.sum(counts):
+            # vectors without frequencies (e.g. imported from another format) fall back to a plain average
+            self.word_weights = np.ones(len(word2vec), dtype=np.float32)
+        else:
+            probabilities = np.asarray(counts, dtype=np.float64) / np.sum(counts)
+            self.word_weights = (a / (a + probabilities)).astype(np.float32)
+        self.component = None if component is None else np.asarray(component, dtype=np.float32)
+
+    def raw_embeddings(self, texts):
+        """Weighted average word vectors of the texts, before common-component removal."""
+        key_to_index = self.word2vec.key_to_index
+        indptr = [0]
+        indices = []
+        for text in texts:
+            indices.extend(idx for idx in (key_to_index.get(word) for word in tokenize_sentence(text)) if idx is not None)
+            indptr.append(len(indices))
+        indices = np.array(indices, dtype=np.int64)
+        indptr = np.array(indptr, dtype=np.int64)
+        lengths = np.maximum(np.diff(indptr), 1).astype(np.float32)
+        # one sparse (texts x vocabulary) weight matrix times the vectors computes every average at once
+        weights = sp.csr_matrix((self.word_weights[indices], indices, indptr), shape=(len(texts), len(self.word2vec)))
+        return np.asarray(weights @ self.word2vec.vectors, dtype=np.float32) / lengths[:, None]
+
+    def finalize(self, embeddings):
+        """Removes the common component and L2-normalizes the rows in place; all-zero rows stay zero."""
+        if self.component is not None:
+            embeddings -= np.outer(embeddings @ self.component, self.component)
+        norms = np.linalg.norm(embeddings, axis=1)
+        norms[norms == 0.0] = 1.0
+        embeddings /= norms[:, None]
+        return embeddings
+
+    def embed(self, texts):
+        """Returns an L2-normalized float32 (len(texts), dim) matrix."""
+        return self.finalize(self.raw_embeddings(texts))
+
+
+class DenseReranker:
+    """Reorders TF-IDF candidates by a blend of their TF-IDF and dense (embedding) cosine similarities."""
+
+    def __init__(self, embedder, matrix, dense_weight=0.5):
+        self.embedder = embedder
+        self.matrix = matrix
+        self.dense_weight = dense_weight
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def rerank(self, text, candidates, scores):
+        """Returns (candidates, scores) ordered by the blended score, best first. Without a single
+        known word in the text the TF-IDF order is kept."""
+        candidates = np.asarray(candidates)
+        scores = np.asarray(scores, dtype=np.float32)
+        if not candidates.size:
+            return candidates, scores
+        query = self.embedder.embed([text])[0]
+        if not query.any():
+            return candidates, scores
+        dense = self.matrix[candidates] @ query
+        blended = (1.0 - self.dense_weight) * scores + self.dense_weight * dense
+        # stable, so equal scores keep the TF-IDF order
+        order = np.argsort(-blended, kind="stable")
+        return candidates[order], blended[order]
+
+
+def build_sentence_embeddings(sentence_tokens, word2vec, file_path, a=1e-3, batch_size=10000):
+    """Embeds every sentence into a float32 .npy matrix written batch by batch through a memory map.
+
+    The common component is the top eigenvector of X^T X (dim x dim), accumulated during the first
+    pass, so the corpus embeddings never have to be held in RAM at once."""
+    start = time.perf_counter()
+    embedder = SifEmbedder(word2vec, a=a)
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.tmp.npy"
+    matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(sentence_tokens), embedder.dim))
+    gram = np.zeros((embedder.dim, embedder.dim), dtype=np.float64)
+    for offset in range(0, len(sentence_tokens), batch_size):
+        batch = embedder.raw_embeddings(sentence_tokens[offset:offset + batch_size])
+        matrix[offset:offset + len(batch)] = batch
+        gram += batch.T.astype(np.float64) @ batch
+    eigenvalues, eigenvectors = np.linalg.eigh(gram)
+    embedder.component = eigenvectors[:, -1].astype(np.float32) if eigenvalues[-1] > 0 else None
+    for offset in range(0, len(sentence_tokens), batch_size):
+        matrix[offset:offset + batch_size] = embedder.finalize(np.array(matrix[offset:offset + batch_size]))
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, file_path)
+    np.savez(
+        sif_parameters_path(file_path),
+        version=np.array(FORMAT_VERSION),
+        a=np.array(a),
+        component=embedder.component if embedder.component is not None else np.zeros(0, dtype=np.float32),
+        sentences=np.array(len(sentence_tokens)),
+    )
+    logging.info(f"Sentence embeddings built for {len(sentence_tokens)} sentences in {time.perf_counter() - start:.2f}s: {file_path}")
+    return embedder
+
+
+def open_sentence_embeddings(file_path, word2vec, dense_weight=0.5):
+    """Memory-maps a saved embedding matrix read-only; returns a DenseReranker or None if missing."""
+    try:
+        with np.load(sif_parameters_path(file_path)) as parameters:
+            if int(parameters["version"]) != FORMAT_VERSION:
+                logging.warning(f"Sentence embeddings at {file_path} have an old format version; ignoring them.")
+                return None
+            component = parameters["component"] if parameters["component"].size else None
+            embedder = SifEmbedder(word2vec, a=float(parameters["a"]), component=component)
+        matrix = np.load(file_path, mmap_mode="r")
+    except FileNotFoundError:
+        logging.info(f"No sentence embeddings found at {file_path}")
+        return None
+    except (IOError, KeyError, ValueError) as e:
+        logging.error(f"Error loading sentence embeddings: {e}")
+        return None
+    if matrix.shape[1] != embedder.dim:
+        logging.warning(f"Sentence embeddings at {file_path} have {matrix.shape[1]} dimensions, the Word2Vec "
+                        f"vectors {embedder.dim}; ignoring them.")
+        return None
+    logging.info(f"Sentence embeddings mapped from: {file_path}")
+    return DenseReranker(embedder, matrix, dense_weight)
+
+
+def load_dense_reranker():
+    """Maps the sentence embeddings of the active models. None without Word2Vec vectors, without
+    embeddings, or when the embeddings were built for another corpus."""
+    # retrieval imports this module for the reranker, so its loader is imported late
+    from backend.ai.retrieval import get_word2vec
+
+    registry = get_model_registry()
+    word2vec = get_word2vec()
+    corpus_index = get_corpus_index()
+    if word2vec is None or corpus_index is None:
+        return None
+    # like Word2Vec, the embeddings may be built separately from a models version
+    reranker = open_sentence_embeddings(registry.artifact_path(sentence_embeddings_path, fallback=True), word2vec,
+                                        config.getfloat('word_embedding', 'rerank_dense_weight', fallback=0.5))
+    if reranker is not None and len(reranker) != len(corpus_index):
+        logging.warning(f"Sentence embeddings cover {len(reranker)} sentences, the corpus has {len(corpus_index)}; "
+                        f"rebuild them with python -m backend.ai.sentence_embeddings.")
+        return None
+    return reranker
+
+
+# optional: without it retrieval returns the TF-IDF ranking as is
+get_model_registry().register("dense_reranker", load_dense_reranker, required=False)
+
+
+def get_dense_reranker():
+    """Returns the process-wide reranker, mapping it on first use. None if unavailable."""
+    return get_model_registry().get("dense_reranker")
+
+
+if __name__ == "__main__":
+    from backend.ai.retrieval import get_word2vec
+
+    corpus_index = get_corpus_index()
+    word2vec = get_word2vec()
+    if corpus_index is None or word2vec is None:
+        logging.error("Sentence embeddings not built: the TF-IDF models and the Word2Vec vectors are both required.")
+    else:
+        build_sentence_embeddings(list(corpus_index.sentence_tokens), word2vec, sentence_embeddings_path)
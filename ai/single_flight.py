@@ -0,0 +1,77 @@
+# Single-flight coalescing of identical concurrent calls: while a call for a key is in flight,
+# further callers with the same key wait for its result instead of making their own. Results and
+# errors are shared only with the callers waiting at the time; nothing is kept once the call
+# finishes (caching is the answer cache's job). Every caller waits with its own timeout, and a
+# caller that gives up or is cancelled does not cancel the shared call for the others.
+
+import asyncio
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one call (asyncio, one event loop per worker)."""
+
+    def __init__(self, name="single_flight"):
+        self.name = name
+        self._flights = {}
+        self.calls = 0
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.max_waiters = 0
+
+    def in_flight(self, key):
+        """Whether a call for the key is running (in this event loop)."""
+        return self._current(key) is not None
+
+    async def do(self, key, call, timeout=None):
+        """Returns the result of call() for the key, sharing a call already in flight.
+        Raises the shared call's exception, or asyncio.TimeoutError once this caller's timeout expires."""
+        self.calls += 1
+        flight = self._current(key)
+        if flight is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(call())
+            flight = self._flights[key] = [task, 1]
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+            flight[1] += 1
+            self.max_waiters = max(self.max_waiters, flight[1])
+        try:
+            # shielded: this caller's timeout or cancellation leaves the call running for the others
+            return await asyncio.wait_for(asyncio.shield(flight[0]), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def _current(self, key):
+        flight = self._flights.get(key)
+        # a flight left behind by a closed event loop can never complete here
+        if flight is not None and flight[0].get_loop() is not asyncio.get_running_loop():
+            return None
+        return flight
+
+    def _finish(self, key, task):
+        if self._flights.get(key, [None])[0] is task:
+            del self._flights[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logging.debug(f"{self.name}: shared call for '{key}' failed: {task.exception()}")
+
+    def stats(self):
+        """Returns caller, upstream call and coalescing counters."""
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / self.calls if self.calls else 0.0,
+            "errors": self.errors,
+            "waiter_timeouts": self.timeouts,
+            "in_flight": len(self._flights),
+            "max_waiters": self.max_waiters,
+        }
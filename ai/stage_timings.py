@@ -0,0 +1,66 @@
+# Wall time of the stages of a chat request (spell correction, cleaning, retrieval, answer cache
+# lookup, Gemini, DB write) and the path that answered it. Routes create one StageTimings per request
+# and thread it through the hybrid model like the deadline; the history recorder stores it with the
+# interaction (chat_history latency columns) and the rollup job turns it into latency histograms.
+
+import time
+from contextlib import contextmanager
+
+STAGES = ("spell", "clean", "retrieval", "cache", "gemini", "db")
+# retrieval: TF-IDF match above the threshold; qa: Q&A dataset; cache: answer cache; gemini:
+# generated; degraded: Gemini failed or ran out of time (best retrieval answer or an apology)
+PATHS = ("retrieval", "qa", "cache", "gemini", "degraded")
+
+
+class StageTimings:
+    """Per-stage wall times of one request, or of one batch of inputs (which share the stages)."""
+
+    def __init__(self, size=1):
+        self.started = time.perf_counter()
+        self.finished = None
+        # stage -> seconds; a stage the request never reached stays absent
+        self.durations = {}
+        self.paths = [None] * size
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def mark(self, path, position=0):
+        """Records which path answered the input at position."""
+        self.paths[position] = path
+
+    def finish(self):
+        """Stops the request clock (once the answer is ready, before the row is handed to the recorder)."""
+        if self.finished is None:
+            self.finished = time.perf_counter()
+        return self
+
+    def columns(self, position=0):
+        """ChatHistory latency columns in milliseconds (None for skipped stages). db_ms is stamped by
+        the history recorder, which owns the write."""
+        self.finish()
+        columns = {f"{stage}_ms": self.durations[stage] * 1000 if stage in self.durations else None
+                   for stage in STAGES if stage != "db"}
+        columns["total_ms"] = (self.finished - self.started) * 1000
+        columns["answer_path"] = self.paths[position]
+        return columns
+
+
+@contextmanager
+def timed(timings, stage):
+    """timings.stage(stage), or nothing for callers that do not measure (timings None)."""
+    if timings is None:
+        yield
+        return
+    with timings.stage(stage):
+        yield
+
+
+def mark_path(timings, path, position=0):
+    if timings is not None:
+        timings.mark(path, position)
@@ -0,0 +1,256 @@
+# Symmetric-delete (SymSpell-style) spell corrector built from the English frequency list plus
+# the fitted TF-IDF vocabulary, so SHA/NHIF domain terms are known words and never "corrected".
+# The delete index is stored as sorted hash/word-id arrays, so it is compact and saves/loads as .npz.
+# Build: python -m backend.ai.symspell
+
+import configparser
+import functools
+import logging
+import os
+import re
+import time
+import zlib
+import numpy as np
+from backend.ai.corpus_index import get_corpus_index
+from backend.ai.model_registry import get_model_registry
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read('config.ini')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+symspell_index_path = config.get('paths', 'symspell_index_file', fallback=os.path.join(models_dir, "symspell_index.npz"))
+
+FORMAT_VERSION = 1
+# leading punctuation, alphabetic core, trailing punctuation ("regster?" -> "", "regster", "?")
+TOKEN_PATTERN = re.compile(r"(\W*)([^\W\d_]+)(\W*)")
+
+
+def _deletes_by_level(word, max_distance):
+    """Strings reachable from word by deleting exactly 0, 1, ..., max_distance characters, one set per level."""
+    levels = [{word}]
+    for _ in range(max_distance):
+        next_level = set()
+        for item in levels[-1]:
+            if len(item) > 1:
+                next_level.update(item[:i] + item[i + 1:] for i in range(len(item)))
+        levels.append(next_level)
+    return levels
+
+
+def _deletes(word, max_distance):
+    """All strings reachable from word by deleting up to max_distance characters (word included)."""
+    return set().union(*_deletes_by_level(word, max_distance))
+
+
+def _hash(text):
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def osa_distance(source, target, max_distance):
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions), or max_distance + 1 if larger."""
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        row_min = i
+        for j in range(1, len(target) + 1):
+            cost = 0 if source[i - 1] == target[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and source[i - 1] == target[j - 2] and source[i - 2] == target[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= max_distance else max_distance + 1
+
+
+class SymSpell:
+    """Spell corrector answering from a precomputed symmetric-delete index with a bounded memo."""
+
+    def __init__(self, words, frequencies, delete_hashes, delete_word_ids, max_distance=2, prefix_length=7,
+                 signature=0, memo_size=10000):
+        self.words = words
+        self.frequencies = frequencies
+        self.delete_hashes = delete_hashes
+        self.delete_word_ids = delete_word_ids
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.signature = signature
+        self._word_index = {word: idx for idx, word in enumerate(words)}
+        self.word_lengths = np.fromiter((len(word) for word in words), dtype=np.int64, count=len(words))
+        self.lookup = functools.lru_cache(maxsize=memo_size)(self._lookup)
+
+    @classmethod
+    def build(cls, frequencies, max_distance=2, prefix_length=7, signature=0, memo_size=10000):
+        """Builds the delete index from a {word: frequency} mapping."""
+        start = time.perf_counter()
+        words = sorted(frequencies)
+        counts = np.array([frequencies[word] for word in words], dtype=np.int64)
+        hashes = []
+        word_ids = []
+        for idx, word in enumerate(words):
+            for delete in _deletes(word[:prefix_length], max_distance):
+                hashes.append(_hash(delete))
+                word_ids.append(idx)
+        hashes = np.array(hashes, dtype=np.uint32)
+        word_ids = np.array(word_ids, dtype=np.int32)
+        order = np.argsort(hashes, kind="stable")
+        index = cls(words, counts, hashes[order], word_ids[order], max_distance, prefix_length, signature, memo_size)
+        logging.info(f"SymSpell index built: {len(words)} words, {hashes.size} deletes in {time.perf_counter() - start:.2f}s")
+        return index
+
+    def correct(self, word):
+        """Returns the correction for a word; known words, non-alphabetic tokens and words without candidates are kept.
+        Punctuation around the word (a raw whitespace-split token such as "regster?") is kept around the correction."""
+        match = TOKEN_PATTERN.fullmatch(word) if word else None
+        if match is None:
+            return word
+        leading, core, trailing = match.groups()
+        lowered = core.lower()
+        if lowered in self._word_index:
+            return word
+        correction = self.lookup(lowered)
+        return leading + correction + trailing if correction is not None else word
+
+    def is_known(self, word):
+        return word.lower() in self._word_index
+
+    def _lookup(self, word):
+        # a word at edit distance d shares a delete with the input at input-delete level <= d,
+        # so levels are searched in order and the search stops once a level cannot improve the best match
+        seen = set()
+        best = None
+        best_key = None
+        for level, deletes in enumerate(_deletes_by_level(word[:self.prefix_length], self.max_distance)):
+            if best_key is not None and best_key[0] <= level - 1:
+                break
+            if not deletes:
+                continue
+            hashes = np.fromiter((_hash(d) for d in deletes), dtype=np.uint32, count=len(deletes))
+            lows = np.searchsorted(self.delete_hashes, hashes, side="left")
+            highs = np.searchsorted(self.delete_hashes, hashes, side="right")
+            candidates = [self.delete_word_ids[low:high] for low, high in zip(lows, highs) if high > low]
+            if not candidates:
+                continue
+            candidates = np.unique(np.concatenate(candidates))
+            candidates = candidates[np.abs(self.word_lengths[candidates] - len(word)) <= self.max_distance]
+            for idx in candidates.tolist():
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                distance = osa_distance(word, self.words[idx], self.max_distance)
+                if distance > self.max_distance:
+                    continue
+                # closest first, then most frequent, then alphabetical
+                key = (distance, -int(self.frequencies[idx]), idx)
+                if best_key is None or key < best_key:
+                    best, best_key = self.words[idx], key
+        return best
+
+    def save(self, file_path):
+        """Saves the index to an .npz file (words as one UTF-8 blob)."""
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            np.savez(
+                file_path,
+                version=np.array(FORMAT_VERSION),
+                words=np.frombuffer("\n".join(self.words).encode("utf-8"), dtype=np.uint8),
+                frequencies=self.frequencies,
+                delete_hashes=self.delete_hashes,
+                delete_word_ids=self.delete_word_ids,
+                params=np.array([self.max_distance, self.prefix_length, self.signature], dtype=np.int64),
+            )
+            logging.info(f"SymSpell index saved successfully to: {file_path}")
+        except IOError as e:
+            logging.error(f"Error saving SymSpell index: {e}")
+
+    @classmethod
+    def load(cls, file_path, memo_size=10000):
+        """Loads an index saved with save(); returns None when missing or of another format version."""
+        try:
+            with np.load(file_path) as data:
+                if int(data["version"]) != FORMAT_VERSION:
+                    logging.warning(f"SymSpell index at {file_path} has an old format version; ignoring it.")
+                    return None
+                words = data["words"].tobytes().decode("utf-8").split("\n")
+                max_distance, prefix_length, signature = (int(v) for v in data["params"])
+                index = cls(words, data["frequencies"], data["delete_hashes"], data["delete_word_ids"],
+                            max_distance, prefix_length, signature, memo_size)
+            logging.info(f"SymSpell index loaded from: {file_path}")
+            return index
+        except FileNotFoundError:
+            logging.info(f"No SymSpell index found at {file_path}")
+        except (IOError, KeyError, ValueError) as e:
+            logging.error(f"Error loading SymSpell index: {e}")
+        return None
+
+
+def vocabulary_signature(vocabulary):
+    """Checksum of the domain vocabulary, used to detect an index built for another TF-IDF model."""
+    return zlib.crc32("\n".join(sorted(vocabulary)).encode("utf-8"))
+
+
+def build_frequencies(domain_vocabulary):
+    """English word frequencies (pyspellchecker list) plus the domain vocabulary."""
+    from spellchecker import SpellChecker
+
+    frequencies = dict(SpellChecker().word_frequency.dictionary)
+    # domain terms get the median English frequency: known, and reasonable correction targets
+    domain_frequency = int(np.median(list(frequencies.values()))) if frequencies else 1
+    for term in domain_vocabulary:
+        if term.isalpha():
+            frequencies.setdefault(term.lower(), domain_frequency)
+    return frequencies
+
+
+def build_spell_corrector(domain_vocabulary, file_path=None):
+    """Builds a SymSpell index for the domain vocabulary and optionally saves it."""
+    spell_index = SymSpell.build(build_frequencies(domain_vocabulary), signature=vocabulary_signature(domain_vocabulary))
+    if file_path:
+        spell_index.save(file_path)
+    return spell_index
+
+
+def load_spell_corrector():
+    """Loads the saved index when it matches the TF-IDF vocabulary, else builds and saves a new one."""
+    corpus_index = get_corpus_index()
+    domain_vocabulary = list(corpus_index.vectorizer.vocabulary_) if corpus_index is not None else []
+    signature = vocabulary_signature(domain_vocabulary)
+    registry = get_model_registry()
+    # the signature check makes a shared index file safe to try; rebuilt indexes go with the models version
+    spell_index = SymSpell.load(registry.artifact_path(symspell_index_path, fallback=True))
+    if spell_index is None or spell_index.signature != signature:
+        spell_index = build_spell_corrector(domain_vocabulary, registry.artifact_path(symspell_index_path))
+    return spell_index
+
+
+# optional: without it user input is passed through uncorrected
+get_model_registry().register("spell_corrector", load_spell_corrector, required=False)
+
+
+def get_spell_corrector():
+    """Returns the process-wide corrector, loading or building it on first use. None if that failed."""
+    return get_model_registry().get("spell_corrector")
+
+
+def _warm_spell_corrector():
+    # a cold lookup runs the delete search and the distance code once before the first request
+    spell_index = get_spell_corrector()
+    if spell_index is not None:
+        spell_index.correct("helth")
+
+
+get_model_registry().add_warmup("spell_corrector", _warm_spell_corrector)
+
+
+if __name__ == "__main__":
+    corpus_index = get_corpus_index()
+    vocabulary = list(corpus_index.vectorizer.vocabulary_) if corpus_index is not None else []
+    build_spell_corrector(vocabulary, symspell_index_path)
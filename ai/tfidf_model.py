@@ -1,11 +1,19 @@
 
 # Specifically trains and saves the TF-IDF model to process user queries.
 
+import argparse
 import pickle
 from sklearn.feature_extraction.text import TfidfVectorizer
 import logging
 import os
 import configparser
+from backend.ai.corpus_index import CorpusIndex
+from backend.ai.inverted_index import build_postings
+from backend.ai.mmap_index import write_index
+from backend.ai.model_registry import mark_version_ready, new_version_dir
+from backend.ai.retrieval import get_word2vec
+from backend.ai.sentence_embeddings import build_sentence_embeddings, sentence_embeddings_path
+from backend.ai.symspell import build_spell_corrector, symspell_index_path
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,6 +25,8 @@ config.read('config.ini')
 # Define model save path from config (with default)
 tfidf_vectorizer_path = config.get('paths', 'tfidf_vectorizer_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/tfidf_vectorizer.pkl')
 sentence_tokens_path = config.get('paths', 'sentence_tokens_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/sentence_tokens.pkl')
+corpus_matrix_path = config.get('paths', 'corpus_matrix_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/corpus_tfidf.npz')
+retrieval_index_path = config.get('paths', 'retrieval_index_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/retrieval_index.bin')
 
 def load_sentence_tokens(file_path):
     """Loads the sentence tokens from a pickle file."""
@@ -35,14 +45,22 @@ def load_sentence_tokens(file_path):
         logging.error(f"Error unpickling sentence tokens: {e}")
         return None
 
-def train_tfidf(sentence_tokens, save_path):
-    """Trains the TF-IDF vectorizer and saves it."""
+def train_tfidf(sentence_tokens, save_path, matrix_path=None, index_path=None):
+    """Trains the TF-IDF vectorizer and saves it, along with the precomputed corpus matrix
+    and the memory-mappable retrieval index file. Returns the vectorizer."""
     if sentence_tokens:
         logging.info("Starting TF-IDF model training...")
         vectorizer = TfidfVectorizer()
         vectorizer.fit(sentence_tokens)
         logging.info("TF-IDF model training complete.")
         save_tfidf_model(vectorizer, save_path)
+        if matrix_path or index_path:
+            corpus_index = CorpusIndex(sentence_tokens, vectorizer)
+            if matrix_path:
+                corpus_index.save(matrix_path)
+            if index_path:
+                save_retrieval_index(corpus_index, index_path)
+        return vectorizer
     else:
         logging.warning("No sentence tokens provided for TF-IDF training.")
 
@@ -58,10 +76,68 @@ def save_tfidf_model(vectorizer, file_path):
     except pickle.PickleError as e:
         logging.error(f"Error pickling TF-IDF vectorizer: {e}")
 
+def save_retrieval_index(corpus_index, file_path):
+    """Writes the corpus matrix, vocabulary, IDF, sentences and inverted-index postings to one mappable file."""
+    try:
+        write_index(file_path, corpus_index.sentence_tokens, corpus_index.vectorizer, corpus_index.matrix,
+                    postings=build_postings(corpus_index.matrix))
+    except (IOError, ValueError) as e:
+        logging.error(f"Error saving retrieval index: {e}")
+
+def save_sentence_embeddings(sentence_tokens, file_path):
+    """Builds the dense reranking embeddings of the sentences when Word2Vec vectors have been trained."""
+    word2vec = get_word2vec()
+    if word2vec is None:
+        logging.info("No Word2Vec vectors; skipping the sentence embeddings (retrieval will not rerank).")
+        return
+    try:
+        build_sentence_embeddings(list(sentence_tokens), word2vec, file_path)
+    except (IOError, ValueError) as e:
+        logging.error(f"Error saving sentence embeddings: {e}")
+
+def publish_version(sentence_tokens, corpus_index, extra_writers=()):
+    """Writes the models of a corpus index into a new version directory and publishes it for hot
+    reload by the API. extra_writers are called with the version directory before publishing."""
+    version_dir = new_version_dir()
+    paths = [os.path.join(version_dir, os.path.basename(path)) for path in
+             (sentence_tokens_path, tfidf_vectorizer_path, corpus_matrix_path, retrieval_index_path)]
+    with open(paths[0], "wb") as f:
+        pickle.dump(sentence_tokens, f)
+    save_tfidf_model(corpus_index.vectorizer, paths[1])
+    corpus_index.save(paths[2])
+    save_retrieval_index(corpus_index, paths[3])
+    # ship the spell index for the new vocabulary too, so serving workers do not rebuild it on reload
+    build_spell_corrector(list(corpus_index.vectorizer.vocabulary_), os.path.join(version_dir, os.path.basename(symspell_index_path)))
+    save_sentence_embeddings(sentence_tokens, os.path.join(version_dir, os.path.basename(sentence_embeddings_path)))
+    for writer in extra_writers:
+        writer(version_dir)
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        logging.error(f"Models version not published, files missing: {missing}")
+        return None
+    mark_version_ready(version_dir)
+    return version_dir
+
+def publish_tfidf_version(sentence_tokens):
+    """Trains the TF-IDF vectorizer and publishes it as a new models version."""
+    logging.info("Starting TF-IDF model training...")
+    vectorizer = TfidfVectorizer()
+    vectorizer.fit(sentence_tokens)
+    logging.info("TF-IDF model training complete.")
+    return publish_version(sentence_tokens, CorpusIndex(sentence_tokens, vectorizer))
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the TF-IDF model and the retrieval index.")
+    parser.add_argument("--publish", action="store_true",
+                        help="write a new version under the models versions directory for the API to hot reload")
+    args = parser.parse_args()
+
     logging.info("Starting TF-IDF model training process...")
     sentence_tokens = load_sentence_tokens(sentence_tokens_path)
-    if sentence_tokens:
-        train_tfidf(sentence_tokens, tfidf_vectorizer_path)
+    if sentence_tokens and args.publish:
+        publish_tfidf_version(sentence_tokens)
+    elif sentence_tokens:
+        train_tfidf(sentence_tokens, tfidf_vectorizer_path, corpus_matrix_path, retrieval_index_path)
+        save_sentence_embeddings(sentence_tokens, sentence_embeddings_path)
     else:
         logging.error("TF-IDF model training failed due to issues with sentence tokens.")
\ No newline at end of file
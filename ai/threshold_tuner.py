@@ -0,0 +1,141 @@
+# Offline tuner of the retrieval/Gemini routing threshold. Logged ChatHistory queries are replayed
+# through the serving preprocessing and the retrieval scorer; the distribution of their best
+# similarity gives the fallback rate every threshold would have produced. For a target fallback
+# rate, or for a mean latency budget, the tuner recommends a threshold and can publish it for the
+# serving workers to pick up at runtime (ai/routing_threshold.py).
+# Dry run: python -m backend.ai.threshold_tuner --target-fallback-rate 0.3
+# Publish: python -m backend.ai.threshold_tuner --latency-budget-ms 800 --gemini-latency-ms 2500 --publish
+
+import argparse
+import logging
+import time
+import numpy as np
+from backend.ai.corpus_index import get_corpus_index
+from backend.ai.hybrid_model import preprocess_text
+from backend.ai.model_registry import get_model_registry
+from backend.ai.routing_threshold import publish_threshold, routing_threshold_path
+from backend.app.utils import clean_text, correct_spelling_batch
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CANDIDATE_THRESHOLDS = np.round(np.arange(0.1, 1.0, 0.1), 2)
+
+
+def load_logged_queries(limit=10000):
+    """The original text of the most recent logged chat queries."""
+    from backend.app.db import SessionLocal
+    from backend.app.models import ChatHistory
+
+    db = SessionLocal()
+    try:
+        rows = (db.query(ChatHistory.query).filter(ChatHistory.query.isnot(None))
+                .order_by(ChatHistory.id.desc()).limit(limit).all())
+    finally:
+        db.close()
+    return [row[0] for row in rows if row[0] and row[0].strip()]
+
+
+def replay(queries, batch_size=1000):
+    """Best retrieval similarity of every query, preprocessed like the chat routes do, and the
+    mean single-query retrieval latency (ms) measured on a sample."""
+    corpus_index = get_corpus_index()
+    if corpus_index is None:
+        raise RuntimeError("No retrieval models found to replay the queries against.")
+    scores = np.empty(len(queries))
+    for offset in range(0, len(queries), batch_size):
+        batch = queries[offset:offset + batch_size]
+        processed = [preprocess_text(clean_text(text)) for text in correct_spelling_batch(batch)]
+        _, scores[offset:offset + len(batch)] = corpus_index.best_matches(processed)
+    sample = [preprocess_text(clean_text(text)) for text in correct_spelling_batch(queries[:200])]
+    start = time.perf_counter()
+    for text in sample:
+        corpus_index.best_match(text)
+    retrieval_ms = (time.perf_counter() - start) * 1000 / len(sample) if sample else 0.0
+    return scores, retrieval_ms
+
+
+def fallback_rate(scores, threshold):
+    """Share of queries whose best similarity is below the threshold (and so go to Gemini)."""
+    return float(np.mean(scores < threshold)) if scores.size else 0.0
+
+
+def threshold_for_fallback_rate(scores, target_rate, min_threshold=0.0, max_threshold=1.0):
+    """Highest threshold whose fallback rate does not exceed the target, clamped to [min, max]."""
+    ordered = np.sort(scores)
+    allowed = int(np.floor(target_rate * ordered.size))
+    # below ordered[allowed] are at most `allowed` scores; with none left to route, anything above the maximum works
+    threshold = ordered[allowed] if allowed < ordered.size else max_threshold
+    return float(np.clip(threshold, min_threshold, max_threshold))
+
+
+def fallback_rate_for_latency(latency_budget_ms, retrieval_ms, gemini_ms):
+    """Fallback rate keeping the mean latency (retrieval always, plus Gemini for fallbacks) within budget."""
+    if gemini_ms <= 0:
+        return 1.0
+    return float(np.clip((latency_budget_ms - retrieval_ms) / gemini_ms, 0.0, 1.0))
+
+
+def distribution(scores):
+    """Percentiles of the best similarity and the fallback rate of round thresholds."""
+    percentiles = (5, 10, 25, 50, 75, 90, 95)
+    return {
+        "percentiles": {f"p{p}": float(np.percentile(scores, p)) for p in percentiles} if scores.size else {},
+        "fallback_rate_at": {f"{t:.1f}": fallback_rate(scores, t) for t in CANDIDATE_THRESHOLDS},
+    }
+
+
+def recommend(scores, retrieval_ms, target_fallback_rate=None, latency_budget_ms=None, gemini_ms=2500.0,
+              min_threshold=0.2, max_threshold=0.9):
+    """Threshold recommendation for a target fallback rate or a mean latency budget."""
+    if target_fallback_rate is None:
+        target_fallback_rate = fallback_rate_for_latency(latency_budget_ms, retrieval_ms, gemini_ms)
+    threshold = threshold_for_fallback_rate(scores, target_fallback_rate, min_threshold, max_threshold)
+    rate = fallback_rate(scores, threshold)
+    return {
+        "threshold": threshold,
+        "target_fallback_rate": target_fallback_rate,
+        "expected_fallback_rate": rate,
+        "expected_mean_latency_ms": retrieval_ms + rate * gemini_ms,
+        "latency_budget_ms": latency_budget_ms,
+        "gemini_latency_ms": gemini_ms,
+        "retrieval_latency_ms": retrieval_ms,
+        "queries": int(scores.size),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the similarity threshold routing queries to Gemini.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target-fallback-rate", type=float, help="share of queries allowed to go to Gemini (0-1)")
+    target.add_argument("--latency-budget-ms", type=float, help="mean end-to-end latency to stay within")
+    parser.add_argument("--gemini-latency-ms", type=float, default=2500.0, help="mean Gemini round trip")
+    parser.add_argument("--limit", type=int, default=10000, help="most recent logged queries to replay")
+    parser.add_argument("--queries-file", default=None, help="replay one query per line from a file instead of the DB")
+    parser.add_argument("--min-threshold", type=float, default=0.2, help="never serve retrieval answers below this")
+    parser.add_argument("--max-threshold", type=float, default=0.9)
+    parser.add_argument("--publish", action="store_true", help=f"write the threshold to {routing_threshold_path}")
+    args = parser.parse_args()
+
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()][:args.limit]
+    else:
+        queries = load_logged_queries(args.limit)
+    if not queries:
+        logging.error("No logged queries to replay.")
+        raise SystemExit(1)
+    scores, retrieval_ms = replay(queries)
+    result = recommend(scores, retrieval_ms, args.target_fallback_rate, args.latency_budget_ms, args.gemini_latency_ms,
+                       args.min_threshold, args.max_threshold)
+    stats = distribution(scores)
+    print(f"Replayed {len(queries)} queries (retrieval {retrieval_ms:.2f}ms per query)")
+    print("best similarity: " + "  ".join(f"{k} {v:.3f}" for k, v in stats["percentiles"].items()))
+    print("fallback rate:   " + "  ".join(f"@{k} {v:.1%}" for k, v in stats["fallback_rate_at"].items()))
+    print(f"recommended threshold {result['threshold']:.4f}: fallback rate {result['expected_fallback_rate']:.1%} "
+          f"(target {result['target_fallback_rate']:.1%}), mean latency ~{result['expected_mean_latency_ms']:.0f}ms")
+    if args.publish:
+        publish_threshold(routing_threshold_path, result.pop("threshold"), index_version=get_model_registry().version,
+                          distribution=stats, **result)
+    else:
+        print("Dry run; pass --publish to apply it to the serving workers.")
@@ -1,12 +1,22 @@
 
 #   training the chatbot model. Prepares data, vectorizes text, and saves trained models.
 
+import argparse
 import pickle
+import re
+import sys
+import time
 import nltk
 from nltk.tokenize import sent_tokenize
 import logging
 import os
 import configparser  
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -17,6 +27,12 @@ config.read('config.ini')  # Create a config.ini file in the backend directory
 # Define data and model paths from config (with defaults)
 data_path = config.get('paths', 'data_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/datasets/data.txt')
 sentence_tokens_path = config.get('paths', 'sentence_tokens_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/sentence_tokens.pkl')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+sentences_path = config.get('paths', 'sentences_file', fallback=os.path.join(models_dir, "sentences.txt"))
+
+DATA_FILE_EXTENSIONS = (".txt", ".md")
+# a blank line (possibly with whitespace) separates paragraphs; sentences never span one
+PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n")
 
 def download_nltk_resources():
     """Downloads necessary NLTK resources if not already present."""
@@ -63,15 +79,148 @@ def save_tokens(tokens, file_path):
     except IOError as e:
         logging.error(f"Error saving sentence tokens: {e}")
 
+def data_files(path):
+    """The data file itself, or every text file under a data directory in a stable order."""
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(DATA_FILE_EXTENSIONS))
+    return files
+
+def iter_paragraph_chunks(file_paths, chunk_size=4 * 1024 * 1024):
+    """Reads the files in blocks and yields (text, bytes_read) chunks of about chunk_size characters that end
+    on a paragraph break, so no sentence is split between two chunks. Memory stays bounded by a few chunks."""
+    for file_path in file_paths:
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+            buffer = ""
+            while True:
+                block = f.read(chunk_size)
+                if block:
+                    buffer += block
+                    if len(buffer) < chunk_size:
+                        continue
+                    breaks = [m.end() for m in PARAGRAPH_BREAK.finditer(buffer, len(buffer) // 2)]
+                    # without a paragraph break fall back to a line break, and only then to a hard cut
+                    cut = breaks[-1] if breaks else buffer.rfind("\n", len(buffer) // 2) + 1
+                    if cut <= 0:
+                        if len(buffer) < 4 * chunk_size:
+                            continue
+                        cut = len(buffer)
+                    chunk, buffer = buffer[:cut], buffer[cut:]
+                else:
+                    chunk, buffer = buffer, ""
+                if chunk.strip():
+                    yield chunk, len(chunk.encode("utf-8"))
+                if not block and not buffer:
+                    break
+
+def segment_chunk(text):
+    """Process-pool worker: splits one chunk into sentences, one line each."""
+    download_nltk_resources()
+    # the output file holds one sentence per line, so line breaks inside a sentence become spaces
+    return [" ".join(sentence.split("\n")) for sentence in sent_tokenize(text)]
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its largest finished worker, in MB (None if unknown)."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+def segment_to_file(data_path, output_path, workers=None, chunk_size=4 * 1024 * 1024):
+    """
+    Streams the data file (or directory) through sentence segmentation into a sentence-per-line file.
+
+    Chunks are segmented on a process pool with at most 2 * workers chunks in flight and written
+    in input order as they complete, so neither the text nor the sentence list is ever held in full.
+
+    Returns:
+        dict: Sentences written, MB read, elapsed seconds, MB/s and peak RSS.
+    """
+    workers = workers or os.cpu_count() or 1
+    file_paths = data_files(data_path)
+    if not file_paths:
+        raise FileNotFoundError(f"No data files found at {data_path}")
+    download_nltk_resources()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    start = time.perf_counter()
+    bytes_read = 0
+    sentences = 0
+
+    def write(out, future):
+        nonlocal sentences
+        lines = future.result()
+        out.writelines(line + "\n" for line in lines)
+        sentences += len(lines)
+
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        if workers <= 1:
+            for chunk, size in iter_paragraph_chunks(file_paths, chunk_size):
+                lines = segment_chunk(chunk)
+                out.writelines(line + "\n" for line in lines)
+                sentences += len(lines)
+                bytes_read += size
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for chunk, size in iter_paragraph_chunks(file_paths, chunk_size):
+                    pending.append(executor.submit(segment_chunk, chunk))
+                    bytes_read += size
+                    if len(pending) >= 2 * workers:
+                        write(out, pending.popleft())
+                while pending:
+                    write(out, pending.popleft())
+    os.replace(tmp_path, output_path)
+
+    elapsed = time.perf_counter() - start
+    rss, worker_rss = peak_rss_mb()
+    stats = {
+        "files": len(file_paths),
+        "sentences": sentences,
+        "mb_read": bytes_read / (1024 * 1024),
+        "elapsed_s": elapsed,
+        "mb_per_s": bytes_read / (1024 * 1024) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": rss,
+        "peak_worker_rss_mb": worker_rss,
+    }
+    logging.info(f"Segmented {stats['mb_read']:.1f} MB from {stats['files']} file(s) into {sentences} sentences "
+                 f"in {elapsed:.1f}s ({stats['mb_per_s']:.2f} MB/s)")
+    if rss is not None:
+        logging.info(f"Peak RSS: {rss:.0f} MB (main), {worker_rss:.0f} MB (largest worker)")
+    return stats
+
+def read_sentences(file_path):
+    """Lazily yields the sentences of a sentence-per-line file."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the dataset into sentences for training.")
+    parser.add_argument("--data", default=data_path, help="data file or directory of .txt/.md files")
+    parser.add_argument("--workers", type=int, default=None, help="segmentation processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=float, default=4.0, help="approximate size of the chunks sent to workers")
+    parser.add_argument("--no-pickle", action="store_true",
+                        help="only write the sentence-per-line file, not the pickled list (for corpora that do not fit in RAM)")
+    args = parser.parse_args()
+
     logging.info("Starting training process...")
-    text_data = load_data(data_path)
-    if text_data:
-        sentence_tokens = tokenize_sentences(text_data)
-        if sentence_tokens:
-            save_tokens(sentence_tokens, sentence_tokens_path)
-            logging.info("Training complete!")
-        else:
-            logging.warning("No sentence tokens were generated.")
+    try:
+        stats = segment_to_file(args.data, sentences_path, workers=args.workers, chunk_size=int(args.chunk_mb * 1024 * 1024))
+    except (FileNotFoundError, IOError) as e:
+        logging.error(f"Training failed due to data loading issues: {e}")
+        raise SystemExit(1)
+    if not stats["sentences"]:
+        logging.warning("No sentence tokens were generated.")
+    elif not args.no_pickle:
+        save_tokens(list(read_sentences(sentences_path)), sentence_tokens_path)
+        logging.info("Training complete!")
     else:
-        logging.error("Training failed due to data loading issues.")
\ No newline at end of file
+        logging.info(f"Training complete! Sentences written to: {sentences_path}")
@@ -1,11 +1,16 @@
-
 # Specifically trains and saves the Word2Vec embeddings for response selection.
+# Training streams a tokenized sentence-per-line corpus (gensim corpus_file mode), so it scales
+# over all cores without holding the corpus in memory. The vectors are saved in the native
+# KeyedVectors format, which retrieval memory-maps read-only.
+# Train: python -m backend.ai.train_model && python -m backend.ai.word2vec_model
+import argparse
 import nltk
-import pickle
 import logging
 import os
+import time
 import configparser
 import gensim
+from gensim.models.callbacks import CallbackAny2Vec
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,78 +20,100 @@ config = configparser.ConfigParser()
 config.read('config.ini')
 
 # Define data and model paths from config (with defaults)
-data_path = config.get('paths', 'data_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/datasets/data.txt')
-word2vec_model_path = config.get('paths', 'word2vec_model_file', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/word2vec_model.pkl')
+models_dir = config.get('paths', 'models_dir', fallback='D:/RETRIEVAL-SHA-CHATBOT/models/')
+sentences_path = config.get('paths', 'sentences_file', fallback=os.path.join(models_dir, "sentences.txt"))
+word2vec_corpus_path = config.get('paths', 'word2vec_corpus_file', fallback=os.path.join(models_dir, "word2vec_corpus.txt"))
+word2vec_model_path = config.get('paths', 'word2vec_model_file', fallback=os.path.join(models_dir, "word2vec_model.kv"))
 
-def download_nltk_resources():
-    """Downloads necessary NLTK resources if not already present."""
-    try:
-        nltk.word_tokenize("example")
-    except LookupError:
-        logging.info("Downloading NLTK 'punkt' resource...")
-        nltk.download('punkt')
-        nltk.download('punkt_tab')
-        logging.info("NLTK 'punkt' resource downloaded.")
+def tokenize_sentence(sentence):
+    """Lowercased word tokens of one sentence (the input is already sentence-split, so punkt is not needed)."""
+    return nltk.word_tokenize(sentence.lower(), preserve_line=True)
 
-def load_data(file_path):
-    """Loads text data from the specified file."""
-    try:
-        with open(file_path, "r", errors="ignore") as f:
-            raw_doc = f.read().lower()
-        logging.info(f"Data loaded successfully from: {file_path}")
-        return raw_doc
-    except FileNotFoundError:
-        logging.error(f"Error: Data file not found at {file_path}")
-        return None
-    except IOError as e:
-        logging.error(f"Error reading data file: {e}")
-        return None
+def write_corpus_file(sentences_file, corpus_file):
+    """Streams a sentence-per-line file into gensim's corpus_file format: one sentence of
+    space-separated tokens per line. Returns the number of sentences and tokens written."""
+    os.makedirs(os.path.dirname(corpus_file) or ".", exist_ok=True)
+    sentences = 0
+    tokens = 0
+    tmp_path = f"{corpus_file}.tmp"
+    with open(sentences_file, "r", encoding="utf-8", errors="ignore") as src, \
+            open(tmp_path, "w", encoding="utf-8") as out:
+        for line in src:
+            words = tokenize_sentence(line)
+            if words:
+                out.write(" ".join(words) + "\n")
+                sentences += 1
+                tokens += len(words)
+    os.replace(tmp_path, corpus_file)
+    logging.info(f"Word2Vec corpus written to {corpus_file}: {sentences} sentences, {tokens} tokens.")
+    return sentences, tokens
 
-def tokenize_words(text):
-    """Tokenizes the text into words using NLTK."""
-    if text:
-        download_nltk_resources()
-        word_tokens = nltk.word_tokenize(text)
-        logging.info(f"Text tokenized into {len(word_tokens)} words.")
-        return word_tokens
-    return []
+class EpochLogger(CallbackAny2Vec):
+    """Logs the duration and throughput of every training epoch."""
 
-def train_word2vec_model(tokens, vector_size=100, window=5, min_count=1, workers=4):
-    """Trains the Word2Vec model."""
-    if tokens:
-        logging.info("Starting Word2Vec model training...")
-        model = gensim.models.Word2Vec([tokens], vector_size=vector_size, window=window, min_count=min_count, workers=workers)
-        logging.info("Word2Vec model training complete.")
-        return model
-    else:
+    def __init__(self):
+        self.epoch = 0
+        self.epoch_times = []
+        self._start = 0.0
+
+    def on_epoch_begin(self, model):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, model):
+        elapsed = time.perf_counter() - self._start
+        self.epoch += 1
+        self.epoch_times.append(elapsed)
+        words_per_s = model.corpus_total_words / elapsed if elapsed else 0.0
+        logging.info(f"Word2Vec epoch {self.epoch}/{model.epochs}: {elapsed:.2f}s, {words_per_s:,.0f} words/s")
+
+def train_word2vec_model(corpus_file, vector_size=100, window=5, min_count=1, workers=None, epochs=5):
+    """Trains Word2Vec on a corpus_file; every worker thread reads its own slice of the file."""
+    if not os.path.exists(corpus_file) or not os.path.getsize(corpus_file):
         logging.warning("No word tokens available for training Word2Vec model.")
         return None
+    workers = workers or os.cpu_count() or 1
+    logging.info(f"Starting Word2Vec model training with {workers} workers...")
+    epoch_logger = EpochLogger()
+    start = time.perf_counter()
+    model = gensim.models.Word2Vec(corpus_file=corpus_file, vector_size=vector_size, window=window,
+                                   min_count=min_count, workers=workers, epochs=epochs, callbacks=[epoch_logger])
+    elapsed = time.perf_counter() - start
+    total_words = model.corpus_total_words * epochs
+    logging.info(f"Word2Vec model training complete: {len(model.wv)} words in the vocabulary, {elapsed:.1f}s in total, "
+                 f"{total_words / elapsed:,.0f} words/s overall.")
+    return model
 
 def save_model(model, file_path):
-    """Saves the trained Word2Vec model to a pickle file."""
+    """Saves the trained word vectors in the native KeyedVectors format. The arrays are stored
+    as separate .npy files next to it, so they can be memory-mapped on load."""
     if model:
         try:
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(file_path, "wb") as f:
-                pickle.dump(model, f)
-            logging.info(f"Word2Vec model saved successfully to: {file_path}")
+            model.wv.save(file_path, sep_limit=0)
+            logging.info(f"Word2Vec vectors saved successfully to: {file_path}")
         except IOError as e:
-            logging.error(f"Error saving Word2Vec model: {e}")
+            logging.error(f"Error saving Word2Vec vectors: {e}")
     else:
         logging.warning("No Word2Vec model to save.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Word2Vec vectors on the sentence-per-line corpus.")
+    parser.add_argument("--sentences", default=sentences_path, help="sentence-per-line file written by train_model")
+    parser.add_argument("--workers", type=int, default=None, help="training threads (default: CPU count)")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--vector-size", type=int, default=100)
+    parser.add_argument("--min-count", type=int, default=1)
+    args = parser.parse_args()
+
     logging.info("Starting Word2Vec model training process...")
-    raw_text = load_data(data_path)
-    if raw_text:
-        word_tokens = tokenize_words(raw_text)
-        if word_tokens:
-            word2vec_model = train_word2vec_model(word_tokens)
-            if word2vec_model:
-                save_model(word2vec_model, word2vec_model_path)
-            else:
-                logging.error("Word2Vec model training failed.")
-        else:
-            logging.warning("No word tokens were generated. Skipping Word2Vec training.")
+    try:
+        write_corpus_file(args.sentences, word2vec_corpus_path)
+    except (FileNotFoundError, IOError) as e:
+        logging.error(f"Word2Vec model training failed due to data loading issues: {e}")
+        raise SystemExit(1)
+    word2vec_model = train_word2vec_model(word2vec_corpus_path, vector_size=args.vector_size, min_count=args.min_count,
+                                          workers=args.workers, epochs=args.epochs)
+    if word2vec_model:
+        save_model(word2vec_model, word2vec_model_path)
     else:
-        logging.error("Word2Vec model training failed due to data loading issues.")
\ No newline at end of file
+        logging.error("Word2Vec model training failed.")
@@ -0,0 +1,28 @@
+"""Add index_version to chat_history
+
+Revision ID: 7c1e5a2b9d34
+Revises: 4af98d4f91da
+Create Date: 2026-10-17 11:02:15.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e5a2b9d34'
+down_revision: Union[str, None] = '4af98d4f91da'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_history', sa.Column('index_version', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chat_history', 'index_version')
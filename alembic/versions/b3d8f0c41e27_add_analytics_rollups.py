@@ -0,0 +1,61 @@
+"""Add analytics rollup tables
+
+Revision ID: b3d8f0c41e27
+Revises: 7c1e5a2b9d34
+Create Date: 2026-10-17 11:45:03.271940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d8f0c41e27'
+down_revision: Union[str, None] = '7c1e5a2b9d34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'rollup_daily_queries',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('queries', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day'),
+    )
+    op.create_table(
+        'rollup_user_queries',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('queries', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_table(
+        'rollup_question_counts',
+        sa.Column('normalized_query', sa.String(), nullable=False),
+        sa.Column('question', sa.String(), nullable=True),
+        sa.Column('queries', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('normalized_query'),
+    )
+    op.create_index(op.f('ix_rollup_question_counts_queries'), 'rollup_question_counts', ['queries'], unique=False)
+    op.create_table(
+        'rollup_watermark',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.Column('pending_max_id', sa.Integer(), nullable=False),
+        sa.Column('rows_rolled_up', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    # existing history is rolled up by: python -m backend.app.rollups --backfill
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rollup_watermark')
+    op.drop_index(op.f('ix_rollup_question_counts_queries'), table_name='rollup_question_counts')
+    op.drop_table('rollup_question_counts')
+    op.drop_table('rollup_user_queries')
+    op.drop_table('rollup_daily_queries')
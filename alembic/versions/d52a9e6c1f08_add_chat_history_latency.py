@@ -0,0 +1,45 @@
+"""Add chat_history stage latencies and the latency histogram rollup
+
+Revision ID: d52a9e6c1f08
+Revises: b3d8f0c41e27
+Create Date: 2026-10-17 12:20:41.905316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd52a9e6c1f08'
+down_revision: Union[str, None] = 'b3d8f0c41e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LATENCY_COLUMNS = ('spell_ms', 'clean_ms', 'retrieval_ms', 'gemini_ms', 'db_ms', 'total_ms')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_history', sa.Column('answer_path', sa.String(), nullable=True))
+    for column in LATENCY_COLUMNS:
+        op.add_column('chat_history', sa.Column(column, sa.Float(), nullable=True))
+    op.create_table(
+        'rollup_latency_histogram',
+        sa.Column('hour', sa.DateTime(), nullable=False),
+        sa.Column('stage', sa.String(), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('bucket', sa.Integer(), nullable=False),
+        sa.Column('queries', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('hour', 'stage', 'path', 'bucket'),
+    )
+    # rows written before this revision have no latencies and add nothing to the histograms
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rollup_latency_histogram')
+    for column in reversed(LATENCY_COLUMNS):
+        op.drop_column('chat_history', column)
+    op.drop_column('chat_history', 'answer_path')
@@ -0,0 +1,28 @@
+"""Add the answer cache lookup stage to chat_history
+
+Revision ID: f19c3b7a8e52
+Revises: d52a9e6c1f08
+Create Date: 2026-10-17 14:05:12.630174
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f19c3b7a8e52'
+down_revision: Union[str, None] = 'd52a9e6c1f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_history', sa.Column('cache_ms', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chat_history', 'cache_ms')
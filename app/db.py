@@ -1,11 +1,17 @@
 # Database configuration for logging chat history
 
 from sqlalchemy import create_engine, MetaData
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import exc as sa_exc
 from fastapi import HTTPException
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # load environment variables
@@ -33,14 +39,136 @@ if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set, CHeck env file")
 
 
+# connection pool settings, shared by the sync and async engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "1", "yes")
+
+# async drivers of the configured database (asyncpg for Postgres, aiosqlite for local SQLite)
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+class PoolMetrics:
+    """Connection checkout wait times and pool timeouts of one engine."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_checked_out = 0
+        self.pool = None
+
+    def record(self, wait, timed_out=False, checked_out=0):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.max_checked_out = max(self.max_checked_out, checked_out)
+            # anything beyond a millisecond had to queue for a connection
+            if wait > 0.001:
+                self.waited += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(DB_MAX_OVERFLOW, 0)
+            stats.update({
+                "pool_size": pool.size(),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                # share of the pool (including overflow) in use; at 1.0 requests queue for connections
+                "saturation": pool.checkedout() / capacity if capacity > 0 else None,
+                "peak_saturation": self.max_checked_out / capacity if capacity > 0 else None,
+            })
+        return stats
+
+
+def _metered(pool_class, metrics):
+    """Pool class timing every connection checkout into the metrics."""
+
+    class MeteredPool(pool_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            metrics.pool = self
+
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except sa_exc.TimeoutError:
+                metrics.record(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.record(time.perf_counter() - start, checked_out=self.checkedout())
+            return connection
+
+    MeteredPool.__name__ = f"Metered{pool_class.__name__}"
+    return MeteredPool
+
+
+def pool_options(url, pool_class, metrics):
+    """Pooling keyword arguments for an engine on the url (in-memory SQLite keeps its own pool)."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": _metered(pool_class, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def async_database_url(url):
+    """DATABASE_URL with its async driver (an explicit async driver is kept)."""
+    url = make_url(url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    elif url.drivername.startswith("postgresql+") and url.drivername != "postgresql+asyncpg":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url
+
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
 try:
-    # create a database engine
-    engine = create_engine(DATABASE_URL)
+    # create a database engine (scripts, migrations and background threads)
+    engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, QueuePool, sync_pool_metrics))
+    # and the async engine used by the API routes, so queries never block the event loop
+    async_engine = create_async_engine(async_database_url(DATABASE_URL),
+                                       **pool_options(DATABASE_URL, AsyncAdaptedQueuePool, async_pool_metrics))
 except SQLAlchemyError as e:
     raise HTTPException(status_code=500, detail=f"Database connection error: {e}")
 
 # Create a new session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# objects stay usable after commit without another round trip
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def pool_stats():
+    """Checkout wait and saturation of the sync and async connection pools."""
+    return {"sync": sync_pool_metrics.stats(), "async": async_pool_metrics.stats()}
 
 
 # Create the base class for the ORM
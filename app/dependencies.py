@@ -1,9 +1,12 @@
 
-from fastapi import Depends, HTTPException, status
+import hmac
+from fastapi import Depends, Header, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from backend.app.db import SessionLocal
-from typing import Generator, Optional
+from backend.app.db import AsyncSessionLocal, SessionLocal
+from backend.app.config import Config
+from typing import AsyncGenerator, Generator, Optional
 
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
@@ -13,4 +16,20 @@ def get_db() -> Generator[Session, None, None]:
         db.rollback()
         raise HTTPException(status_code=500, detail="Database connection error")
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Async session for async routes: queries and commits never block the event loop."""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except SQLAlchemyError as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail="Database connection error")
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Admin endpoints require the X-Admin-Token header to match ADMIN_API_TOKEN (disabled when unset)."""
+    if not Config.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, Config.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
@@ -0,0 +1,274 @@
+# Write-behind persistence of chat interactions: routes enqueue ChatHistory rows and return, a
+# background task writes them in bulk inserts once HISTORY_BATCH_SIZE rows are queued or
+# HISTORY_FLUSH_SECONDS have passed. A full queue slows callers down (backpressure) instead of
+# growing without bound. Rows that cannot be written are spilled to HISTORY_SPILL_FILE (JSON lines)
+# when set, and replayed into the database once it accepts writes again; the replay records how far
+# it got after every committed batch, so an interrupted replay resumes instead of writing rows twice.
+# Every row is stamped with db_ms, the request's share of the DB write stage: handing the row over,
+# backpressure waits included (the write itself happens behind the response, see stats()).
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from backend.app.db import AsyncSessionLocal
+from backend.app.models import ChatHistory
+from backend.app.utils import logger
+
+# queued by stop() behind the pending rows
+_STOP = object()
+
+
+class ChatHistoryRecorder:
+    """Queues ChatHistory rows in memory and flushes them in bulk from a background task."""
+
+    def __init__(self, batch_size=200, flush_interval=1.0, max_queue=10000, enqueue_timeout=0.5, spill_path=None,
+                 session_factory=AsyncSessionLocal):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.spill_path = spill_path
+        self.session_factory = session_factory
+        self._queue = None
+        self._task = None
+        self.enqueued = 0
+        self.backpressure_waits = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.flush_errors = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.total_flush_time = 0.0
+
+    def start(self):
+        """Starts the flusher in the running event loop."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Chat history recorder started (batch {self.batch_size}, every {self.flush_interval}s)")
+
+    async def record(self, **values):
+        """Queues one ChatHistory row. Waits up to enqueue_timeout while the queue is full, then
+        spills the row (or drops it without a spill file) rather than blocking the response."""
+        start = time.perf_counter()
+        self.start()
+        values.setdefault("timestamp", datetime.utcnow())
+        values["db_ms"] = (time.perf_counter() - start) * 1000
+        try:
+            self._queue.put_nowait(values)
+        except asyncio.QueueFull:
+            self.backpressure_waits += 1
+            # the wait ends once the flusher makes room; it stamps db_ms when it takes the row
+            values["_queued_at"] = start
+            try:
+                await asyncio.wait_for(self._queue.put(values), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Chat history queue full ({self.max_queue} rows); not waiting for the database")
+                del values["_queued_at"]
+                values["db_ms"] = (time.perf_counter() - start) * 1000
+                await self._spill([values])
+                return
+        self.enqueued += 1
+
+    async def record_many(self, rows):
+        for values in rows:
+            await self.record(**values)
+
+    async def stop(self):
+        """Flushes everything queued and stops the flusher (call on shutdown)."""
+        if self._task is None:
+            return
+        if not self._task.done():
+            # queued behind the pending rows, so they are all written first
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+        logger.info(f"Chat history recorder stopped ({self.flushed} rows written, {self.spilled} spilled)")
+
+    async def _run(self):
+        while True:
+            rows, closing = await self._collect()
+            if rows:
+                try:
+                    await self._flush(rows)
+                except Exception as e:
+                    # the spill file is not writable either: the rows are lost, the recorder keeps going
+                    self.dropped += len(rows)
+                    logger.error(f"Dropped {len(rows)} chat history rows: {e}")
+            if closing:
+                return
+
+    async def _collect(self):
+        """The next batch: up to batch_size rows, waiting at most flush_interval after the first one.
+        Also tells whether the stop marker was reached."""
+        rows = []
+        deadline = None
+        while len(rows) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                values = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if values is _STOP:
+                return rows, True
+            queued_at = values.pop("_queued_at", None)
+            if queued_at is not None:
+                values["db_ms"] = (time.perf_counter() - queued_at) * 1000
+            rows.append(values)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return rows, False
+
+    async def _flush(self, rows):
+        start = time.perf_counter()
+        try:
+            await self._insert(rows)
+        except Exception as e:
+            # not only database errors: whatever kept the rows out of the database, keep them for a replay
+            self.flush_errors += 1
+            logger.error(f"Could not write {len(rows)} chat history rows: {e}")
+            await self._spill(rows)
+            return
+        self.flushed += len(rows)
+        self.batches += 1
+        self.total_flush_time += time.perf_counter() - start
+        # the database accepts writes again: bring back what was spilled while it did not
+        if self.spill_path and (os.path.exists(self.spill_path) or os.path.exists(f"{self.spill_path}.replay")):
+            try:
+                await self._replay_spill()
+            except Exception as e:
+                # the batch above is written; the spilled rows stay on disk for the next replay
+                logger.error(f"Replaying spilled chat history failed: {e}")
+
+    async def _insert(self, rows):
+        # an executemany needs the same columns in every row (replayed rows may predate a column)
+        columns = set().union(*rows)
+        rows = [{column: values.get(column) for column in columns} for values in rows]
+        # one executemany INSERT for the whole batch, no per-row refresh
+        async with self.session_factory() as db:
+            await db.execute(insert(ChatHistory), rows)
+            await db.commit()
+
+    async def _spill(self, rows):
+        if not self.spill_path:
+            self.dropped += len(rows)
+            logger.error(f"Dropped {len(rows)} chat history rows (no HISTORY_SPILL_FILE configured)")
+            return
+        await asyncio.to_thread(_append_json_lines, self.spill_path, rows)
+        self.spilled += len(rows)
+
+    async def _replay_spill(self):
+        replay_path = f"{self.spill_path}.replay"
+        progress_path = f"{replay_path}.offset"
+        # a leftover replay file means an earlier replay was interrupted; finish it first
+        if not os.path.exists(replay_path):
+            os.replace(self.spill_path, replay_path)
+        # rows spilled meanwhile stay in the spill file for the next replay
+        start = await asyncio.to_thread(_read_offset, progress_path)
+        rows, offsets = await asyncio.to_thread(_read_json_lines, replay_path, start)
+        replayed = 0
+        try:
+            for first in range(0, len(rows), self.batch_size):
+                batch = rows[first:first + self.batch_size]
+                await self._insert(batch)
+                # committed: the next replay starts after these rows
+                await asyncio.to_thread(_write_offset, progress_path, offsets[first + len(batch) - 1])
+                replayed += len(batch)
+        except SQLAlchemyError as e:
+            # keep the file; the next replay resumes after the last committed batch
+            logger.error(f"Replaying spilled chat history failed after {replayed} rows: {e}")
+            return
+        finally:
+            self.replayed += replayed
+        os.remove(replay_path)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        logger.info(f"Replayed {replayed} spilled chat history rows from {self.spill_path}")
+
+    def stats(self):
+        """Returns queue, flush, spill and backpressure counters."""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "avg_batch_size": self.flushed / self.batches if self.batches else 0.0,
+            "avg_flush_ms": self.total_flush_time / self.batches * 1000 if self.batches else 0.0,
+            "flush_errors": self.flush_errors,
+            "backpressure_waits": self.backpressure_waits,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+        }
+
+
+def _append_json_lines(path, rows):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for values in rows:
+            f.write(json.dumps({**values, "timestamp": values["timestamp"].isoformat()}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_json_lines(path, start=0):
+    """Rows of a spill file from byte offset start, and the byte offset after each row."""
+    rows, offsets = [], []
+    with open(path, "rb") as f:
+        f.seek(start)
+        for line in iter(f.readline, b""):
+            if not line.strip():
+                continue
+            try:
+                values = json.loads(line)
+            except json.JSONDecodeError:
+                # a torn last line from a crash mid-write
+                logger.warning(f"Skipping a malformed line in {path}")
+                continue
+            values["timestamp"] = datetime.fromisoformat(values["timestamp"])
+            rows.append(values)
+            offsets.append(f.tell())
+    return rows, offsets
+
+
+def _read_offset(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_offset(path, offset):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_shared_recorder = None
+
+
+def get_history_recorder():
+    """Returns the process-wide recorder (HISTORY_BATCH_SIZE, HISTORY_FLUSH_SECONDS, HISTORY_QUEUE_SIZE,
+    HISTORY_ENQUEUE_TIMEOUT_SECONDS, HISTORY_SPILL_FILE)."""
+    global _shared_recorder
+    if _shared_recorder is None:
+        _shared_recorder = ChatHistoryRecorder(
+            batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "200")),
+            flush_interval=float(os.getenv("HISTORY_FLUSH_SECONDS", "1")),
+            max_queue=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+            enqueue_timeout=float(os.getenv("HISTORY_ENQUEUE_TIMEOUT_SECONDS", "0.5")),
+            spill_path=os.getenv("HISTORY_SPILL_FILE") or None,
+        )
+    return _shared_recorder
@@ -0,0 +1,77 @@
+# Latency histograms of chat interactions, per stage (ai/stage_timings.py, plus "total") and answer
+# path. Buckets are log-spaced: bucket i holds durations in (MIN_MS * GROWTH^(i-1), MIN_MS * GROWTH^i]
+# (bucket 0 everything up to MIN_MS), so a percentile read from bucket counts is within GROWTH - 1
+# (10%) of the exact one, and histograms of different hours, workers or paths add up by their counts.
+
+import math
+from collections import Counter
+from sqlalchemy import case
+from backend.ai.stage_timings import STAGES
+
+MIN_MS = 0.1
+GROWTH = 1.1
+MAX_MS = 600000.0
+# the last bucket also takes anything slower than MAX_MS
+BUCKETS = math.ceil(math.log(MAX_MS / MIN_MS) / math.log(GROWTH)) + 1
+LATENCY_STAGES = STAGES + ("total",)
+# rows written before the answer path was recorded
+UNKNOWN_PATH = "unknown"
+
+
+def bucket_of(ms):
+    if ms <= MIN_MS:
+        return 0
+    return min(BUCKETS - 1, math.ceil(math.log(ms / MIN_MS) / math.log(GROWTH)))
+
+
+def bucket_upper(bucket):
+    return MIN_MS * GROWTH ** bucket
+
+
+def bucket_expression(column):
+    """bucket_of() of a duration column as a SQL expression, so histograms can be counted in SQL."""
+    return case(*[(column <= bucket_upper(bucket), bucket) for bucket in range(BUCKETS - 1)], else_=BUCKETS - 1)
+
+
+def latency_counts(rows, hour_of=None):
+    """Histogram counts {(hour, stage, path, bucket): n} of chat_history rows with latency columns
+    (answer_path, <stage>_ms, total_ms); rows without measurements add nothing."""
+    counts = Counter()
+    for row in rows:
+        hour = hour_of(row.timestamp) if hour_of is not None else None
+        path = row.answer_path or UNKNOWN_PATH
+        for stage in LATENCY_STAGES:
+            ms = getattr(row, f"{stage}_ms")
+            if ms is not None:
+                counts[(hour, stage, path, bucket_of(ms))] += 1
+    return counts
+
+
+def truncate_to_hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0) if timestamp is not None else None
+
+
+def percentiles(counts, quantiles=(50, 90, 99)):
+    """{"samples", "p50_ms", ...} of a histogram {bucket: n}, interpolated geometrically within the
+    bucket holding each rank (None without samples)."""
+    total = sum(counts.values())
+    summary = {"samples": total}
+    ordered = sorted(counts.items())
+    for quantile in quantiles:
+        summary[f"p{quantile}_ms"] = _quantile(ordered, total, quantile / 100) if total else None
+    return summary
+
+
+def _quantile(ordered, total, fraction):
+    rank = fraction * total
+    seen = 0
+    for bucket, n in ordered:
+        if seen + n >= rank:
+            upper = bucket_upper(bucket)
+            within = (rank - seen) / n
+            if bucket == 0:
+                return upper * within
+            lower = upper / GROWTH
+            return lower * GROWTH ** within
+        seen += n
+    return bucket_upper(ordered[-1][0])
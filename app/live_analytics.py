@@ -0,0 +1,266 @@
+# Live analytics fed from the chat path: heavy-hitter questions (Space-Saving) and question
+# frequencies (Count-Min) since startup, distinct visitors (HyperLogLog), and per-minute buckets
+# holding the same summaries in small form for sliding windows. Memory is bounded whatever the
+# traffic; error bounds are in app/sketches.py and are reported with every answer.
+# With LIVE_ANALYTICS_DIR set, every worker dumps its state there every LIVE_ANALYTICS_DUMP_SECONDS
+# and merges the other workers' dumps into its answers, so any worker serves the whole picture.
+
+import json
+import os
+import socket
+import threading
+import time
+from backend.ai.answer_cache import normalize_query
+from backend.app.sketches import CountMinSketch, HyperLogLog, SpaceSaving
+from backend.app.utils import logger
+
+
+class LiveAnalytics:
+    """Streaming summaries of chat queries since startup and over a sliding window of time buckets."""
+
+    def __init__(self, bucket_seconds=60, window_buckets=60, top_k=200, bucket_top_k=50, cms_width=2048, cms_depth=5,
+                 hll_p=12, bucket_hll_p=10):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.top_k = top_k
+        self.bucket_top_k = bucket_top_k
+        self.bucket_hll_p = bucket_hll_p
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.queries = 0
+        self.top = SpaceSaving(top_k)
+        self.frequencies = CountMinSketch(cms_width, cms_depth)
+        self.visitors = HyperLogLog(hll_p)
+        # bucket number (epoch seconds // bucket_seconds, aligned across workers) -> summaries
+        self.buckets = {}
+
+    def record(self, query, visitor=None, now=None):
+        """Adds one chat query (and who asked it, if known) to every summary."""
+        key = normalize_query(query) if query else ""
+        if not key:
+            return
+        number = int((now or time.time()) // self.bucket_seconds)
+        with self._lock:
+            self.queries += 1
+            self.top.add(key, label=query)
+            self.frequencies.add(key)
+            bucket = self._bucket(number)
+            bucket["queries"] += 1
+            bucket["top"].add(key, label=query)
+            if visitor:
+                self.visitors.add(visitor)
+                bucket["visitors"].add(visitor)
+
+    def _bucket(self, number):
+        bucket = self.buckets.get(number)
+        if bucket is None:
+            bucket = self.buckets[number] = {"queries": 0, "top": SpaceSaving(self.bucket_top_k),
+                                             "visitors": HyperLogLog(self.bucket_hll_p)}
+            for old in [n for n in self.buckets if n <= number - self.window_buckets]:
+                del self.buckets[old]
+        return bucket
+
+    def _window(self, minutes):
+        """Buckets of the last minutes (all kept buckets without minutes)."""
+        if minutes is None:
+            return list(self.buckets.items())
+        first = int(time.time() // self.bucket_seconds) - max(1, int(minutes * 60 // self.bucket_seconds)) + 1
+        return [(number, bucket) for number, bucket in self.buckets.items() if number >= first]
+
+    def top_questions(self, limit=10, minutes=None):
+        """Most frequent questions since startup, or over the last minutes, with their overcount bound."""
+        with self._lock:
+            if minutes is None:
+                summary = self.top
+            else:
+                summary = SpaceSaving(self.top_k)
+                for _, bucket in self._window(minutes):
+                    summary.merge(bucket["top"])
+            return {
+                "questions": [{"question": label, "normalized": item, "count": count, "max_overcount": error}
+                              for item, label, count, error in summary.top(limit)],
+                "queries": summary.total,
+                # any question asked more often than this is listed
+                "error_bound": summary.error_bound(),
+            }
+
+    def unique_visitors(self, minutes=None):
+        """Estimated distinct visitors since startup, or over the last minutes."""
+        with self._lock:
+            if minutes is None:
+                sketch = self.visitors
+            else:
+                sketch = HyperLogLog(self.bucket_hll_p)
+                for _, bucket in self._window(minutes):
+                    sketch.merge(bucket["visitors"])
+            return {"unique_visitors": sketch.count(), "relative_error": sketch.relative_error()}
+
+    def query_rate(self, minutes=15):
+        """Queries per bucket over the last minutes, oldest first."""
+        with self._lock:
+            series = sorted((number, bucket["queries"]) for number, bucket in self._window(minutes))
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "buckets": [{"start": number * self.bucket_seconds, "queries": queries} for number, queries in series],
+            "queries": sum(queries for _, queries in series),
+        }
+
+    def frequency(self, question):
+        """Estimated times the question (normalized) was asked since startup; never an underestimate."""
+        with self._lock:
+            return {
+                "question": question,
+                "estimate": self.frequencies.estimate(normalize_query(question)),
+                "max_overcount": self.frequencies.error_bound(),
+                "confidence": 1 - self.frequencies.failure_probability(),
+            }
+
+    def merge(self, other):
+        """Adds another worker's summaries (same settings) to these."""
+        with self._lock:
+            self.queries += other.queries
+            self.started_at = min(self.started_at, other.started_at)
+            self.top.merge(other.top)
+            self.frequencies.merge(other.frequencies)
+            self.visitors.merge(other.visitors)
+            for number, theirs in other.buckets.items():
+                bucket = self._bucket(number)
+                bucket["queries"] += theirs["queries"]
+                bucket["top"].merge(theirs["top"])
+                bucket["visitors"].merge(theirs["visitors"])
+        return self
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "settings": {"bucket_seconds": self.bucket_seconds, "window_buckets": self.window_buckets,
+                             "top_k": self.top_k, "bucket_top_k": self.bucket_top_k,
+                             "cms_width": self.frequencies.width, "cms_depth": self.frequencies.depth,
+                             "hll_p": self.visitors.p, "bucket_hll_p": self.bucket_hll_p},
+                "started_at": self.started_at,
+                "queries": self.queries,
+                "top": self.top.to_dict(),
+                "frequencies": self.frequencies.to_dict(),
+                "visitors": self.visitors.to_dict(),
+                "buckets": {str(number): {"queries": bucket["queries"], "top": bucket["top"].to_dict(),
+                                          "visitors": bucket["visitors"].to_dict()}
+                            for number, bucket in self.buckets.items()},
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        live = cls(**data["settings"])
+        live.started_at = data["started_at"]
+        live.queries = data["queries"]
+        live.top = SpaceSaving.from_dict(data["top"])
+        live.frequencies = CountMinSketch.from_dict(data["frequencies"])
+        live.visitors = HyperLogLog.from_dict(data["visitors"])
+        live.buckets = {int(number): {"queries": bucket["queries"], "top": SpaceSaving.from_dict(bucket["top"]),
+                                      "visitors": HyperLogLog.from_dict(bucket["visitors"])}
+                        for number, bucket in data["buckets"].items()}
+        return live
+
+
+class LiveAnalyticsSharing:
+    """Dumps this worker's summaries to a shared directory and merges the other workers' dumps."""
+
+    def __init__(self, live, directory, interval=5.0, peer_ttl=300.0):
+        self.live = live
+        self.directory = directory
+        self.interval = interval
+        self.peer_ttl = peer_ttl
+        self.path = os.path.join(directory, f"live-{socket.gethostname()}-{os.getpid()}.json")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def dump(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.live.to_dict(), f)
+        os.replace(tmp_path, self.path)
+
+    def merged(self):
+        """This worker's summaries merged with the fresh dumps of the others."""
+        merged = LiveAnalytics.from_dict(self.live.to_dict())
+        now = time.time()
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json") or path == self.path:
+                continue
+            try:
+                # workers that stopped dumping (exited) drop out after peer_ttl
+                if now - os.stat(path).st_mtime > self.peer_ttl:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    merged.merge(LiveAnalytics.from_dict(json.load(f)))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping live analytics dump {path}: {e}")
+        return merged
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="live-analytics-dump", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+        self._dump_safely()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._dump_safely()
+
+    def _dump_safely(self):
+        try:
+            self.dump()
+        except OSError as e:
+            logger.error(f"Could not dump live analytics to {self.path}: {e}")
+
+
+_shared_live = None
+_shared_sharing = None
+_shared_lock = threading.Lock()
+
+
+def get_live_analytics():
+    """Returns this worker's live analytics (LIVE_ANALYTICS_BUCKET_SECONDS, LIVE_ANALYTICS_WINDOW_BUCKETS,
+    LIVE_ANALYTICS_TOP_K)."""
+    global _shared_live
+    if _shared_live is None:
+        with _shared_lock:
+            if _shared_live is None:
+                _shared_live = LiveAnalytics(
+                    bucket_seconds=int(os.getenv("LIVE_ANALYTICS_BUCKET_SECONDS", "60")),
+                    window_buckets=int(os.getenv("LIVE_ANALYTICS_WINDOW_BUCKETS", "60")),
+                    top_k=int(os.getenv("LIVE_ANALYTICS_TOP_K", "200")),
+                )
+    return _shared_live
+
+
+def get_live_analytics_sharing():
+    """Returns the cross-worker sharing of the live analytics, or None without LIVE_ANALYTICS_DIR."""
+    global _shared_sharing
+    directory = os.getenv("LIVE_ANALYTICS_DIR")
+    if not directory:
+        return None
+    if _shared_sharing is None:
+        live = get_live_analytics()
+        with _shared_lock:
+            if _shared_sharing is None:
+                _shared_sharing = LiveAnalyticsSharing(
+                    live, directory,
+                    interval=float(os.getenv("LIVE_ANALYTICS_DUMP_SECONDS", "5")),
+                    peer_ttl=float(os.getenv("LIVE_ANALYTICS_PEER_TTL_SECONDS", "300")),
+                )
+    return _shared_sharing
+
+
+def live_view():
+    """The summaries to answer from: merged across workers when sharing is configured."""
+    sharing = get_live_analytics_sharing()
+    return sharing.merged() if sharing is not None else get_live_analytics()
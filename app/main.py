@@ -1,11 +1,54 @@
+import os
 from fastapi import FastAPI
-from backend.app.routes import chat, user, analytic
+from backend.app.routes import chat, user, analytic, metrics, admin
+from backend.ai.gemini_client import get_gemini_client
+from backend.ai.model_registry import get_model_registry
+from backend.app.db import async_engine
+from backend.app.history_recorder import get_history_recorder
+from backend.app.live_analytics import get_live_analytics_sharing
+from backend.app.rollups import get_rollup_job
 
 app = FastAPI(title="SHA Chatbot API", version="1.0")
 
 app.include_router(chat.router, prefix="", tags=["Chatbot"])
 app.include_router(user.router, prefix="", tags=["Authentication"])
 app.include_router(analytic.router, prefix="", tags=["Analytics"])
+app.include_router(metrics.router, prefix="", tags=["Metrics"])
+app.include_router(admin.router, prefix="", tags=["Admin"])
+
+@app.on_event("startup")
+def warm_up_models():
+    # load the models and run warmup queries in the background; /ready reports 503 until done
+    get_model_registry().start_warmup()
+    # pick up newly published models versions without a restart (0 disables the watcher)
+    poll_seconds = float(os.getenv("MODEL_RELOAD_POLL_SECONDS", "30"))
+    if poll_seconds > 0:
+        get_model_registry().start_watcher(poll_seconds)
+
+@app.on_event("shutdown")
+async def close_gemini_client():
+    # release the pooled Gemini HTTP connections
+    await get_gemini_client().aclose()
+
+@app.on_event("startup")
+async def start_background_jobs():
+    # chat history is written behind the responses, in bulk
+    get_history_recorder().start()
+    # and rolled up for the analytics routes (0 disables the job, e.g. when a single worker runs it)
+    if get_rollup_job().interval > 0:
+        get_rollup_job().start()
+    # live analytics dumps for the other workers to merge (only with LIVE_ANALYTICS_DIR)
+    if get_live_analytics_sharing() is not None:
+        get_live_analytics_sharing().start()
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    # write the queued chat history before the pool goes away
+    await get_history_recorder().stop()
+    get_rollup_job().stop()
+    if get_live_analytics_sharing() is not None:
+        get_live_analytics_sharing().stop()
+    await async_engine.dispose()
 
 @app.get("/")
 def read_root():
@@ -1,7 +1,7 @@
 # Database models i.e UserQuery, ChatHistory, logs etc
 
 import sys
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime
+from sqlalchemy import Boolean, Column, Date, Float, ForeignKey, Integer, String, Text, DateTime
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.app.db import Base
@@ -27,6 +27,50 @@ class ChatHistory(Base):
     user = relationship("User", back_populates="chats")
     timestamp = Column(DateTime, default=datetime.utcnow) 
     session_id = Column(String) 
+    index_version = Column(String, nullable=True)  # models version that served the answer (None: unversioned files)
+    # how the answer was produced and how long each stage took (ai/stage_timings.py); None when
+    # the stage was skipped or the row predates the measurements
+    answer_path = Column(String, nullable=True)
+    spell_ms = Column(Float, nullable=True)
+    clean_ms = Column(Float, nullable=True)
+    retrieval_ms = Column(Float, nullable=True)
+    cache_ms = Column(Float, nullable=True)
+    gemini_ms = Column(Float, nullable=True)
+    db_ms = Column(Float, nullable=True)
+    total_ms = Column(Float, nullable=True)
+
+# analytics rollups of chat_history, maintained incrementally by app/rollups.py
+class DailyQueryCount(Base):
+    __tablename__ = "rollup_daily_queries"
+    day = Column(Date, primary_key=True)
+    queries = Column(Integer, nullable=False, default=0)
+
+class UserQueryCount(Base):
+    __tablename__ = "rollup_user_queries"
+    user_id = Column(Integer, primary_key=True)
+    queries = Column(Integer, nullable=False, default=0)
+
+class QuestionCount(Base):
+    __tablename__ = "rollup_question_counts"
+    normalized_query = Column(String, primary_key=True)
+    question = Column(String)  # the first original wording seen
+    queries = Column(Integer, nullable=False, default=0, index=True)
+
+class LatencyHistogram(Base):
+    __tablename__ = "rollup_latency_histogram"
+    hour = Column(DateTime, primary_key=True)
+    stage = Column(String, primary_key=True)  # a stage of ai/stage_timings.py, or "total"
+    path = Column(String, primary_key=True)  # answer path
+    bucket = Column(Integer, primary_key=True)  # log-spaced bucket of app/latency.py
+    queries = Column(Integer, nullable=False, default=0)
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermark"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)  # chat_history rows up to this id are rolled up
+    pending_max_id = Column(Integer, nullable=False, default=0)  # highest id seen by the previous run
+    rows_rolled_up = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 class User(Base):
     __tablename__ = "user"
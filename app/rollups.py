@@ -0,0 +1,239 @@
+# Analytics rollups of chat_history: daily counts, per-user counts and per-question counts (keyed
+# by the normalized question), and hourly latency histograms per stage and answer path. A watermark records the last chat_history id rolled up; a background
+# job rolls up newer rows every ROLLUP_INTERVAL_SECONDS, each chunk in one transaction with the
+# watermark so no row is counted twice. Rows only become eligible once a previous run has seen
+# them, so inserts still committing with a lower id are not skipped.
+# Backfill existing history: python -m backend.app.rollups --backfill
+# Recount from scratch:      python -m backend.app.rollups --backfill --rebuild
+
+import argparse
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from backend.ai.answer_cache import normalize_query
+from backend.app.db import SessionLocal
+from backend.app.latency import latency_counts, truncate_to_hour
+from backend.app.models import (ChatHistory, DailyQueryCount, LatencyHistogram, QuestionCount, RollupWatermark,
+                                UserQueryCount)
+from backend.app.utils import logger
+
+WATERMARK_NAME = "chat_history"
+# rows per multi-row INSERT ... ON CONFLICT statement
+UPSERT_CHUNK = 500
+# what a rollup run reads of every chat_history row
+ROLLUP_COLUMNS = (ChatHistory.id, ChatHistory.user_id, ChatHistory.query, ChatHistory.timestamp,
+                  ChatHistory.answer_path, ChatHistory.spell_ms, ChatHistory.clean_ms, ChatHistory.retrieval_ms,
+                  ChatHistory.cache_ms, ChatHistory.gemini_ms, ChatHistory.db_ms, ChatHistory.total_ms)
+
+
+def rollup_counts(rows):
+    """Daily, per-user and per-normalized-question counts of (id, user_id, query, timestamp, ...) rows,
+    plus the first original wording of every question."""
+    daily, users, questions, wording = Counter(), Counter(), Counter(), {}
+    for _, user_id, query, timestamp, *_ in rows:
+        if timestamp is not None:
+            daily[timestamp.date()] += 1
+        if user_id is not None:
+            users[user_id] += 1
+        key = normalize_query(query) if query else ""
+        if key:
+            questions[key] += 1
+            wording.setdefault(key, query)
+    return daily, users, questions, wording
+
+
+def _upsert_counts(db, model, key_columns, values):
+    """Adds the counts in values (dicts with the key columns and "queries") to the rollup rows."""
+    if not values:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        # no portable upsert: read-modify-write under the watermark lock
+        for row in values:
+            existing = db.get(model, tuple(row[column] for column in key_columns))
+            if existing is None:
+                db.add(model(**row))
+            else:
+                existing.queries += row["queries"]
+        return
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    for offset in range(0, len(values), UPSERT_CHUNK):
+        stmt = insert(model).values(values[offset:offset + UPSERT_CHUNK])
+        # counts add up; anything else (the first wording of a question) is kept
+        db.execute(stmt.on_conflict_do_update(index_elements=key_columns,
+                                              set_={"queries": model.queries + stmt.excluded.queries}))
+
+
+def apply_rollups(db, rows):
+    """Adds chat_history rows to the rollup tables (in the caller's transaction)."""
+    daily, users, questions, wording = rollup_counts(rows)
+    _upsert_counts(db, DailyQueryCount, ["day"], [{"day": day, "queries": n} for day, n in daily.items()])
+    _upsert_counts(db, UserQueryCount, ["user_id"],
+                   [{"user_id": user_id, "queries": n} for user_id, n in users.items()])
+    _upsert_counts(db, QuestionCount, ["normalized_query"],
+                   [{"normalized_query": key, "question": wording[key], "queries": n} for key, n in questions.items()])
+    latencies = latency_counts((row for row in rows if row.timestamp is not None), hour_of=truncate_to_hour)
+    _upsert_counts(db, LatencyHistogram, ["hour", "stage", "path", "bucket"],
+                   [{"hour": hour, "stage": stage, "path": path, "bucket": bucket, "queries": n}
+                    for (hour, stage, path, bucket), n in latencies.items()])
+
+
+def _lock_watermark(db):
+    # row lock on Postgres, so concurrent workers take turns; SQLite serializes writers anyway
+    watermark = db.execute(
+        select(RollupWatermark).where(RollupWatermark.name == WATERMARK_NAME).with_for_update()
+    ).scalar_one_or_none()
+    if watermark is None:
+        watermark = RollupWatermark(name=WATERMARK_NAME, last_id=0, pending_max_id=0, rows_rolled_up=0)
+        db.add(watermark)
+        db.flush()
+    return watermark
+
+
+def roll_up_chunk(db, upper_id, batch_size=5000):
+    """Rolls up at most batch_size rows past the watermark, up to upper_id, in one transaction."""
+    watermark = _lock_watermark(db)
+    rows = db.execute(
+        select(*ROLLUP_COLUMNS)
+        .where(ChatHistory.id > watermark.last_id, ChatHistory.id <= upper_id)
+        .order_by(ChatHistory.id)
+        .limit(batch_size)
+    ).all()
+    if rows:
+        apply_rollups(db, rows)
+        watermark.last_id = rows[-1][0]
+        watermark.rows_rolled_up += len(rows)
+        watermark.updated_at = datetime.utcnow()
+    db.commit()
+    return len(rows)
+
+
+def update_rollups(session_factory=SessionLocal, settle=True, batch_size=5000):
+    """Rolls up the chat_history rows past the watermark; returns how many. With settle, only rows
+    that existed at the previous run are taken (the backfill takes everything)."""
+    db = session_factory()
+    rolled_up = 0
+    try:
+        upper_id = _lock_watermark(db).pending_max_id if settle else (db.scalar(select(func.max(ChatHistory.id))) or 0)
+        db.commit()
+        while True:
+            count = roll_up_chunk(db, upper_id, batch_size)
+            rolled_up += count
+            if count < batch_size:
+                break
+        watermark = _lock_watermark(db)
+        watermark.pending_max_id = max(watermark.pending_max_id, db.scalar(select(func.max(ChatHistory.id))) or 0)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return rolled_up
+
+
+def rebuild_rollups(session_factory=SessionLocal):
+    """Empties the rollup tables and the watermark (the next update recounts all history)."""
+    db = session_factory()
+    try:
+        for model in (DailyQueryCount, UserQueryCount, QuestionCount, LatencyHistogram, RollupWatermark):
+            db.execute(delete(model))
+        db.commit()
+    finally:
+        db.close()
+
+
+class RollupJob:
+    """Background thread running update_rollups every interval seconds."""
+
+    def __init__(self, interval=30.0, batch_size=5000, session_factory=SessionLocal):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.failures = 0
+        self.rows_rolled_up = 0
+        self.last_run = None
+        self.last_duration = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="analytics-rollups", daemon=True)
+            self._thread.start()
+            logger.info(f"Analytics rollup job started (every {self.interval}s)")
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self):
+        start = time.perf_counter()
+        try:
+            rolled_up = update_rollups(self.session_factory, settle=True, batch_size=self.batch_size)
+        except Exception as e:
+            # e.g. another worker holds the SQLite write lock: the next run catches up
+            self.failures += 1
+            logger.error(f"Analytics rollup run failed: {e}")
+            return 0
+        self.runs += 1
+        self.rows_rolled_up += rolled_up
+        self.last_run = time.time()
+        self.last_duration = time.perf_counter() - start
+        if rolled_up:
+            logger.info(f"Rolled up {rolled_up} chat history rows in {self.last_duration:.2f}s")
+        return rolled_up
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "rows_rolled_up": self.rows_rolled_up,
+            "last_run": self.last_run,
+            "last_duration_ms": self.last_duration * 1000,
+        }
+
+
+_shared_job = None
+_shared_lock = threading.Lock()
+
+
+def get_rollup_job():
+    """Returns the process-wide rollup job (ROLLUP_INTERVAL_SECONDS, ROLLUP_BATCH_SIZE)."""
+    global _shared_job
+    if _shared_job is None:
+        with _shared_lock:
+            if _shared_job is None:
+                _shared_job = RollupJob(interval=float(os.getenv("ROLLUP_INTERVAL_SECONDS", "30")),
+                                        batch_size=int(os.getenv("ROLLUP_BATCH_SIZE", "5000")))
+    return _shared_job
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollup tables.")
+    parser.add_argument("--backfill", action="store_true", help="roll up all chat history past the watermark now")
+    parser.add_argument("--rebuild", action="store_true", help="empty the rollups first and recount everything")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("nothing to do; pass --backfill")
+
+    if args.rebuild:
+        rebuild_rollups()
+        logger.info("Rollup tables emptied")
+    start = time.perf_counter()
+    rolled_up = update_rollups(settle=False, batch_size=args.batch_size)
+    print(f"Rolled up {rolled_up} chat history rows in {time.perf_counter() - start:.1f}s")
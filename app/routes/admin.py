@@ -0,0 +1,27 @@
+# Admin API endpoints: inspect the served models version and trigger a zero-downtime reload
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, Any, Optional
+from backend.app.dependencies import require_admin_token
+from backend.ai.model_registry import get_model_registry, list_versions
+
+router = APIRouter(prefix="/admin/models", tags=["Admin"], dependencies=[Depends(require_admin_token)])
+
+# Get the active models version and the published versions
+@router.get("", response_model=Dict[str, Any])
+def get_models_status():
+    registry = get_model_registry()
+    return {**registry.stats(), "available_versions": list_versions(registry.versions_dir)}
+
+# Load a published version (default: the latest) in the background and swap it in
+@router.post("/reload", status_code=status.HTTP_202_ACCEPTED, response_model=Dict[str, Any])
+def reload_models(version: Optional[str] = None):
+    registry = get_model_registry()
+    versions = list_versions(registry.versions_dir)
+    target = version or (versions[-1] if versions else None)
+    if target is None or target not in versions:
+        raise HTTPException(status_code=404, detail=f"Models version not published: {target}")
+    if registry.reload_in_progress is not None:
+        raise HTTPException(status_code=409, detail=f"A reload to version {registry.reload_in_progress} is already running")
+    registry.start_reload(target)
+    return {"reloading": target, "active_version": registry.version}
@@ -5,22 +5,33 @@
 # Chatbot response times
 # User engagement trends
 
+from collections import Counter, defaultdict
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List, Dict, Any, Optional
-from ..models import ChatHistory
-from ..dependencies import get_db 
+from ..models import ChatHistory, DailyQueryCount, LatencyHistogram, QuestionCount, RollupWatermark, UserQueryCount
+from ..rollups import WATERMARK_NAME
+from ..latency import LATENCY_STAGES, UNKNOWN_PATH, bucket_expression, percentiles
+from ..live_analytics import live_view
+from ..dependencies import get_async_db
 from ..utils import safe_int_conversion, logger 
 from datetime import datetime, timedelta
 
+# counts come from the rollup tables (app/rollups.py), which trail chat_history by up to two
+# rollup intervals; only the total and the latency percentiles add the rows past the watermark
+
 router = APIRouter(prefix="/analytics", tags=["Analytics"])  
 # Get Total Number of Queries
 @router.get("/total_queries/", response_model=Dict[str, int])
-def get_total_queries(db: Session = Depends(get_db)):
+async def get_total_queries(db: AsyncSession = Depends(get_async_db)):
     try:
-        total_queries = db.query(ChatHistory).count()
+        watermark = await db.scalar(select(RollupWatermark).where(RollupWatermark.name == WATERMARK_NAME))
+        last_id, rolled_up = (watermark.last_id, watermark.rows_rolled_up) if watermark is not None else (0, 0)
+        recent = await db.scalar(select(func.count()).select_from(ChatHistory).where(ChatHistory.id > last_id))
+        total_queries = rolled_up + recent
         return {"total_queries": total_queries}
     except SQLAlchemyError as e:
         logger.error(f"Database error while getting total queries: {e}")
@@ -28,30 +39,29 @@ def get_total_queries(db: Session = Depends(get_db)):
 
 # Get Total Queries by User
 @router.get("/queries_per_user/{user_id}", response_model=Dict[str, Any])
-def get_queries_per_user(user_id: int, db: Session = Depends(get_db)):
+async def get_queries_per_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     if not isinstance(user_id, int) and not user_id.isdigit():
         raise HTTPException(status_code=400, detail="Invalid user_id")
     user_id = safe_int_conversion(user_id)
     if user_id is None:
         raise HTTPException(status_code=400, detail="Invalid user_id format")
     try:
-        user_queries = db.query(ChatHistory).filter(ChatHistory.user_id == user_id).count()
-        return {"user_id": user_id, "total_queries": user_queries}
+        user_queries = await db.scalar(select(UserQueryCount.queries).where(UserQueryCount.user_id == user_id))
+        return {"user_id": user_id, "total_queries": user_queries or 0}
     except SQLAlchemyError as e:
         logger.error(f"Database error while getting queries for user {user_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
 # Get Most Common Questions
 @router.get("/common_questions/", response_model=Dict[str, List[Dict[str, Any]]])
-def get_common_questions(limit: int = Query(default=5, le=10), db: Session = Depends(get_db)):
+async def get_common_questions(limit: int = Query(default=5, le=10), db: AsyncSession = Depends(get_async_db)):
     try:
-        common_questions = (
-            db.query(ChatHistory.query, func.count(ChatHistory.query).label("count"))
-            .group_by(ChatHistory.query)
-            .order_by(func.count(ChatHistory.query).desc())
+        # grouped by normalized question, so case and punctuation variants count together
+        common_questions = (await db.execute(
+            select(QuestionCount.question, QuestionCount.queries)
+            .order_by(QuestionCount.queries.desc())
             .limit(limit)
-            .all()
-        )
+        )).all()
         return {"common_questions": [{"question": q[0], "count": q[1]} for q in common_questions]}
     except SQLAlchemyError as e:
         logger.error(f"Database error while getting common questions: {e}")
@@ -59,52 +69,132 @@ def get_common_questions(limit: int = Query(default=5, le=10), db: Session = Dep
 
 # Get User Engagement Over Time
 @router.get("/user_engagement/", response_model=Dict[str, List[Dict[str, Any]]])
-def get_user_engagement(db: Session = Depends(get_db), days: Optional[int] = Query(None, description="Number of past days to retrieve engagement data for")):
+async def get_user_engagement(db: AsyncSession = Depends(get_async_db), days: Optional[int] = Query(None, description="Number of past days to retrieve engagement data for")):
     try:
-        query = db.query(func.date(ChatHistory.timestamp), func.count(ChatHistory.id))
+        query = select(DailyQueryCount.day, DailyQueryCount.queries)
         if days:
             cutoff = datetime.utcnow() - timedelta(days=days)
-            query = query.filter(ChatHistory.timestamp >= cutoff)
-        engagement_data = (
-            query.group_by(func.date(ChatHistory.timestamp))
-            .order_by(func.date(ChatHistory.timestamp))
-            .all()
-        )
+            query = query.where(DailyQueryCount.day >= cutoff.date())
+        engagement_data = (await db.execute(query.order_by(DailyQueryCount.day))).all()
         return {"engagement_trends": [{"date": str(e[0]), "queries": e[1]} for e in engagement_data]}
     except SQLAlchemyError as e:
         logger.error(f"Database error while getting user engagement data: {e}")
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
-# Get Average Chatbot Response Time
-@router.get("/response_time/", response_model=Dict[str, Optional[float]])
-def get_average_response_time(db: Session = Depends(get_db)):
+async def _latency_histograms(db: AsyncSession, start: Optional[datetime], end: Optional[datetime]) -> Counter:
+    """Histogram counts {(stage, path, bucket): n} of the interactions in [start, end): the hourly
+    rollup (start rounded down to its hour, end up) plus the rows past the watermark."""
+    query = select(LatencyHistogram.stage, LatencyHistogram.path, LatencyHistogram.bucket,
+                   func.sum(LatencyHistogram.queries))
+    if start is not None:
+        query = query.where(LatencyHistogram.hour >= start.replace(minute=0, second=0, microsecond=0))
+    if end is not None:
+        query = query.where(LatencyHistogram.hour < end)
+    counts = Counter()
+    for stage, path, bucket, n in (await db.execute(
+            query.group_by(LatencyHistogram.stage, LatencyHistogram.path, LatencyHistogram.bucket))).all():
+        counts[(stage, path, bucket)] += n
+    last_id = await db.scalar(select(RollupWatermark.last_id).where(RollupWatermark.name == WATERMARK_NAME)) or 0
+    # the rows past the watermark are bucketed and counted in SQL, only the counts come back
+    for stage in LATENCY_STAGES:
+        column = getattr(ChatHistory, f"{stage}_ms")
+        bucket = bucket_expression(column)
+        recent = (select(ChatHistory.answer_path, bucket, func.count())
+                  .where(ChatHistory.id > last_id, column.is_not(None)))
+        if start is not None:
+            recent = recent.where(ChatHistory.timestamp >= start)
+        if end is not None:
+            recent = recent.where(ChatHistory.timestamp < end)
+        for path, row_bucket, n in (await db.execute(recent.group_by(ChatHistory.answer_path, bucket))).all():
+            counts[(stage, path or UNKNOWN_PATH, row_bucket)] += n
+    return counts
+
+# Get Chatbot Response Time percentiles (request start to answer ready)
+@router.get("/response_time/", response_model=Dict[str, Any])
+async def get_response_time(db: AsyncSession = Depends(get_async_db), days: Optional[int] = Query(None, description="Number of past days to include")):
     try:
-        # Assuming 'timestamp' records the time the query was made.
-        # To calculate response time, you'd need another field recording the response time.
-        # For now, we'll just return the average query timestamp (which isn't a true response time).
-        # Consider adding a 'response_timestamp' to your ChatHistory model.
-        avg_query_timestamp = db.query(func.avg(func.extract('epoch', ChatHistory.timestamp))).scalar()
-        return {"average_query_timestamp_epoch": avg_query_timestamp or 0}
+        start = datetime.utcnow() - timedelta(days=days) if days else None
+        counts = await _latency_histograms(db, start, None)
+        totals = Counter()
+        for (stage, _, bucket), n in counts.items():
+            if stage == "total":
+                totals[bucket] += n
+        return percentiles(totals)
     except SQLAlchemyError as e:
-        logger.error(f"Database error while getting average response time: {e}")
+        logger.error(f"Database error while getting response time percentiles: {e}")
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
 # Get Chatbot Response Time for a Specific User
-@router.get("/response_time/{user_id}", response_model=Dict[str, Optional[float]])
-def get_user_response_time(user_id: int, db: Session = Depends(get_db)):
+@router.get("/response_time/{user_id}", response_model=Dict[str, Any])
+async def get_user_response_time(user_id: int, db: AsyncSession = Depends(get_async_db)):
     if not isinstance(user_id, int) and not user_id.isdigit():
         raise HTTPException(status_code=400, detail="Invalid user_id")
     user_id = safe_int_conversion(user_id)
     if user_id is None:
         raise HTTPException(status_code=400, detail="Invalid user_id format")
     try:
-        # Same assumption as above regarding 'timestamp' not being the true response time.
-        user_query_timestamp = (
-            db.query(func.avg(func.extract('epoch', ChatHistory.timestamp)))
-            .filter(ChatHistory.user_id == user_id)
-            .scalar()
-        )
-        return {"user_id": user_id, "average_query_timestamp_epoch": user_query_timestamp or 0}
+        # the histograms are not kept per user: the average over the user's measured interactions
+        average_ms, samples = (await db.execute(
+            select(func.avg(ChatHistory.total_ms), func.count(ChatHistory.total_ms))
+            .where(ChatHistory.user_id == user_id)
+        )).one()
+        return {"user_id": user_id, "average_response_time_ms": average_ms, "samples": samples}
     except SQLAlchemyError as e:
         logger.error(f"Database error while getting response time for user {user_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+# Get p50/p90/p99 of every stage (spell, clean, retrieval, cache, gemini, db, total), overall and per answer path
+@router.get("/latency/", response_model=Dict[str, Any])
+async def get_latency_percentiles(
+    db: AsyncSession = Depends(get_async_db),
+    start: Optional[datetime] = Query(None, description="Range start (UTC, rounded down to the hour); default 24 hours ago"),
+    end: Optional[datetime] = Query(None, description="Range end (UTC); default now"),
+    stage: Optional[str] = Query(None, description="Only this stage"),
+    path: Optional[str] = Query(None, description="Only interactions answered by this path"),
+):
+    if stage is not None and stage not in LATENCY_STAGES:
+        raise HTTPException(status_code=400, detail=f"Unknown stage; expected one of {', '.join(LATENCY_STAGES)}")
+    if start is None:
+        start = datetime.utcnow() - timedelta(days=1)
+    if end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    try:
+        counts = await _latency_histograms(db, start, end)
+        overall, by_path = defaultdict(Counter), defaultdict(lambda: defaultdict(Counter))
+        for (row_stage, row_path, bucket), n in counts.items():
+            if (stage is not None and row_stage != stage) or (path is not None and row_path != path):
+                continue
+            overall[row_stage][bucket] += n
+            by_path[row_stage][row_path][bucket] += n
+        stages = {
+            row_stage: {
+                "all": percentiles(overall[row_stage]),
+                "paths": {row_path: percentiles(histogram) for row_path, histogram in sorted(by_path[row_stage].items())},
+            }
+            for row_stage in LATENCY_STAGES if row_stage in overall
+        }
+        return {"start": start.isoformat(), "end": end.isoformat() if end else None, "stages": stages}
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while getting latency percentiles: {e}")
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+# Live analytics from in-memory streaming sketches (app/live_analytics.py): cheap enough to poll
+# every few seconds, merged across workers when LIVE_ANALYTICS_DIR is shared, with error bounds.
+# "minutes" selects a sliding window; without it the summaries cover everything since startup.
+
+@router.get("/live/top_questions", response_model=Dict[str, Any])
+def get_live_top_questions(limit: int = Query(default=10, ge=1, le=100),
+                           minutes: Optional[int] = Query(None, ge=1, description="Sliding window in minutes")):
+    return live_view().top_questions(limit=limit, minutes=minutes)
+
+@router.get("/live/unique_visitors", response_model=Dict[str, Any])
+def get_live_unique_visitors(minutes: Optional[int] = Query(None, ge=1, description="Sliding window in minutes")):
+    return live_view().unique_visitors(minutes=minutes)
+
+@router.get("/live/query_rate", response_model=Dict[str, Any])
+def get_live_query_rate(minutes: int = Query(default=15, ge=1, description="Sliding window in minutes")):
+    return live_view().query_rate(minutes=minutes)
+
+@router.get("/live/frequency", response_model=Dict[str, Any])
+def get_live_question_frequency(question: str = Query(..., min_length=1)):
+    return live_view().frequency(question)
@@ -5,15 +5,20 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+import json
 import os
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
-from backend.app.db import SessionLocal
-from backend.app.dependencies import get_db
-from backend.app.models import ChatHistory
-from backend.ai.hybrid_model import hybrid_get_response
-from backend.app.utils import log_query, correct_spelling, clean_text, logger
+from typing import Optional
+from backend.app.history_recorder import get_history_recorder
+from backend.app.live_analytics import get_live_analytics
+from backend.app.schemas import ChatBatchRequest, ChatBatchResponse
+from backend.ai.hybrid_model import async_hybrid_get_response, async_hybrid_get_batch_responses, async_hybrid_stream_response, chat_deadline
+from backend.ai.gemini_client import GeminiError
+from backend.ai.model_registry import get_model_registry
+from backend.ai.stage_timings import StageTimings
+from backend.app.utils import log_query, correct_spelling, correct_spelling_batch, clean_text, logger
 import logging
 
 # Configure logging to capture important information
@@ -49,26 +54,34 @@ router = APIRouter(prefix="/chat", tags=["Chatbot"])
 # get response from the google gemini api
 @router.post("")
 async def chatbot_query(
-    user_input: str, db: Session = Depends(get_db),
+    user_input: str, http_request: Request,
     # current_user: Optional[User] = Depends(get_current_active_user),  # Get authenticated user
     ):
     user_id = None # no authentication for now
     session_id = None
+    # the request's latency budget starts now, preprocessing included
+    deadline = chat_deadline()
+    timings = StageTimings()
     
     # Ensure user input is valid
     if not user_input.strip():
         raise HTTPException(status_code=400, detail="User input cannot be empty")
     
+    # answer the whole request from one models version, even if a reload swaps in a new one meanwhile
+    index_version = get_model_registry().pin()
+    
     try:
         logger.info(f"User (Guest) query: '{user_input}'")
         
         # preprocess user input
-        corrected_input = correct_spelling(user_input)
-        cleaned_input = clean_text(corrected_input)
+        with timings.stage("spell"):
+            corrected_input = correct_spelling(user_input)
+        with timings.stage("clean"):
+            cleaned_input = clean_text(corrected_input)
         logger.debug(f"Preprocessed input: '{cleaned_input}'")
         
         # get chatbot response from hybrid model
-        bot_response = hybrid_get_response(cleaned_input)
+        bot_response = await async_hybrid_get_response(cleaned_input, deadline=deadline, timings=timings)
         
         if not bot_response:
             logger.warning(f"Hybrid model retruned an empty response for the query: '{cleaned_input}'")
@@ -77,17 +90,16 @@ async def chatbot_query(
                 detail="Chatbot failed to generate a response.",
             )
         
-        #store the chat history
-        chat_record = ChatHistory(
+        # live dashboards count the question right away; the history is written behind the response, in bulk
+        get_live_analytics().record(user_input, visitor_id(user_id, session_id, http_request))
+        await get_history_recorder().record(
             user_id=user_id,
             query=user_input, # store the original input
             response=bot_response,
             session_id=session_id,
+            index_version=index_version,
+            **timings.columns(),
         )
-        db.add(chat_record)
-        db.commit()
-        db.refresh(chat_record)
-        logger.info(f"Chat interaction successfully saved to history (ID: {chat_record.id}).")
         
         # will not be executed as user_id is none
         if user_id:
@@ -97,18 +109,136 @@ async def chatbot_query(
     
     except HTTPException as http_exc:
         raise http_exc
-    except SQLAlchemyError as db_exc:
-        db.rollback()
-        logger.error(f"Database error during chat interaction: {db_exc}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during chat processing: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to save chat history due to a database error.",
+            detail="An unexpected error occurred while processing your request."
         )
+
+
+# answer a burst of questions in one request
+@router.post("/batch", response_model=ChatBatchResponse)
+async def chatbot_batch_query(request: ChatBatchRequest, http_request: Request):
+    user_id = None # no authentication for now
+    session_id = None
+    deadline = chat_deadline()
+    timings = StageTimings(size=len(request.inputs))
+    
+    if any(not user_input.strip() for user_input in request.inputs):
+        raise HTTPException(status_code=400, detail="User inputs cannot be empty")
+    
+    index_version = get_model_registry().pin()
+    
+    try:
+        logger.info(f"User (Guest) batch of {len(request.inputs)} queries")
+        
+        # preprocess all inputs together, in the threadpool: a large batch would stall the event loop
+        with timings.stage("spell"):
+            corrected_inputs = await run_in_threadpool(correct_spelling_batch, request.inputs)
+        with timings.stage("clean"):
+            cleaned_inputs = await run_in_threadpool(lambda: [clean_text(corrected_input) for corrected_input in corrected_inputs])
+        
+        # one scoring pass for the whole batch, Gemini only for low-similarity inputs
+        bot_responses = await async_hybrid_get_batch_responses(cleaned_inputs, deadline=deadline, timings=timings)
+        
+        if any(not bot_response for bot_response in bot_responses):
+            logger.warning("Hybrid model returned an empty response within a batch.")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Chatbot failed to generate a response.",
+            )
+        
+        visitor = visitor_id(user_id, session_id, http_request)
+        for user_input in request.inputs:
+            get_live_analytics().record(user_input, visitor)
+        # queue the whole batch for the history recorder's bulk insert; every row carries the
+        # batch's stage times (its inputs waited for each other) and its own answer path
+        await get_history_recorder().record_many([
+            dict(user_id=user_id, query=user_input, response=bot_response, session_id=session_id,
+                 index_version=index_version, **timings.columns(position))
+            for position, (user_input, bot_response) in enumerate(zip(request.inputs, bot_responses))
+        ])
+        
+        return {
+            "responses": [
+                {"query": user_input, "response": bot_response}
+                for user_input, bot_response in zip(request.inputs, bot_responses)
+            ]
+        }
+    
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
-        logger.error(f"An unexpected error occurred during chat processing: {e}")
+        logger.error(f"An unexpected error occurred during batch chat processing: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred while processing your request."
         )
-            
-            
\ No newline at end of file
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Formats one server-sent event; JSON keeps newlines inside the payload safe."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def visitor_id(user_id, session_id, http_request: Request) -> Optional[str]:
+    """Who asked, for the live distinct-visitor counts: the user, else the session, else the client address."""
+    if user_id is not None:
+        return f"user:{user_id}"
+    if session_id is not None:
+        return f"session:{session_id}"
+    return f"client:{http_request.client.host}" if http_request.client else None
+
+async def save_chat_history(user_id, session_id, query: str, response: str, index_version: Optional[str] = None,
+                            timings: Optional[StageTimings] = None) -> None:
+    """Queues a chat interaction for the history recorder (used once a stream has completed)."""
+    latencies = timings.columns() if timings is not None else {}
+    await get_history_recorder().record(user_id=user_id, query=query, response=response, session_id=session_id,
+                                        index_version=index_version, **latencies)
+
+# stream the response as server-sent events: one "answer" event for retrieval/cached answers,
+# "token" events while Gemini generates, then "done" (or "error")
+@router.api_route("/stream", methods=["GET", "POST"])
+async def chatbot_stream_query(user_input: str, http_request: Request):
+    user_id = None # no authentication for now
+    session_id = None
+    deadline = chat_deadline()
+    timings = StageTimings()
+    
+    if not user_input.strip():
+        raise HTTPException(status_code=400, detail="User input cannot be empty")
+    
+    logger.info(f"User (Guest) streaming query: '{user_input}'")
+    index_version = get_model_registry().pin()
+    with timings.stage("spell"):
+        corrected_input = correct_spelling(user_input)
+    with timings.stage("clean"):
+        cleaned_input = clean_text(corrected_input)
+    visitor = visitor_id(user_id, session_id, http_request)
+    
+    async def event_stream():
+        chunks = []
+        try:
+            async for source, text in async_hybrid_stream_response(cleaned_input, deadline=deadline, timings=timings):
+                chunks.append(text)
+                if source == "gemini":
+                    yield format_sse("token", {"text": text})
+                else:
+                    yield format_sse("answer", {"response": text, "source": source})
+        except GeminiError as e:
+            logger.error(f"Gemini streaming failed: {e}")
+            yield format_sse("error", {"detail": "Sorry, I couldn't get that. Please try again."})
+            return
+        bot_response = "".join(chunks)
+        # the stream's total ends with its last event
+        timings.finish()
+        yield format_sse("done", {"response": bot_response})
+        # persist only after the stream completed
+        get_live_analytics().record(user_input, visitor)
+        await save_chat_history(user_id, session_id, user_input, bot_response, index_version, timings)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,49 @@
+# API endpoints exposing in-process serving metrics (retrieval, routing, Gemini client, coalescing and degraded answers, answer cache, Q&A index, DB pools, chat history writes and rollups) and readiness
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from typing import Dict, Any
+from backend.ai import hybrid_model
+from backend.ai.inverted_index import get_inverted_index
+from backend.ai.model_registry import get_model_registry
+from backend.ai.qa_index import get_qa_index
+from backend.ai.routing_threshold import get_routing_threshold
+from backend.app.db import pool_stats
+from backend.app.history_recorder import get_history_recorder
+from backend.app.rollups import get_rollup_job
+
+router = APIRouter(tags=["Metrics"])
+
+# Get serving metrics of this worker
+@router.get("/metrics", response_model=Dict[str, Any])
+def get_metrics():
+    registry = get_model_registry()
+    # never trigger a model load from a metrics scrape
+    retrieval_index = get_inverted_index() if registry.is_loaded("inverted_index") else None
+    answer_cache = hybrid_model.get_cache() if registry.warmup_done.is_set() else None
+    qa_index = get_qa_index() if registry.is_loaded("qa_index") else None
+    return {
+        "models": registry.stats(),
+        "retrieval": retrieval_index.stats() if retrieval_index is not None else None,
+        "corpus_index": retrieval_index.corpus_index.stats() if retrieval_index is not None else None,
+        "gemini_client": hybrid_model.gemini_client.stats(),
+        # identical concurrent fallbacks served by one Gemini call
+        "gemini_coalescing": hybrid_model.gemini_flights.stats(),
+        # answers served without Gemini because it failed, its breaker was open or the deadline passed
+        "gemini_degraded": dict(hybrid_model.degraded_answers),
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        # share of queries routed past retrieval, to compare with the tuner's target
+        "routing": get_routing_threshold().stats(),
+        "qa_index": qa_index.stats() if qa_index is not None else None,
+        # connection checkout waits and pool saturation
+        "db_pool": pool_stats(),
+        # write-behind chat history: queue depth, bulk flushes, spills
+        "chat_history": get_history_recorder().stats(),
+        "analytics_rollups": get_rollup_job().stats(),
+    }
+
+# Readiness probe: 503 until the models are loaded and warmed up
+@router.get("/ready", response_model=Dict[str, Any])
+def get_readiness():
+    stats = get_model_registry().stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
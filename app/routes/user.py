@@ -1,15 +1,16 @@
 # Handles user authentication i.e., registration and login
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import SessionLocal
 from backend.app.models import User
 from backend.app.schemas import UserCreate, UserLogin, UserResponse 
 from backend.app.routes.auth import get_password_hash, verify_password, create_access_token, decode_access_token
-from backend.app.dependencies import get_db
+from backend.app.dependencies import get_async_db
 from backend.app.config import Config 
 import sys
 import os
@@ -26,28 +27,29 @@ class Token(BaseModel):
 
 # Use consistent naming and Pydantic schemas for request/response
 @router.post("/register/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing_email = db.query(User).filter(User.email == user.email).first()
-    existing_username = db.query(User).filter(User.username == user.username).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_email = await db.scalar(select(User).where(User.email == user.email).limit(1))
+    existing_username = await db.scalar(select(User).where(User.username == user.username).limit(1))
 
     if existing_email:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already in use")
     if existing_username:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
 
-    hashed_password = get_password_hash(user.password)
+    # bcrypt is deliberately slow: hash off the event loop
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     new_user = User(username=user.username, email=user.email, hashed_password=hashed_password) # ✅ Improvement: Use hashed_password field name
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 # Use consistent naming, Pydantic schema for request/response, and return token
 @router.post("/login/", response_model=Token)
-def login_user(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not verify_password(user.password, db_user.hashed_password): # ✅ Improvement: Use hashed_password for verification
+async def login_user(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email).limit(1))
+    if not db_user or not await run_in_threadpool(verify_password, user.password, db_user.hashed_password): # ✅ Improvement: Use hashed_password for verification
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
     access_token_expires = timedelta(minutes=Config.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -55,7 +57,7 @@ def login_user(user: UserLogin, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Use Depends with a function for reusability and better error handling
-async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_active_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     email = decode_access_token(token)
     if not email:
         raise HTTPException(
@@ -63,7 +65,7 @@ async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Sessi
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email).limit(1))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     return user
@@ -1,5 +1,6 @@
 # app/schemas.py
-from pydantic import BaseModel, EmailStr
+from typing import List
+from pydantic import BaseModel, EmailStr, Field
 
 class UserBase(BaseModel):
     username: str
@@ -17,4 +18,14 @@ class UserResponse(UserBase):
     is_active: bool
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ChatBatchRequest(BaseModel):
+    inputs: List[str] = Field(..., min_length=1, max_length=100)
+
+class ChatBatchItem(BaseModel):
+    query: str
+    response: str
+
+class ChatBatchResponse(BaseModel):
+    responses: List[ChatBatchItem]
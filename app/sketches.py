@@ -0,0 +1,176 @@
+# Bounded-memory streaming summaries for the live analytics (app/live_analytics.py). All of them
+# hash with blake2b rather than Python's per-process salted hash(), so sketches built by different
+# workers can be merged, and all serialize to JSON-compatible dicts.
+#
+# Error bounds, for a stream of N items:
+# - SpaceSaving(k): every item with frequency > N/k is reported; a reported count overestimates
+#   the true frequency by at most its recorded error, and every error is <= N/k.
+# - CountMinSketch(width, depth): estimates never underestimate, and overestimate by more than
+#   e/width * N with probability at most e^-depth.
+# - HyperLogLog(p): 2^p one-byte registers, relative standard error about 1.04 / sqrt(2^p).
+
+import base64
+import hashlib
+import math
+
+
+def stable_hash(item, salt=b""):
+    """64-bit hash of a string that is the same in every process."""
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8, salt=salt).digest(), "little")
+
+
+class SpaceSaving:
+    """Top-k heavy hitters (Metwally et al.): k counters, the smallest one replaced by a new item."""
+
+    def __init__(self, k=200):
+        self.k = k
+        self.total = 0
+        # item -> [count, error, label]; count - error is a lower bound of the true frequency
+        self.counters = {}
+
+    def add(self, item, count=1, label=None):
+        self.total += count
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self.counters) < self.k:
+            self.counters[item] = [count, 0, label or item]
+            return
+        # the newcomer inherits the evicted minimum as its possible overcount
+        victim = min(self.counters, key=lambda key: self.counters[key][0])
+        floor = self.counters.pop(victim)[0]
+        self.counters[item] = [floor + count, floor, label or item]
+
+    def min_count(self):
+        """Count of the smallest counter once all k are in use (0 before)."""
+        if len(self.counters) < self.k:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """Adds another summary (mergeable summaries, Agarwal et al.): an item missing from one side
+        may have been counted there up to that side's minimum, which goes into its count and error."""
+        own_floor, other_floor = self.min_count(), other.min_count()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            mine, theirs = self.counters.get(item), other.counters.get(item)
+            count = (mine[0] if mine else own_floor) + (theirs[0] if theirs else other_floor)
+            error = (mine[1] if mine else own_floor) + (theirs[1] if theirs else other_floor)
+            merged[item] = [count, error, (mine or theirs)[2]]
+        self.counters = dict(sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[:self.k])
+        self.total += other.total
+        return self
+
+    def top(self, limit=10):
+        """The limit most frequent items as (item, label, count, error), most frequent first."""
+        ranked = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)[:limit]
+        return [(item, label, count, error) for item, (count, error, label) in ranked]
+
+    def error_bound(self):
+        return self.total / self.k if self.k else 0.0
+
+    def to_dict(self):
+        return {"k": self.k, "total": self.total, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data["k"])
+        summary.total = data["total"]
+        summary.counters = {item: list(counter) for item, counter in data["counters"].items()}
+        return summary
+
+
+class CountMinSketch:
+    """Frequency estimates of any item in width * depth counters (Cormode and Muthukrishnan)."""
+
+    def __init__(self, width=2048, depth=5):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _columns(self, item):
+        # double hashing: depth independent-enough columns from one 128-bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item, count=1):
+        self.total += count
+        for row, column in zip(self.rows, self._columns(item)):
+            row[column] += count
+
+    def estimate(self, item):
+        return min(row[column] for row, column in zip(self.rows, self._columns(item)))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches of different dimensions cannot be merged.")
+        for row, other_row in zip(self.rows, other.rows):
+            for column, count in enumerate(other_row):
+                row[column] += count
+        self.total += other.total
+        return self
+
+    def error_bound(self):
+        """Overcount exceeded with probability at most failure_probability()."""
+        return math.e / self.width * self.total
+
+    def failure_probability(self):
+        return math.exp(-self.depth)
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth, "total": self.total, "rows": self.rows}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["width"], data["depth"])
+        sketch.total = data["total"]
+        sketch.rows = [list(row) for row in data["rows"]]
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct-count estimate in 2^p registers (Flajolet et al., with the small-range correction)."""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, item):
+        value = stable_hash(item, salt=b"hll")
+        index = value >> (64 - self.p)
+        rest = value & ((1 << (64 - self.p)) - 1)
+        # position of the leftmost 1-bit in the remaining 64 - p bits
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # linear counting is more accurate while many registers are empty
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if self.p != other.p:
+            raise ValueError("HyperLogLogs of different precision cannot be merged.")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def to_dict(self):
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["p"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
@@ -4,8 +4,8 @@
 import logging
 import datetime
 import re
-from spellchecker import SpellChecker
-from typing import Optional
+from backend.ai.symspell import get_spell_corrector
+from typing import List, Optional
 import os
 
 # Initialize logging (configure only once at the application startup)
@@ -20,8 +20,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize spell checker (can be a global instance)
-spell = SpellChecker()
+# Spell corrector (SymSpell index over English + TF-IDF vocabulary) is loaded on first use
 
 def log_query(user_id: int, query: str, response: str) -> None:
     """Logs chatbot interactions to a file."""
@@ -31,9 +30,19 @@ def correct_spelling(text: str) -> str:
     """Checks and corrects spelling in user input."""
     if not text:
         return ""
-    words = text.split()
-    corrected_words = [spell.correction(word) if spell.unknown([word]) else word for word in words]
-    return " ".join(corrected_words)
+    corrector = get_spell_corrector()
+    if corrector is None:
+        return text
+    return " ".join(corrector.correct(word) for word in text.split())
+
+def correct_spelling_batch(texts: List[str]) -> List[str]:
+    """Corrects spelling for many inputs, checking and correcting each distinct word only once."""
+    corrector = get_spell_corrector()
+    if corrector is None:
+        return [text or "" for text in texts]
+    split_texts = [text.split() if text else [] for text in texts]
+    corrections = {word: corrector.correct(word) for words in split_texts for word in words}
+    return [" ".join(corrections[word] for word in words) for words in split_texts]
 
 def clean_text(text: str) -> str:
     """Cleans and normalizes user input."""
@@ -0,0 +1,21 @@
+# The modules import each other as backend.<package>.<module> (the repository is checked out as
+# the "backend" package of the deployment); register the checkout under that name so the tests
+# run from a plain clone: python -m pytest tests
+
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# offline defaults: stub Gemini, local Q&A embeddings, no model version watcher
+os.environ.setdefault("GEMINI_BACKEND", "stub")
+os.environ.setdefault("QA_EMBEDDER", "local")
+os.environ.setdefault("MODEL_RELOAD_POLL_SECONDS", "0")
+
+if "backend" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("backend", os.path.join(ROOT, "__init__.py"),
+                                                  submodule_search_locations=[ROOT])
+    backend = importlib.util.module_from_spec(spec)
+    sys.modules["backend"] = backend
+    spec.loader.exec_module(backend)
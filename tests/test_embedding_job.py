@@ -0,0 +1,115 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from backend.ai.embedding_job import EmbeddingCache, EmbeddingError, EmbeddingJob, FakeEmbedder, run_embedding_job
+from backend.ai.qa_index import HashingEmbedder
+
+DIM = 64
+
+
+class FailingEmbedder(FakeEmbedder):
+    """Fails every call after the first `succeed` ones, like an embedding API going down mid-run."""
+
+    def __init__(self, succeed, **kwargs):
+        super().__init__(DIM, **kwargs)
+        self.succeed = succeed
+
+    def embed(self, texts):
+        if self.calls >= self.succeed:
+            self.calls += 1
+            raise EmbeddingError("embedding API unavailable")
+        return super().embed(texts)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "qa.csv"
+    pd.DataFrame({
+        "ID": range(50),
+        "Question": [f"SHA question number {i}" for i in range(50)],
+        "Answer": [f"answer {i}" for i in range(50)],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def make_job(dataset, tmp_path, embedder, cache):
+    return EmbeddingJob(dataset, embedder, cache, str(tmp_path / "work"), chunk_size=10, batch_size=5,
+                        max_concurrency=2, max_retries=0, backoff_base=0.0)
+
+
+def read_checkpoint(tmp_path):
+    with open(tmp_path / "work" / "checkpoint.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_job_embeds_every_row_in_order(dataset, tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    job = make_job(dataset, tmp_path, FakeEmbedder(DIM), cache)
+
+    stats = job.run()
+    vectors, records = job.load_output()
+
+    assert stats["rows"] == 50 and stats["embedded"] == 50
+    assert [record["ID"] for record in records] == list(range(50))
+    expected = HashingEmbedder(DIM).embed([record["Question"] for record in records])
+    assert np.allclose(vectors, expected)
+    assert read_checkpoint(tmp_path)["rows"] == 50
+    cache.close()
+
+
+def test_job_resumes_from_checkpoint_after_failure(dataset, tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    # two batches per chunk: the first two chunks succeed, the third fails
+    with pytest.raises(EmbeddingError):
+        make_job(dataset, tmp_path, FailingEmbedder(succeed=4), cache).run()
+    assert read_checkpoint(tmp_path)["rows"] == 20
+
+    # a crash after the checkpoint may leave a partial chunk behind; the resume drops it
+    with open(tmp_path / "work" / "vectors.f32", "ab") as f:
+        f.write(b"\0" * DIM * 4 * 3)
+    with open(tmp_path / "work" / "records.jsonl", "ab") as f:
+        f.write(b'{"ID": 999, "Question": "partial"')
+
+    embedder = FakeEmbedder(DIM)
+    job = make_job(dataset, tmp_path, embedder, cache)
+    stats = job.run()
+    vectors, records = job.load_output()
+
+    assert stats["rows"] == 50
+    # only the 30 rows after the checkpoint are embedded again
+    assert stats["embedded"] == 30 and stats["cache_hits"] == 0
+    assert [record["ID"] for record in records] == list(range(50))
+    assert np.allclose(vectors, HashingEmbedder(DIM).embed([record["Question"] for record in records]))
+    cache.close()
+
+
+def test_changed_csv_starts_over(dataset, tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    make_job(dataset, tmp_path, FakeEmbedder(DIM), cache).run()
+
+    frame = pd.read_csv(dataset)
+    frame.loc[len(frame)] = [50, "SHA question number 50", "answer 50"]
+    frame.to_csv(dataset, index=False)
+    os.utime(dataset, (0, 0))
+
+    embedder = FakeEmbedder(DIM)
+    stats = make_job(dataset, tmp_path, embedder, cache).run()
+
+    assert stats["rows"] == 51
+    # everything but the new row comes from the embedding cache
+    assert stats["cache_hits"] == 50 and stats["embedded"] == 1
+    cache.close()
+
+
+def test_run_embedding_job_writes_searchable_index(dataset, tmp_path):
+    index_path, mapping_path = str(tmp_path / "index.faiss"), str(tmp_path / "mapping.json")
+
+    stats = run_embedding_job(dataset, FakeEmbedder(DIM), kind="flat", index_path=index_path, mapping_path=mapping_path,
+                              cache_path=str(tmp_path / "cache.sqlite3"), work_dir=str(tmp_path / "work"), chunk_size=20)
+
+    assert stats["rows"] == 50
+    assert os.path.exists(index_path)
+    with open(mapping_path, "r", encoding="utf-8") as f:
+        assert len(json.load(f)) == 50
@@ -0,0 +1,248 @@
+import asyncio
+import time
+import httpx
+import pytest
+from backend.ai.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from backend.ai.gemini_client import (AsyncGeminiClient, CircuitOpenError, DeadlineExceededError, GeminiError,
+                                      HttpGeminiBackend, RequestRejectedError, StubGeminiBackend, TransientGeminiError)
+
+
+class ScriptedBackend:
+    """Plays one scripted (latency, error) step per call; the last step repeats."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps) or [(0.0, None)]
+        self.calls = 0
+
+    async def generate(self, prompt):
+        latency, error = self.steps[min(self.calls, len(self.steps) - 1)]
+        self.calls += 1
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return f"answer to {prompt}"
+
+    async def aclose(self):
+        pass
+
+
+def make_client(backend, **kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_max", 0.001)
+    return AsyncGeminiClient(backend, **kwargs)
+
+
+def test_transient_errors_are_retried():
+    backend = ScriptedBackend((0.0, TransientGeminiError("503")), (0.0, TransientGeminiError("429")), (0.0, None))
+    client = make_client(backend, max_retries=2)
+
+    assert asyncio.run(client.generate("q")) == "answer to q"
+    assert backend.calls == 3
+    assert client.stats()["retries"] == 2
+
+
+def test_retries_are_exhausted():
+    client = make_client(ScriptedBackend((0.0, TransientGeminiError("503"))), max_retries=2)
+
+    with pytest.raises(GeminiError, match="after 3 attempts"):
+        asyncio.run(client.generate("q"))
+    assert client.stats()["failures"] == 1
+
+
+def test_permanent_errors_are_not_retried():
+    backend = ScriptedBackend((0.0, GeminiError("HTTP 400")))
+    client = make_client(backend, max_retries=2)
+
+    with pytest.raises(GeminiError, match="HTTP 400"):
+        asyncio.run(client.generate("q"))
+    assert backend.calls == 1
+
+
+def test_attempt_timeout_is_retried():
+    backend = ScriptedBackend((1.0, None), (0.0, None))
+    client = make_client(backend, timeout=0.05, max_retries=1)
+
+    assert asyncio.run(client.generate("q")) == "answer to q"
+    assert backend.calls == 2
+
+
+def test_deadline_cuts_the_attempt_short():
+    client = make_client(ScriptedBackend((1.0, None)), timeout=5.0)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError) as raised:
+        asyncio.run(client.generate("q", deadline=time.monotonic() + 0.05))
+
+    assert time.monotonic() - start < 0.5
+    assert raised.value.attempts == 1 and raised.value.upstream_failures == 0
+    assert client.stats()["deadline_exceeded"] == 1
+
+
+def test_spent_deadline_makes_no_attempt():
+    backend = ScriptedBackend()
+    client = make_client(backend)
+
+    with pytest.raises(DeadlineExceededError) as raised:
+        asyncio.run(client.generate("q", deadline=time.monotonic() - 1))
+    assert raised.value.attempts == 0 and backend.calls == 0
+
+
+def test_slow_attempt_is_hedged():
+    # twenty fast calls set the hedge delay, then the primary attempt stalls and the hedge wins
+    backend = ScriptedBackend(*([(0.01, None)] * 20), (2.0, None), (0.01, None))
+    client = make_client(backend, hedge_percentile=95, hedge_min_samples=20, hedge_min_delay=0.02)
+
+    async def run():
+        for _ in range(20):
+            await client.generate("warm")
+        start = time.monotonic()
+        answer = await client.generate("q")
+        return answer, time.monotonic() - start
+
+    answer, elapsed = asyncio.run(run())
+
+    assert answer == "answer to q"
+    assert elapsed < 1.0
+    assert client.stats()["hedges"] == 1 and client.stats()["hedge_wins"] == 1
+
+
+def test_no_hedging_while_under_sampled():
+    client = make_client(ScriptedBackend((0.01, None)), hedge_percentile=95, hedge_min_samples=20)
+
+    asyncio.run(client.generate("q"))
+    assert client.hedge_delay() is None and client.stats()["hedges"] == 0
+
+
+def test_breaker_opens_probes_and_closes():
+    backend = ScriptedBackend((0.0, TransientGeminiError("503")), (0.0, TransientGeminiError("503")), (0.0, None))
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    client = make_client(backend, max_retries=0, breaker=breaker)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(GeminiError):
+                await client.generate("q")
+        assert breaker.state == OPEN
+        # rejected without calling Gemini
+        with pytest.raises(CircuitOpenError):
+            await client.generate("q")
+        assert backend.calls == 2
+        await asyncio.sleep(0.06)
+        # the half-open probe succeeds
+        assert await client.generate("q") == "answer to q"
+
+    asyncio.run(run())
+    assert breaker.state == CLOSED
+    assert breaker.stats()["transitions"] == {OPEN: 1, HALF_OPEN: 1, CLOSED: 1}
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    client = make_client(ScriptedBackend((0.0, TransientGeminiError("503"))), max_retries=0, breaker=breaker)
+
+    async def run():
+        with pytest.raises(GeminiError):
+            await client.generate("q")
+        await asyncio.sleep(0.06)
+        with pytest.raises(GeminiError):
+            await client.generate("q")
+
+    asyncio.run(run())
+    assert breaker.state == OPEN
+    assert breaker.stats()["transitions"][OPEN] == 2
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_spent_deadline_is_not_a_breaker_failure():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    client = make_client(ScriptedBackend((1.0, None)), breaker=breaker)
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(client.generate("q", deadline=time.monotonic() + 0.02))
+    assert breaker.state == CLOSED and breaker.consecutive_failures == 0
+
+
+def http_backend(status_code, body):
+    backend = HttpGeminiBackend(api_key="test-key")
+    backend._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(status_code, json=body)))
+    return backend
+
+
+ANSWER = {"candidates": [{"content": {"parts": [{"text": "Register at "}, {"text": "any Huduma centre."}]}}]}
+
+
+@pytest.mark.parametrize("status_code, body, error", [
+    (200, ANSWER, None),
+    (400, {"error": {"message": "Invalid argument"}}, RequestRejectedError),
+    (200, {"promptFeedback": {"blockReason": "SAFETY"}}, RequestRejectedError),
+    (200, {"candidates": [{"finishReason": "SAFETY"}]}, RequestRejectedError),
+    (401, {"error": {"message": "API key not valid"}}, GeminiError),
+    (503, {}, TransientGeminiError),
+])
+def test_http_backend_classifies_responses(status_code, body, error):
+    backend = http_backend(status_code, body)
+
+    async def run():
+        try:
+            return await backend.generate("q")
+        finally:
+            await backend.aclose()
+
+    if error is None:
+        assert asyncio.run(run()) == "Register at any Huduma centre."
+        return
+    with pytest.raises(error) as raised:
+        asyncio.run(run())
+    if error is GeminiError:
+        assert not isinstance(raised.value, (RequestRejectedError, TransientGeminiError))
+
+
+def test_rejected_requests_are_not_retried_or_breaker_failures():
+    backend = ScriptedBackend((0.0, RequestRejectedError("blocked prompt")))
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    client = make_client(backend, max_retries=2, breaker=breaker)
+
+    async def run():
+        for _ in range(5):
+            with pytest.raises(RequestRejectedError):
+                await client.generate("q")
+
+    asyncio.run(run())
+    assert backend.calls == 5
+    assert breaker.state == CLOSED and breaker.consecutive_failures == 0
+
+
+def test_auth_failures_open_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    client = make_client(ScriptedBackend((0.0, GeminiError("HTTP 403"))), max_retries=0, breaker=breaker)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(GeminiError):
+                await client.generate("q")
+
+    asyncio.run(run())
+    assert breaker.state == OPEN
+
+
+def test_stream_yields_chunks_and_respects_the_deadline():
+    backend = StubGeminiBackend(latency=0.0, chunk_latency=0.05, template="one two three four five six")
+    client = make_client(backend)
+
+    async def collect(deadline=None):
+        return [chunk async for chunk in client.stream("q", deadline=deadline)]
+
+    assert "".join(asyncio.run(collect())) == "one two three four five six"
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(collect(deadline=time.monotonic() + 0.12))
@@ -0,0 +1,64 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, Table, create_engine, insert, select
+from backend.app.latency import (BUCKETS, GROWTH, LATENCY_STAGES, MAX_MS, MIN_MS, UNKNOWN_PATH, bucket_expression,
+                                 bucket_of, bucket_upper, latency_counts, percentiles)
+
+
+@pytest.mark.parametrize("ms", [0.0, 0.05, MIN_MS, 0.1001, 1.0, 37.5, 1234.5, MAX_MS])
+def test_bucket_holds_its_duration(ms):
+    bucket = bucket_of(ms)
+    assert ms <= bucket_upper(bucket) * (1 + 1e-9)
+    if bucket:
+        assert ms > bucket_upper(bucket - 1) * (1 - 1e-9)
+
+
+def test_slow_durations_land_in_the_last_bucket():
+    assert bucket_of(MAX_MS * 10) == BUCKETS - 1
+
+
+def test_bucket_expression_matches_bucket_of():
+    engine = create_engine("sqlite://")
+    table = Table("durations", MetaData(), Column("id", Integer, primary_key=True), Column("ms", Float))
+    table.metadata.create_all(engine)
+    rng = random.Random(3)
+    durations = [0.0, MIN_MS, MAX_MS * 2] + [rng.lognormvariate(3, 2) for _ in range(300)]
+    with engine.begin() as conn:
+        conn.execute(insert(table), [{"ms": ms} for ms in durations])
+        rows = conn.execute(select(table.c.ms, bucket_expression(table.c.ms))).all()
+
+    assert [bucket for _, bucket in rows] == [bucket_of(ms) for ms, _ in rows]
+
+
+def test_percentiles_are_within_one_bucket_of_exact():
+    rng = random.Random(11)
+    samples = sorted(rng.lognormvariate(4, 1) for _ in range(20000))
+    summary = percentiles(Counter(bucket_of(ms) for ms in samples))
+
+    assert summary["samples"] == len(samples)
+    for quantile in (50, 90, 99):
+        exact = samples[int(quantile / 100 * len(samples)) - 1]
+        assert summary[f"p{quantile}_ms"] == pytest.approx(exact, rel=GROWTH - 1)
+
+
+def test_percentiles_without_samples():
+    assert percentiles(Counter()) == {"samples": 0, "p50_ms": None, "p90_ms": None, "p99_ms": None}
+
+
+def test_latency_counts_skip_missing_stages():
+    measured = {f"{stage}_ms": None for stage in LATENCY_STAGES}
+    rows = [
+        SimpleNamespace(answer_path="gemini", **dict(measured, gemini_ms=850.0, total_ms=900.0)),
+        SimpleNamespace(answer_path=None, **dict(measured, retrieval_ms=2.0, total_ms=3.0)),
+    ]
+
+    counts = latency_counts(rows)
+
+    assert counts == Counter({
+        (None, "gemini", "gemini", bucket_of(850.0)): 1,
+        (None, "total", "gemini", bucket_of(900.0)): 1,
+        (None, "retrieval", UNKNOWN_PATH, bucket_of(2.0)): 1,
+        (None, "total", UNKNOWN_PATH, bucket_of(3.0)): 1,
+    })
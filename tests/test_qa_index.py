@@ -0,0 +1,139 @@
+import asyncio
+import time
+import faiss
+import numpy as np
+import pytest
+from backend.ai.qa_index import GoogleEmbedder, HashingEmbedder, QaIndex, build_index, ensure_unit_norm, normalize_rows, set_search_params
+
+QUESTIONS = [
+    "How do I register for SHA?",
+    "What are the monthly SHA contribution rates?",
+    "Which hospitals accept SHA cover?",
+    "How do I update my SHA details?",
+    "Does SHA cover outpatient services?",
+    "How can I check my SHA contribution statement?",
+    "What documents do I need to register a dependant?",
+    "How are SHA claims paid to facilities?",
+]
+
+
+def make_records(questions):
+    return [{"ID": i, "Question": question, "Answer": f"answer {i}"} for i, question in enumerate(questions)]
+
+
+@pytest.fixture(scope="module")
+def embedder():
+    return HashingEmbedder(dim=128)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    # enough questions to train IVF lists (FAISS wants about 39 points per list)
+    return QUESTIONS + [f"{question} (variant {n})" for n in range(60) for question in QUESTIONS[:2]]
+
+
+def test_normalize_rows_unit_length_and_zero_rows():
+    vectors = normalize_rows([[3.0, 4.0], [0.0, 0.0]])
+    assert vectors.dtype == np.float32
+    assert np.allclose(vectors, [[0.6, 0.8], [0.0, 0.0]])
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf", "hnsw"])
+def test_build_and_search_finds_exact_question(kind, embedder, corpus):
+    index = build_index(embedder.embed(corpus), kind=kind)
+    set_search_params(index, nprobe=8, ef_search=64)
+    qa_index = QaIndex(index, make_records(corpus), embedder, min_similarity=0.9)
+
+    results = qa_index.search(QUESTIONS, k=3)
+
+    for position, matches in enumerate(results):
+        record, similarity = matches[0]
+        assert record["ID"] == position
+        assert similarity == pytest.approx(1.0, abs=1e-4)
+        assert [match[1] for match in matches] == sorted((match[1] for match in matches), reverse=True)
+    assert qa_index.answers(QUESTIONS[:2]) == ["answer 0", "answer 1"]
+    assert qa_index.stats()["hits"] == 2
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_similarity_is_cosine_for_unnormalized_vectors(kind, embedder):
+    vectors = embedder.embed(QUESTIONS) * np.arange(1, len(QUESTIONS) + 1, dtype=np.float32)[:, None]
+    qa_index = QaIndex(build_index(vectors, kind=kind), make_records(QUESTIONS), embedder)
+
+    query = "How do I register for the SHA scheme?"
+    cosines = normalize_rows(vectors) @ normalize_rows(embedder.embed([query]))[0]
+    matches = qa_index.search([query], k=len(QUESTIONS))[0]
+
+    for record, similarity in matches:
+        assert similarity == pytest.approx(cosines[record["ID"]], abs=1e-4)
+
+
+def test_unrelated_query_is_not_answered(embedder):
+    qa_index = QaIndex(build_index(embedder.embed(QUESTIONS)), make_records(QUESTIONS), embedder, min_similarity=0.85)
+    assert qa_index.answer("zzzz qqqq xxxx") is None
+
+
+def test_ensure_unit_norm_rebuilds_legacy_flat_index(embedder):
+    legacy = faiss.IndexFlatL2(embedder.dim)
+    legacy.add(embedder.embed(QUESTIONS) * 5.0)
+
+    index = ensure_unit_norm(legacy)
+
+    assert index is not legacy
+    assert np.allclose(np.linalg.norm(index.reconstruct_n(0, index.ntotal), axis=1), 1.0, atol=1e-5)
+    normalized = build_index(embedder.embed(QUESTIONS))
+    assert ensure_unit_norm(normalized) is normalized
+
+
+def test_mismatched_mapping_is_rejected(embedder):
+    with pytest.raises(ValueError):
+        QaIndex(build_index(embedder.embed(QUESTIONS)), make_records(QUESTIONS[:-1]), embedder)
+
+
+class SlowQaIndex:
+    """Q&A index whose query embedding stalls, like a slow embedding API."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def answer(self, text):
+        time.sleep(self.latency)
+        return f"answer to {text}"
+
+    def answers(self, texts):
+        time.sleep(self.latency)
+        return [f"answer to {text}" for text in texts]
+
+
+@pytest.mark.parametrize("latency, budget, expected", [(0.0, 1.0, "answer to q"), (0.5, 0.05, None), (0.0, -1.0, None)])
+def test_qa_lookup_is_a_miss_past_the_deadline(monkeypatch, latency, budget, expected):
+    from backend.ai import hybrid_model
+
+    monkeypatch.setattr(hybrid_model, "get_qa_index", lambda: SlowQaIndex(latency))
+
+    async def lookup():
+        start = time.monotonic()
+        answer = await hybrid_model.async_lookup_qa("q", deadline=hybrid_model.chat_deadline(budget))
+        return answer, time.monotonic() - start
+
+    # timed inside the loop: asyncio.run joins the abandoned worker thread on exit
+    answer, elapsed = asyncio.run(lookup())
+    assert answer == expected
+    assert elapsed < 0.3
+
+
+def test_google_embedder_passes_a_request_timeout():
+    pytest.importorskip("google.generativeai")
+    calls = []
+
+    class FakeGenai:
+        @staticmethod
+        def embed_content(**kwargs):
+            calls.append(kwargs)
+            return {"embedding": [[3.0, 4.0]]}
+
+    embedder = GoogleEmbedder(dim=2, timeout=2.5)
+    embedder._genai = FakeGenai
+
+    assert np.allclose(embedder.embed(["q"]), [[0.6, 0.8]])
+    assert calls[0]["request_options"] == {"timeout": 2.5}
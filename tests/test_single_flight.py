@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from backend.ai.single_flight import SingleFlight
+
+
+class Upstream:
+    def __init__(self, latency=0.05, error=None):
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+        self.completed = 0
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        self.completed += 1
+        return f"result {call}"
+
+
+def test_concurrent_calls_are_coalesced():
+    flights, upstream = SingleFlight(), Upstream()
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", upstream) for _ in range(50)))
+
+    results = asyncio.run(run())
+
+    assert results == ["result 1"] * 50
+    assert upstream.calls == 1
+    stats = flights.stats()
+    assert stats["upstream_calls"] == 1 and stats["coalesced"] == 49 and stats["in_flight"] == 0
+
+
+def test_distinct_keys_are_not_coalesced():
+    flights, upstream = SingleFlight(), Upstream()
+
+    async def run():
+        return await asyncio.gather(flights.do("a", upstream), flights.do("b", upstream))
+
+    assert sorted(asyncio.run(run())) == ["result 1", "result 2"]
+    assert upstream.calls == 2
+
+
+def test_nothing_is_kept_after_the_call():
+    flights, upstream = SingleFlight(), Upstream(latency=0.0)
+
+    async def run():
+        first = await flights.do("key", upstream)
+        second = await flights.do("key", upstream)
+        return first, second
+
+    assert asyncio.run(run()) == ("result 1", "result 2")
+
+
+def test_errors_are_shared_but_not_kept():
+    flights, upstream = SingleFlight(), Upstream(error=RuntimeError("upstream down"))
+
+    async def run():
+        results = await asyncio.gather(*(flights.do("key", upstream) for _ in range(5)), return_exceptions=True)
+        upstream.error = None
+        return results, await flights.do("key", upstream)
+
+    results, retried = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert upstream.calls == 2 and retried == "result 2"
+    assert flights.stats()["errors"] == 1
+
+
+def test_waiter_timeout_leaves_the_call_running():
+    flights, upstream = SingleFlight(), Upstream(latency=0.1)
+
+    async def run():
+        impatient = flights.do("key", upstream, timeout=0.01)
+        patient = flights.do("key", upstream)
+        return await asyncio.gather(impatient, patient, return_exceptions=True)
+
+    impatient, patient = asyncio.run(run())
+
+    assert isinstance(impatient, asyncio.TimeoutError)
+    assert patient == "result 1" and upstream.completed == 1
+    assert flights.stats()["waiter_timeouts"] == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_call():
+    flights, upstream = SingleFlight(), Upstream(latency=0.1)
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("key", upstream))
+        follower = asyncio.ensure_future(flights.do("key", upstream))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "result 1"
+    assert upstream.calls == 1 and upstream.completed == 1
+
+
+def test_flights_of_a_closed_loop_are_ignored():
+    flights, upstream = SingleFlight(), Upstream(latency=10.0)
+
+    async def abandon():
+        asyncio.ensure_future(flights.do("key", upstream))
+        await asyncio.sleep(0.01)
+
+    asyncio.run(abandon())
+    upstream.latency = 0.0
+
+    async def run():
+        assert not flights.in_flight("key")
+        return await flights.do("key", upstream)
+
+    assert asyncio.run(run()) == "result 2"
@@ -0,0 +1,87 @@
+import json
+import random
+from collections import Counter
+import pytest
+from backend.app.sketches import CountMinSketch, HyperLogLog, SpaceSaving
+
+
+@pytest.fixture(scope="module")
+def stream():
+    # Zipf-like question frequencies, as in real traffic
+    rng = random.Random(7)
+    vocabulary = 5000
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(vocabulary)]
+    return [f"question {i}" for i in rng.choices(range(vocabulary), weights=weights, k=40000)]
+
+
+def build(items, summary):
+    for item in items:
+        summary.add(item)
+    return summary
+
+
+def check_space_saving(summary, truth):
+    bound = summary.error_bound()
+    reported = {item: (count, error) for item, _, count, error in summary.top(summary.k)}
+    for item, (count, error) in reported.items():
+        assert truth[item] <= count <= truth[item] + error
+        assert error <= bound
+    # every item more frequent than N/k is reported
+    assert all(item in reported for item, frequency in truth.items() if frequency > bound)
+
+
+def test_space_saving_error_bounds(stream):
+    check_space_saving(build(stream, SpaceSaving(100)), Counter(stream))
+
+
+def test_merged_space_saving_keeps_the_bounds(stream):
+    parts = [build(stream[i::4], SpaceSaving(100)) for i in range(4)]
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+
+    assert merged.total == len(stream)
+    check_space_saving(merged, Counter(stream))
+
+
+def test_count_min_never_underestimates_and_rarely_exceeds_the_bound(stream):
+    sketch = build(stream, CountMinSketch(width=512, depth=5))
+    truth = Counter(stream)
+
+    overcounts = [sketch.estimate(item) - frequency for item, frequency in truth.items()]
+
+    assert min(overcounts) >= 0
+    exceeded = sum(overcount > sketch.error_bound() for overcount in overcounts)
+    # each item exceeds it with probability at most e^-depth (0.7%)
+    assert exceeded / len(overcounts) <= 3 * sketch.failure_probability()
+
+
+def test_count_min_merge_equals_one_sketch(stream):
+    merged = build(stream[::2], CountMinSketch(256, 4)).merge(build(stream[1::2], CountMinSketch(256, 4)))
+    assert merged.rows == build(stream, CountMinSketch(256, 4)).rows
+    with pytest.raises(ValueError):
+        merged.merge(CountMinSketch(128, 4))
+
+
+@pytest.mark.parametrize("distinct", [100, 5000, 50000])
+def test_hyperloglog_relative_error(distinct):
+    sketch = build((f"visitor {i}" for i in range(distinct)), HyperLogLog(p=12))
+    # 4 standard errors: a failure here is a bug, not bad luck
+    assert abs(sketch.count() / distinct - 1) <= 4 * sketch.relative_error()
+
+
+def test_hyperloglog_merge_counts_the_union():
+    left = build((f"visitor {i}" for i in range(0, 6000)), HyperLogLog(p=10))
+    right = build((f"visitor {i}" for i in range(4000, 10000)), HyperLogLog(p=10))
+    union = build((f"visitor {i}" for i in range(10000)), HyperLogLog(p=10))
+
+    assert left.merge(right).registers == union.registers
+    with pytest.raises(ValueError):
+        left.merge(HyperLogLog(p=12))
+
+
+def test_sketches_survive_a_json_round_trip(stream):
+    for summary in (build(stream[:2000], SpaceSaving(50)), build(stream[:2000], CountMinSketch(64, 3)),
+                    build(stream[:2000], HyperLogLog(p=8))):
+        restored = type(summary).from_dict(json.loads(json.dumps(summary.to_dict())))
+        assert restored.to_dict() == summary.to_dict()
@@ -0,0 +1,55 @@
+import pytest
+from backend.ai.symspell import SymSpell, osa_distance
+from backend.app import utils
+
+FREQUENCIES = {"how": 500, "do": 800, "i": 900, "register": 50, "for": 700, "sha": 40, "health": 60, "cover": 30}
+
+
+@pytest.fixture(scope="module")
+def corrector():
+    return SymSpell.build(FREQUENCIES)
+
+
+@pytest.fixture
+def spell_corrector(monkeypatch, corrector):
+    monkeypatch.setattr(utils, "get_spell_corrector", lambda: corrector)
+    return corrector
+
+
+def test_osa_distance_counts_transpositions():
+    assert osa_distance("helth", "health", 2) == 1
+    assert osa_distance("hte", "the", 2) == 1
+    assert osa_distance("abc", "xyz", 2) > 2
+
+
+@pytest.mark.parametrize("word, expected", [
+    ("regster", "register"),
+    ("helth", "health"),
+    ("Register", "Register"),
+    ("sha", "sha"),
+    ("2024", "2024"),
+    ("xqzvwk", "xqzvwk"),
+])
+def test_correct(corrector, word, expected):
+    assert corrector.correct(word) == expected
+
+
+@pytest.mark.parametrize("word, expected", [
+    ("regster?", "register?"),
+    ("helth,", "health,"),
+    ("(regster)", "(register)"),
+    ("sha?", "sha?"),
+    ("covr...", "cover..."),
+])
+def test_correct_keeps_surrounding_punctuation(corrector, word, expected):
+    assert corrector.correct(word) == expected
+
+
+def test_correct_spelling_with_trailing_punctuation(spell_corrector):
+    assert utils.correct_spelling("How do I regster?") == "How do I register?"
+    assert utils.correct_spelling("helth, cover") == "health, cover"
+
+
+def test_correct_spelling_batch_with_trailing_punctuation(spell_corrector):
+    assert utils.correct_spelling_batch(["How do I regster?", "helth, for sha", ""]) == [
+        "How do I register?", "health, for sha", ""]